@@ -1,25 +1,183 @@
+import asyncio
 import base64
+import json
+import logging
+import os
+import threading
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import TYPE_CHECKING
 
-from csv import DictWriter
-import os.path as os_path
-
-from plotly.graph_objects import Figure
 import gradio as gr
-from pandas import read_csv, DataFrame
+import numpy as np
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from gradio.components.plot import PlotData
+from pandas import DataFrame, Series, read_csv, read_parquet, to_numeric
 import emission_calculator.calculator as ec
+import emission_calculator.scenarios as scenarios
+from emission_calculator.factors import (
+    FACTOR_SET,
+    FactorSet,
+    current_factors,
+    factor_sets,
+    get_factors,
+)
+from emission_calculator.validation import (
+    REQUIRED_COLUMNS,
+    validate_frame,
+    validate_records,
+)
+from history.backends import HistoryBackend, get_backend
+from history.store import FOOTPRINT
+from instrumentation import prometheus_text, start_trace
+from reporting.cache import ReportCache, get_cache, report_key
+from reporting.export_pool import (
+    ExportBusyError,
+    ExportFailedError,
+    ExportTimeoutError,
+    get_pool,
+)
+from reporting.render import (
+    RenderedReport,
+    render_report,
+    export_png,
+    export_pdf,
+    format_timings,
+)
+from scoring_api import create_scoring_api
+
+if TYPE_CHECKING:
+    from plotly.graph_objects import Figure
+
+logger = logging.getLogger(__name__)
 
 DATA_PATH = "./reports/historic_data.csv"
 
+# concurrent requests per event; figures are built on RENDER_WORKERS threads and
+# exported by the export pool, so awaiting sessions do not hold a worker
+COMPUTE_CONCURRENCY = int(os.environ.get("COMPUTE_CONCURRENCY", 64))
+DEFAULT_CONCURRENCY = int(os.environ.get("DEFAULT_CONCURRENCY", 4))
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", 4))
+# "png" embeds a rendered image, "plot" sends the figure for the browser to draw
+REPORT_MODE = os.environ.get("REPORT_MODE", "png")
+# seconds an idle connection is kept open for the next request
+KEEP_ALIVE_TIMEOUT = int(os.environ.get("KEEP_ALIVE_TIMEOUT", 30))
+render_executor = ThreadPoolExecutor(
+    max_workers=RENDER_WORKERS, thread_name_prefix="render"
+)
+
+# opened on first use, a backend may import the CSV history when it is created
+history_backend: HistoryBackend | None = None
+_history_backend_lock = threading.Lock()
+
+
+def get_history_backend() -> HistoryBackend:
+    global history_backend
+    with _history_backend_lock:
+        if history_backend is None:
+            history_backend = get_backend(DATA_PATH)
+    return history_backend
+
+
+def append_history(rows: list[dict]) -> None:
+    get_history_backend().append(rows)
+
+
+# History tab choice of the emissions as they were scored when submitted
+AS_SUBMITTED = "As submitted"
+
+
+def history_factors(factor_set: str | None) -> FactorSet | None:
+    """
+    Returns:
+        the factor set picked in the History tab, None for the stored emissions
+    """
+    if not factor_set or factor_set == AS_SUBMITTED:
+        return None
+    try:
+        return get_factors(factor_set)
+    except KeyError as e:
+        raise gr.Error(e.args[0])
+
+
+def compute_history(factor_set: str | None = None) -> "Figure":
+    # drawn from aggregates updated with the new rows only, never the whole history.
+    # Each factor set keeps its own, so switching back to one is instant.
+    factors = history_factors(factor_set)
+    with start_trace("compute_history") as trace:
+        return trace.traced("history_figure", get_history_backend().rollup_figure)(
+            ec.draw_rollup_figure, factors
+        )
+
+
+def history_summary(factor_set: str | None = None) -> str:
+    """
+    Returns:
+        the totals of the history as Markdown, from its precomputed aggregates
+    """
+    factors = history_factors(factor_set)
+    summary = get_history_backend().summary(factors)
+    footprint = summary[FOOTPRINT]
+    text = (
+        f"**{summary['count']:,}** submissions from **{summary['companies']:,}** "
+        f"companies, **{footprint['total']:,.0f}** kgCO2 in total, "
+        f"**{footprint['mean']:,.0f}** kgCO2 on average "
+        f"(median {footprint['median']:,.0f}, max {footprint['max']:,.0f})"
+    )
+    if factors is not None:
+        text += (
+            f". Scored again with the **{factors.id}** factors, submissions saved "
+            "without their inputs keep their stored emissions."
+        )
+    return text
+
+
+def load_history(factor_set: str | None = None) -> tuple["Figure", str]:
+    """
+    Returns:
+        the historic figure and the summary replacing the loading placeholder
+    """
+    return compute_history(factor_set), history_summary(factor_set)
+
 
-def compute_history() -> Figure:
-    if not os_path.exists(DATA_PATH):
-        f = open(DATA_PATH, "xt")
-        f.write("Name,Energy Usage,Waste Generated,Business Travel")
-        f.close()
-        df = DataFrame.from_dict({})
+def company_history(company_name: str) -> tuple["Figure", DataFrame]:
+    """
+    Look up the submissions of one company, read through the name index
+    Returns:
+        the trend of its emissions and its rows
+    """
+    company_name = (company_name or "").strip()
+    if not company_name:
+        raise gr.Error("Company name cannot be empty or just whitespace!")
+    try:
+        rows = get_history_backend().lookup(company_name)
+    except Exception:
+        logger.exception("Error looking up %s", company_name)
+        raise gr.Error(f"Cannot read the history of {company_name}.")
+    if rows.empty:
+        raise gr.Error(f"No submissions from {company_name}.")
+    # titled with the most recent spelling of the name
+    name = " ".join(str(rows["Name"].iloc[-1]).split())
+    return ec.draw_company_trend(rows, name), rows
+
+
+def warm_up() -> None:
+    """
+    Prepare what the first requests need once the server is starting: plotly,
+    the report template, the export pool and the history figure
+    """
+    start = perf_counter()
+    try:
+        ec.report_template()
+        get_pool()
+        compute_history()
+    except Exception as e:
+        logger.warning("Warm up failed: %s", e)
     else:
-        df = read_csv(DATA_PATH)
-    return ec.draw_historic_figure(df)
+        logger.info("Warmed up in %.2fs", perf_counter() - start)
 
 
 def validate_input(
@@ -33,66 +191,64 @@ def validate_input(
     fuel_efficiency: float,
 ) -> None:
     """
-    Comprehensive validation for input parameters with non-zero requirements
+    Comprehensive validation for input parameters with non-zero requirements,
+    the rules the bulk upload and the scoring API apply to every company
     """
-    # Company Name Validation
-    if not company_name or company_name.isspace():
-        raise gr.Error("Company name cannot be empty or just whitespace!")
-
-    if len(company_name) > 100:
-        raise gr.Error("Company name is too long (maximum 100 characters)!")
-
-    # Non-Zero Input Validation
-    non_zero_fields = [
-        ("Electricity Bill", avg_electric_bill),
-        ("Gas Bill", avg_gas_bill),
-        ("Transport Cost", avg_transport_cost),
-        ("Monthly Waste", monthly_waste_generated),
-        ("Annual Travel Distance", annual_travel_kms),
-        ("Fuel Efficiency", fuel_efficiency),
-    ]
-
-    for name, value in non_zero_fields:
-        try:
-            float_val = float(value)
-        except (TypeError, ValueError):
-            raise gr.Error(f"{name} must be a valid number!")
-
-        if float_val <= 0:
-            raise gr.Error(f"{name} must be a positive number greater than zero!")
-
-        # Additional realistic range checks
-        if name == "Electricity Bill" and float_val > 10000:
-            raise gr.Error(
-                "Electricity bill seems unrealistically high. Please check the amount!"
-            )
-
-        if name == "Monthly Waste" and float_val > 1000:
-            raise gr.Error(
-                "Monthly waste generation seems extremely high. Please verify!"
-            )
-        
-        if name == "Fuel Efficiency" :
-            if float_val < 5:
-                raise gr.Error(
-                    "Fuel efficiency seems unrealistically low. Please verify!"
-                )
-            if float_val > 15:
-                raise gr.Error(
-                    "Fuel efficiency is very high. Please verify!"
+    _, _, errors = validate_records(
+        [
+            dict(
+                zip(
+                    ["company_name", *ec.INPUT_COLUMNS],
+                    [
+                        company_name,
+                        avg_electric_bill,
+                        avg_gas_bill,
+                        avg_transport_cost,
+                        monthly_waste_generated,
+                        recycled_waste_percent,
+                        annual_travel_kms,
+                        fuel_efficiency,
+                    ],
                 )
+            )
+        ]
+    )
+    if errors[0]:
+        raise gr.Error(errors[0])
 
-    # Percentage-specific validation
-    try:
-        recycled_percent = float(recycled_waste_percent)
-    except (TypeError, ValueError):
-        raise gr.Error("Recycled waste percentage must be a valid number!")
-
-    if recycled_percent < 0 or recycled_percent > 100:
-        raise gr.Error("Recycled waste percentage must be between 1 and 100!")
 
+def render_company_report(
+    key: str,
+    company_name: str,
+    df: DataFrame,
+    row: dict,
+    png: bool = True,
+    cache: ReportCache | None = None,
+) -> RenderedReport:
+    """
+    Draw and render the report of one company, caching it with its history row
+    in `cache`, the app's by default.
+    The PNG is only exported when `png` is True.
+    """
+    start = perf_counter()
+    plot = ec.draw_report_figure(df, threshold=ec.REPORT_THRESHOLD)
+    figure_time = perf_counter() - start
 
-def compute(
+    # serialize the plot once, export the PNG now and the PDF only on download
+    cache = cache or get_cache()
+    try:
+        report = render_report(
+            plot, pdf_path=cache.pdf_path(key, company_name), png=png
+        )
+    except (ExportBusyError, ExportFailedError, ExportTimeoutError) as e:
+        raise gr.Error(str(e))
+    report.timings = {"figure": figure_time, **report.timings}
+    cache.put(key, report, row)
+    logger.debug("Rendered report for %s: %s", company_name, format_timings(report))
+    return report
+
+
+async def compute(
     company_name: str,
     avg_electric_bill: float,
     avg_gas_bill: float,
@@ -101,77 +257,410 @@ def compute(
     recycled_waste_percent: float,
     annual_travel_kms: float,
     fuel_efficiency: float,
-) -> tuple[str, gr.Button]:
+) -> AsyncIterator[tuple[str, PlotData | None, gr.Button, RenderedReport | None]]:
     """
-    Compute carbon footprint with comprehensive input validation
-    Returns:
+    Compute carbon footprint with comprehensive input validation,
+    streaming the numbers first, then the chart, then the report download
+    Yields:
         result (tuple)
-        of summary HTML (str)
-        and download_report button (Button)
+        of summary HTML (str),
+        interactive report (PlotData) when REPORT_MODE is "plot",
+        download_report button (Button)
+        and the rendered report (RenderedReport) kept for the PDF download
     """
-    # Validate inputs first
-    validate_input(
-        company_name,
-        avg_electric_bill,
-        avg_gas_bill,
-        avg_transport_cost,
-        monthly_waste_generated,
-        recycled_waste_percent,
-        annual_travel_kms,
-        fuel_efficiency,
-    )
+    with start_trace("compute") as trace:
+        # Validate inputs first
+        with trace.span("validate"):
+            validate_input(
+                company_name,
+                avg_electric_bill,
+                avg_gas_bill,
+                avg_transport_cost,
+                monthly_waste_generated,
+                recycled_waste_percent,
+                annual_travel_kms,
+                fuel_efficiency,
+            )
 
-    # Proceed with calculation if validation passes
-    df = ec.make_dataframe(
-        company_name=company_name,
-        avg_electric_bill=avg_electric_bill,
-        avg_gas_bill=avg_gas_bill,
-        avg_transport_bill=avg_transport_cost,
-        monthly_waste_generated=monthly_waste_generated,
-        recycled_waste_percent=recycled_waste_percent,
-        annual_travel_kms=annual_travel_kms,
-        fuel_efficiency=fuel_efficiency,
-    )
+        # kept with the history row, so it can be scored again under other factors
+        inputs = dict(
+            zip(
+                ec.INPUT_COLUMNS,
+                [
+                    avg_electric_bill,
+                    avg_gas_bill,
+                    avg_transport_cost,
+                    monthly_waste_generated,
+                    recycled_waste_percent,
+                    annual_travel_kms,
+                    fuel_efficiency,
+                ],
+            )
+        )
+        factors = current_factors()
+
+        # identical submissions reuse the cached report and history row
+        cache = get_cache()
+        with trace.span("cache"):
+            key = report_key(
+                company_name,
+                list(inputs.values()),
+                threshold=ec.REPORT_THRESHOLD,
+                factors=factors.id,
+            )
+            cached = cache.get(key)
+
+        if cached is not None:
+            report, df_dump = cached
+            # the key ignores case and whitespace, record the name as submitted
+            df_dump = {**df_dump, "Name": company_name}
+        else:
+            # Proceed with calculation if validation passes
+            with trace.span("calculate"):
+                df = ec.make_dataframe(
+                    company_name=company_name,
+                    avg_electric_bill=avg_electric_bill,
+                    avg_gas_bill=avg_gas_bill,
+                    avg_transport_bill=avg_transport_cost,
+                    monthly_waste_generated=monthly_waste_generated,
+                    recycled_waste_percent=recycled_waste_percent,
+                    annual_travel_kms=annual_travel_kms,
+                    fuel_efficiency=fuel_efficiency,
+                    factors=factors,
+                )
+                df_dump = {
+                    **ec.dataframe_to_dict(df=df),
+                    **inputs,
+                    FACTOR_SET: factors.id,
+                }
+
+        def summary(img_data: str | None = None, rendering: bool = True) -> str:
+            return summary_html(
+                company_name,
+                df_dump,
+                avg_electric_bill + avg_gas_bill,
+                annual_travel_kms,
+                monthly_waste_generated,
+                recycled_waste_percent,
+                img_data,
+                rendering,
+            )
 
-    try:
-        df_dump = ec.dataframe_to_dict(df=df)
-        with open(DATA_PATH, mode="a") as f:
-            w = DictWriter(f, fieldnames=df_dump.keys())
-            if not os_path.exists(DATA_PATH):
-                w.writeheader()
-            w.writerow(df_dump)
-            print("Saving is successful")
-    except Exception as e:
-        print(e)
+        # interactive plots are drawn by the browser, only the PDF is rasterized
+        interactive = REPORT_MODE == "plot"
+        hidden_button = gr.Button(visible=False)
+        yield summary(), None, hidden_button, None
 
-    plot = ec.draw_report_figure(df)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                None, trace.traced("history_append", append_history), [df_dump]
+            )
+            logger.debug("Saved the submission of %s", company_name)
+        except Exception:
+            logger.exception("Could not save the submission of %s", company_name)
+
+        if cached is None:
+            report = await loop.run_in_executor(
+                render_executor,
+                trace.traced("render", render_company_report),
+                key,
+                company_name,
+                df,
+                df_dump,
+                not interactive,
+            )
+            for stage, seconds in report.timings.items():
+                trace.record(stage, seconds)
+        elif not interactive and report.png is None:
+            # cached from a report that was never shown as an image
+            try:
+                await loop.run_in_executor(
+                    render_executor, trace.traced("png", export_png), report
+                )
+            except (ExportBusyError, ExportFailedError, ExportTimeoutError) as e:
+                raise gr.Error(str(e))
+            cache.put(key, report, df_dump)
+        logger.debug("Report cache: %s", cache.stats())
+
+        if interactive:
+            img_data, plot = None, report_plot(report)
+        else:
+            # Convert plot to base64 image
+            img_data, plot = base64.b64encode(report.png).decode("utf-8"), None
+        yield summary(img_data, rendering=False), plot, hidden_button, report
 
-    # Convert plot to base64 image
-    img_data = base64.b64encode(
-        plot.to_image(width=1400, height=800, format="png")
-    ).decode("utf-8")
+        download_button = gr.Button(
+            "Download Report", variant="secondary", visible=True
+        )
+        yield summary(img_data, rendering=False), plot, download_button, report
+
+
+def report_plot(report: RenderedReport) -> PlotData:
+    """
+    The serialized report figure as compact Plotly JSON for a gr.Plot
+    """
+    return PlotData(
+        type="plotly", plot=json.dumps(report.figure, separators=(",", ":"))
+    )
 
-    # convert plot to pdf for downloading report
-    file_path = f"./reports/{company_name.lower().replace(' ', '_')[:10]}_report.pdf"
-    plot.write_image(file_path, width=1400, height=800)
+
+def summary_html(
+    company_name: str,
+    row: dict,
+    energy_cost: float,
+    annual_travel_kms: float,
+    monthly_waste_generated: float,
+    recycled_waste_percent: float,
+    img_data: str | None = None,
+    rendering: bool = True,
+) -> str:
+    """
+    Summary of one company's footprint, with the report image once it is rendered
+    """
+    total = sum(row[category] for category in ec.CATEGORIES)
+    image = ""
+    if img_data is not None:
+        image = f'<img src="data:image/png;base64,{img_data}" style="max-width: 100%; height: auto;" alt="Carbon Footprint Report"/>'
+    elif rendering:
+        image = '<p style="color: #666;">⏳ Rendering the report...</p>'
 
     # Generate a summary HTML with embedded image
-    summary = f"""
+    return f"""
     <div style="max-width: 1400px; margin: 0 auto; font-family: Arial, sans-serif;">
         <h3 style="color: #ffffff;"> Carbon Footprint Summary for {company_name} </h3>
         <ul style="color: #666;">
-            <li>🏭 <strong>Total Carbon Impact</strong>: Calculated based on your inputs</li>
-            <li>💡 <strong>Energy Consumption</strong>: €{avg_electric_bill + avg_gas_bill:.2f}</li>
+            <li>🏭 <strong>Total Carbon Impact</strong>: {total:,.2f} kgCO2 (Energy {row["Energy Usage"]:,.2f}, Waste {row["Waste Generated"]:,.2f}, Travel {row["Business Travel"]:,.2f})</li>
+            <li>💡 <strong>Energy Consumption</strong>: €{energy_cost:.2f}</li>
             <li>🚗 <strong>Transportation Emissions</strong>: {annual_travel_kms} km</li>
             <li>🗑️ <strong>Waste Management</strong>: {monthly_waste_generated} kg (Recycled: {recycled_waste_percent}%)</li>
         </ul>
-        <img src="data:image/png;base64,{img_data}" style="max-width: 100%; height: auto;" alt="Carbon Footprint Report"/>
+        {image}
     </div>
     """
-    download_button = gr.DownloadButton(
-        "Download Report", variant="secondary", visible=True, value=file_path
+
+
+async def download_report(report: RenderedReport | None) -> gr.File:
+    """
+    Export the PDF for the last generated report
+    Returns:
+        report_file (File) pointing at the PDF
+    """
+    if report is None:
+        raise gr.Error("Generate a report first!")
+
+    loop = asyncio.get_running_loop()
+    with start_trace("download_report") as trace:
+        try:
+            file_path = await loop.run_in_executor(
+                render_executor, trace.traced("pdf", export_pdf), report
+            )
+        except (ExportBusyError, ExportFailedError, ExportTimeoutError) as e:
+            raise gr.Error(str(e))
+    get_cache().track_pdf(file_path)
+    logger.debug("Exported report PDF: %s", format_timings(report))
+    return gr.File(value=file_path, visible=True)
+
+
+def read_upload(file_path: str) -> DataFrame:
+    if file_path.lower().endswith(".parquet"):
+        return read_parquet(file_path)
+    return read_csv(file_path)
+
+
+def compute_bulk(
+    file_path: str | None,
+) -> tuple[DataFrame, DataFrame, gr.Dropdown, DataFrame]:
+    """
+    Validate and score every company of an uploaded CSV or Parquet file in one pass
+    Returns:
+        result (tuple)
+        of scored rows (DataFrame),
+        rejected rows with their error (DataFrame),
+        report row selector (Dropdown)
+        and the valid inputs (DataFrame) kept for rendering reports
+    """
+    if file_path is None:
+        raise gr.Error("Upload a CSV or Parquet file first!")
+
+    try:
+        inputs = read_upload(file_path)
+        errors = validate_frame(inputs)
+    except Exception as e:
+        raise gr.Error(f"Could not read the uploaded file: {e}")
+
+    valid = inputs[errors == ""].copy()
+    valid[ec.INPUT_COLUMNS] = valid[ec.INPUT_COLUMNS].apply(to_numeric)
+    results = ec.make_batch_dataframe(valid)
+    results.index = valid.index
+
+    try:
+        get_history_backend().append(results.to_dict("records"))
+        logger.info("Saved %d rows", len(results))
+    except Exception:
+        logger.exception("Could not save the uploaded rows")
+
+    # rows are numbered as in the uploaded file
+    results.insert(0, "Row", results.index + 1)
+    results[FOOTPRINT] = results[ec.CATEGORIES].sum(axis=1)
+    rejected = inputs[errors != ""]
+    rejected_table = DataFrame(
+        {
+            "Row": rejected.index + 1,
+            "Company Name": rejected["company_name"],
+            "Error": errors[errors != ""],
+        }
+    )
+    choices = [f"{row}: {name}" for row, name in zip(results["Row"], results["Name"])]
+    row_selector = gr.Dropdown(choices=choices, value=[], visible=True)
+    return results, rejected_table, row_selector, valid
+
+
+def bulk_report(
+    inputs: Series, factors: FactorSet, cache: ReportCache | None = None
+) -> RenderedReport:
+    """
+    The report of one row of a bulk upload, from `cache`, the app's by default,
+    or rendered without its PNG and cached with its history row
+    """
+    cache = cache or get_cache()
+    company_name = inputs["company_name"]
+    # plain floats: the uploaded columns hold numpy scalars, which the cache
+    # cannot write as JSON
+    values = {column: float(inputs[column]) for column in ec.INPUT_COLUMNS}
+    key = report_key(
+        company_name,
+        list(values.values()),
+        threshold=ec.REPORT_THRESHOLD,
+        factors=factors.id,
+    )
+
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0]
+    df = ec.make_dataframe(company_name=company_name, **values, factors=factors)
+    row = {**ec.dataframe_to_dict(df=df), **values, FACTOR_SET: factors.id}
+    return render_company_report(key, company_name, df, row, png=False, cache=cache)
+
+
+def render_bulk_reports(selected: list[str], valid: DataFrame | None) -> gr.File:
+    """
+    Render the PDF reports of the selected rows of the last upload
+    Returns:
+        report_files (File) pointing at the PDFs
+    """
+    if valid is None or not selected:
+        raise gr.Error("Select the rows to render reports for!")
+
+    cache = get_cache()
+    factors = current_factors()
+    file_paths = []
+    for label in selected:
+        report = bulk_report(valid.loc[int(label.split(":")[0]) - 1], factors)
+        try:
+            file_paths.append(export_pdf(report))
+        except (ExportBusyError, ExportFailedError, ExportTimeoutError) as e:
+            raise gr.Error(str(e))
+        cache.track_pdf(file_paths[-1])
+
+    return gr.File(value=file_paths, visible=True)
+
+
+# base inputs of the What-If tab and the range of their changes
+SCENARIO_HEADERS = ["Input", "Base", "Low Change (%)", "High Change (%)", "Steps"]
+SCENARIO_DEFAULTS = [
+    [scenarios.INPUT_LABELS["avg_electric_bill"], 1_000, -20, 20, 5],
+    [scenarios.INPUT_LABELS["avg_gas_bill"], 500, -20, 20, 5],
+    [scenarios.INPUT_LABELS["avg_transport_bill"], 2_000, -20, 20, 5],
+    [scenarios.INPUT_LABELS["monthly_waste_generated"], 300, -20, 20, 5],
+    [scenarios.INPUT_LABELS["recycled_waste_percent"], 40, 0, 50, 5],
+    [scenarios.INPUT_LABELS["annual_travel_kms"], 20_000, -20, 20, 5],
+    [scenarios.INPUT_LABELS["fuel_efficiency"], 10, -40, 0, 5],
+]
+
+
+def run_scenarios(
+    table: DataFrame, mode: str, samples: float
+) -> tuple[str, "Figure", DataFrame, DataFrame, DataFrame]:
+    """
+    Evaluate a grid or Monte Carlo samples of changes to the inputs in one
+    vectorized pass, drawn as one aggregated figure
+    Returns:
+        a summary (Markdown), the figure, and the tornado, sensitivity and
+        percentile tables
+    """
+    try:
+        table = DataFrame(table, columns=SCENARIO_HEADERS)
+        columns = {label: column for column, label in scenarios.INPUT_LABELS.items()}
+        table.index = table["Input"].map(columns)
+        values = table.drop(columns="Input").apply(to_numeric, errors="coerce")
+    except Exception as e:
+        raise gr.Error(f"Could not read the scenario inputs: {e}")
+    if values.index.isna().any() or set(values.index) != set(ec.INPUT_COLUMNS):
+        raise gr.Error("Every calculator input needs one row!")
+    if values.isna().any().any():
+        raise gr.Error("Every scenario input must be a valid number!")
+
+    errors = validate_frame(
+        DataFrame([{"company_name": "What-If", **values["Base"].to_dict()}])
     )
-    return summary, download_button
+    if errors[0]:
+        raise gr.Error(errors[0])
+    base = values["Base"].to_dict()
+    ranges = {
+        column: (low / 100, high / 100)
+        for column, low, high in zip(
+            values.index, values["Low Change (%)"], values["High Change (%)"]
+        )
+    }
+    for column, (low, high) in ranges.items():
+        if low > high:
+            label = scenarios.INPUT_LABELS[column]
+            raise gr.Error(f"{label}: the low change must not exceed the high one!")
+        if low <= -1:
+            label = scenarios.INPUT_LABELS[column]
+            raise gr.Error(f"{label}: the low change must be above -100%!")
+
+    if mode == "Monte Carlo":
+        count = int(samples or 0)
+        if count < 1:
+            raise gr.Error("Monte Carlo needs at least one sample!")
+        if count > scenarios.MAX_SCENARIOS:
+            raise gr.Error(f"At most {scenarios.MAX_SCENARIOS:,} scenarios at once!")
+        deltas = scenarios.sample_deltas(ranges, count)
+    else:
+        steps = values["Steps"].clip(lower=1).astype(int)
+        count = int(steps.prod())
+        if count > scenarios.MAX_SCENARIOS:
+            raise gr.Error(
+                f"The grid has {count:,} scenarios, "
+                f"at most {scenarios.MAX_SCENARIOS:,} at once!"
+            )
+        deltas = scenarios.grid_deltas(
+            {
+                column: np.linspace(low, high, steps[column])
+                for column, (low, high) in ranges.items()
+            }
+        )
+
+    with start_trace("scenarios") as trace:
+        with trace.span("evaluate"):
+            emissions = scenarios.evaluate_scenarios(base, deltas)
+        with trace.span("tables"):
+            baseline = scenarios.baseline_footprint(base)
+            tornado = scenarios.tornado_table(base, ranges)
+            sensitivity = scenarios.sensitivity_table(base, deltas, emissions)
+            summary = scenarios.summary_table(emissions)
+        with trace.span("figure"):
+            fig = scenarios.draw_scenario_figure(tornado, emissions, baseline)
+
+    footprint = summary.set_index("Metric").loc[FOOTPRINT]
+    text = (
+        f"**{count:,}** scenarios around a baseline of **{baseline:,.0f}** kgCO2: "
+        f"median **{footprint['p50']:,.0f}** kgCO2, 90% of them between "
+        f"{footprint['p5']:,.0f} and {footprint['p95']:,.0f} kgCO2"
+    )
+    return text, fig, tornado.round(2), sensitivity.round(4), summary.round(2)
 
 
 def create_carbon_footprint_app() -> gr.Blocks:
@@ -179,10 +668,8 @@ def create_carbon_footprint_app() -> gr.Blocks:
         with gr.Tab("Calculator 📱"):
             gr.Markdown("# 🌍 Carbon Footprint Calculator")
 
-            # Hidden image download button
-            download_button = gr.File(
-                label="Download Carbon Footprint Report", type="binary", visible=False
-            )
+            # last rendered report, the PDF is exported from it on download
+            report_state = gr.State(value=None)
 
             with gr.Column():
                 with gr.Column(scale=2):
@@ -244,12 +731,20 @@ def create_carbon_footprint_app() -> gr.Blocks:
 
                 with gr.Column(scale=2):
                     output_plot = gr.HTML(label="Carbon Footprint Report")
+                    report_plot_output = gr.Plot(
+                        label="Carbon Footprint Report",
+                        visible=REPORT_MODE == "plot",
+                    )
                     # Create a row for buttons
                     with gr.Row():
                         submit_button = gr.Button("Generate Report", variant="primary")
-                        download_button = gr.DownloadButton(
+                        download_button = gr.Button(
                             "Download Report", variant="secondary", visible=False
                         )
+                    # Hidden report download file
+                    report_file = gr.File(
+                        label="Download Carbon Footprint Report", visible=False
+                    )
 
             submit_button.click(
                 fn=compute,
@@ -263,26 +758,183 @@ def create_carbon_footprint_app() -> gr.Blocks:
                     annual_travel_kms,
                     fuel_efficiency,
                 ],
-                outputs=[output_plot, download_button],
+                outputs=[
+                    output_plot,
+                    report_plot_output,
+                    download_button,
+                    report_state,
+                ],
+                concurrency_limit=COMPUTE_CONCURRENCY,
+            )
+            download_button.click(
+                fn=download_report,
+                inputs=[report_state],
+                outputs=[report_file],
+                concurrency_limit=COMPUTE_CONCURRENCY,
+            )
+
+        with gr.Tab("Bulk Upload 📂"):
+            gr.Markdown("# 📂 Bulk Carbon Footprint Scoring")
+            gr.Markdown(
+                "Upload a CSV or Parquet file with the columns "
+                f"`{'`, `'.join(REQUIRED_COLUMNS)}`, one company per row."
+            )
+
+            # valid rows of the last upload, reports are rendered from them
+            bulk_state = gr.State(value=None)
+
+            bulk_file = gr.File(
+                label="Companies", file_types=[".csv", ".parquet"], type="filepath"
+            )
+            bulk_button = gr.Button("Score Companies", variant="primary")
+            bulk_results = gr.Dataframe(label="Scored Companies", interactive=False)
+            bulk_errors = gr.Dataframe(label="Rejected Rows", interactive=False)
+
+            with gr.Row():
+                bulk_rows = gr.Dropdown(
+                    label="Rows to render reports for",
+                    multiselect=True,
+                    visible=False,
+                )
+                bulk_render = gr.Button("Render Reports", variant="secondary")
+            bulk_reports = gr.File(
+                label="Carbon Footprint Reports", file_count="multiple", visible=False
+            )
+
+            bulk_button.click(
+                fn=compute_bulk,
+                inputs=[bulk_file],
+                outputs=[bulk_results, bulk_errors, bulk_rows, bulk_state],
+            )
+            bulk_render.click(
+                fn=render_bulk_reports,
+                inputs=[bulk_rows, bulk_state],
+                outputs=[bulk_reports],
+            )
+
+        with gr.Tab("What-If 🔮"):
+            gr.Markdown("# 🔮 What-If Scenarios")
+            gr.Markdown(
+                "Change the inputs of the calculator by a percentage, e.g. -20% for "
+                "the electricity bill, and see how the footprint moves. Every "
+                "combination of `Steps` changes between the low and the high change "
+                "is evaluated, or random changes in that range with Monte Carlo."
+            )
+            scenario_inputs = gr.Dataframe(
+                value=SCENARIO_DEFAULTS,
+                headers=SCENARIO_HEADERS,
+                datatype=["str", "number", "number", "number", "number"],
+                column_count=(len(SCENARIO_HEADERS), "fixed"),
+                row_count=(len(SCENARIO_DEFAULTS), "fixed"),
+                interactive=True,
+                label="Scenario Inputs",
+            )
+            with gr.Row():
+                scenario_mode = gr.Radio(
+                    ["Grid", "Monte Carlo"], value="Grid", label="Scenarios"
+                )
+                scenario_samples = gr.Number(
+                    value=1_000_000, precision=0, label="Monte Carlo Samples"
+                )
+            scenario_button = gr.Button("Run Scenarios", variant="primary")
+            scenario_summary = gr.Markdown()
+            scenario_plot = gr.Plot(label="What-If Scenarios")
+            tornado_table = gr.Dataframe(label="Tornado", interactive=False)
+            sensitivity_table = gr.Dataframe(label="Sensitivity", interactive=False)
+            percentile_table = gr.Dataframe(label="Percentiles", interactive=False)
+            scenario_button.click(
+                fn=run_scenarios,
+                inputs=[scenario_inputs, scenario_mode, scenario_samples],
+                outputs=[
+                    scenario_summary,
+                    scenario_plot,
+                    tornado_table,
+                    sensitivity_table,
+                    percentile_table,
+                ],
             )
 
         with gr.Tab("History 📊") as historic_tab:
             gr.Markdown("# Historic Company Data")
 
-            plot = gr.Plot(value=compute_history(), label="Historic Data")
+            # drawn when the tab is opened, not while the app starts
+            factor_set = gr.Dropdown(
+                choices=[AS_SUBMITTED, *factor_sets()],
+                value=AS_SUBMITTED,
+                label="Emission Factors",
+                info="Score the whole history again with another factor set",
+            )
+            summary = gr.Markdown("⏳ Loading the history...")
+            plot = gr.Plot(label="Historic Data")
             refresh = gr.Button("Refresh", variant="secondary")
             refresh.click(
-                fn=compute_history,
-                outputs=[plot],
+                fn=load_history,
+                inputs=[factor_set],
+                outputs=[plot, summary],
             )
             # auto-reload
             historic_tab.select(
-                fn=compute_history,
-                outputs=[plot],
+                fn=load_history,
+                inputs=[factor_set],
+                outputs=[plot, summary],
+            )
+            factor_set.change(
+                fn=load_history,
+                inputs=[factor_set],
+                outputs=[plot, summary],
             )
 
+            # one company, read through the name index instead of the whole history
+            gr.Markdown("## Company Trend")
+            with gr.Row():
+                company_filter = gr.Textbox(
+                    label="Company Name",
+                    placeholder="Any capitalization, e.g. acme corp",
+                    scale=3,
+                )
+                company_button = gr.Button("Show Trend", variant="primary", scale=1)
+            company_plot = gr.Plot(label="Company Trend")
+            company_rows = gr.Dataframe(label="Submissions", interactive=False)
+            gr.on(
+                triggers=[company_button.click, company_filter.submit],
+                fn=company_history,
+                inputs=[company_filter],
+                outputs=[company_plot, company_rows],
+                api_name="company_history",
+            )
+
+    # sync handlers share the default limit, compute and downloads have their own
+    demo.queue(default_concurrency_limit=DEFAULT_CONCURRENCY)
     return demo
 
 
+def create_server(demo: gr.Blocks) -> FastAPI:
+    """
+    The Gradio app mounted on a FastAPI server that also serves /metrics, the
+    stage durations and report cache counters, and the JSON scoring API at
+    /api/score.
+    The first history figure and the exporters are prepared in the background.
+    """
+    server = FastAPI()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+    @server.get("/metrics", response_class=PlainTextResponse)
+    def metrics() -> str:
+        return prometheus_text() + get_cache().prometheus_text()
+
+    server.include_router(create_scoring_api())
+
+    return gr.mount_gradio_app(server, demo, path="/")
+
+
 if __name__ == "__main__":
-    create_carbon_footprint_app().launch()
+    logging.basicConfig(
+        level=os.environ.get("LOG_LEVEL", "INFO"),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    uvicorn.run(
+        create_server(create_carbon_footprint_app()),
+        host=os.environ.get("GRADIO_SERVER_NAME", "127.0.0.1"),
+        port=int(os.environ.get("GRADIO_SERVER_PORT", 7860)),
+        timeout_keep_alive=KEEP_ALIVE_TIMEOUT,
+    )
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import os.path as os_path
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, sleep
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from benchmarks.suite import DEFAULT_THRESHOLD, compare, environment
+
+SRC_DIR = os_path.dirname(os_path.dirname(os_path.abspath(__file__)))
+HISTORY_PATH = os_path.join(SRC_DIR, "..", "reports", "historic_data.csv")
+SERVER_TIMEOUT = 120
+
+# run in a fresh interpreter, prints the import and build times in seconds
+STARTUP_SCRIPT = """
+from time import perf_counter
+start = perf_counter()
+import app
+imported = perf_counter()
+app.create_carbon_footprint_app()
+print(imported - start, perf_counter() - imported)
+"""
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def workdir(prefix: str = "cold-start-") -> str:
+    """
+    A copy of the reports directory, so the app never writes to the real one
+    """
+    path = tempfile.mkdtemp(prefix=prefix)
+    os.makedirs(os_path.join(path, "reports"))
+    if os_path.exists(HISTORY_PATH):
+        shutil.copy(HISTORY_PATH, os_path.join(path, "reports"))
+    return path
+
+
+def run_python(args: list[str], cwd: str, **kwargs) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": SRC_DIR, "EXPORT_POOL_SIZE": "0"}
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        **kwargs,
+    )
+
+
+def startup_times(cwd: str) -> tuple[float, float]:
+    """
+    Returns:
+        seconds to import app and to build the Gradio app, in a new process
+    """
+    output = run_python(["-c", STARTUP_SCRIPT], cwd).stdout
+    imported, built = output.strip().splitlines()[-1].split()
+    return float(imported), float(built)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(
+    cwd: str, port: int, env: dict | None = None, output=subprocess.DEVNULL
+) -> subprocess.Popen:
+    """
+    Start `python app.py` in `cwd`, serving on `port`
+    """
+    env = {
+        **os.environ,
+        "PYTHONPATH": SRC_DIR,
+        "GRADIO_SERVER_PORT": str(port),
+        "EXPORT_POOL_SIZE": "0",
+        **(env or {}),
+    }
+    return subprocess.Popen(
+        [sys.executable, os_path.join(SRC_DIR, "app.py")],
+        cwd=cwd,
+        env=env,
+        stdout=output,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def wait_until_ready(server: subprocess.Popen, port: int) -> float:
+    """
+    Returns:
+        seconds until the app answered HTTP requests
+    """
+    start = perf_counter()
+    while perf_counter() - start < SERVER_TIMEOUT:
+        if server.poll() is not None:
+            raise RuntimeError("The app exited before serving requests")
+        try:
+            with urlopen(f"http://127.0.0.1:{port}/", timeout=1):
+                return perf_counter() - start
+        except (URLError, ConnectionError, TimeoutError):
+            sleep(0.05)
+    raise TimeoutError(f"The app did not answer within {SERVER_TIMEOUT}s")
+
+
+def server_ready_time(cwd: str) -> float:
+    """
+    Returns:
+        seconds from starting `python app.py` until it answers HTTP requests
+    """
+    port = free_port()
+    start = perf_counter()
+    server = start_app(cwd, port)
+    try:
+        wait_until_ready(server, port)
+        return perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def import_report(cwd: str, top: int) -> list[tuple[str, float]]:
+    """
+    Returns:
+        the `top` packages imported by app taking the longest, in milliseconds
+    """
+    stderr = run_python(["-X", "importtime", "-c", "import app"], cwd).stderr
+    packages: dict[str, float] = {}
+    # modules are listed after their own imports, one level deeper
+    for match in IMPORT_TIME.finditer(stderr):
+        _, cumulative, indent, name = match.groups()
+        if len(indent) == 1:
+            if name == "app":
+                break
+            packages = {}
+        elif len(indent) == 3:
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0) + int(cumulative) / 1000
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def summarize(samples: list[float]) -> dict:
+    times = [sample * 1000 for sample in samples]
+    return {
+        "runs": len(times),
+        "min_ms": min(times),
+        "median_ms": statistics.median(times),
+        "mean_ms": statistics.fmean(times),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the cold start of the app in fresh processes"
+    )
+    parser.add_argument("--runs", type=int, default=3, help="processes per measure")
+    parser.add_argument("--top", type=int, default=10, help="packages to report")
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    cwd = workdir()
+    try:
+        print("Slowest imports of app:")
+        for package, ms in import_report(cwd, args.top):
+            print(f"  {package:<28} {ms:10.1f} ms")
+
+        imports, builds, ready = [], [], []
+        for _ in range(args.runs):
+            imported, built = startup_times(cwd)
+            imports.append(imported)
+            builds.append(built)
+            ready.append(server_ready_time(cwd))
+    finally:
+        shutil.rmtree(cwd, ignore_errors=True)
+
+    results = {
+        "import_app": summarize(imports),
+        "build_app": summarize(builds),
+        "server_ready": summarize(ready),
+    }
+    for name, result in results.items():
+        print(f"{name:<32} {result['median_ms']:10.1f} ms median")
+
+    current = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            raise SystemExit(1)
@@ -0,0 +1,428 @@
+import argparse
+import asyncio
+import csv
+import json
+import os.path as os_path
+import shutil
+import statistics
+import subprocess
+from collections.abc import Iterator
+from itertools import count
+from time import perf_counter
+
+import httpx
+import numpy as np
+from pandas import read_csv
+
+from benchmarks.cold_start import free_port, start_app, wait_until_ready, workdir
+from benchmarks.suite import DEFAULT_THRESHOLD, SEED, compare, environment
+from dummy_data_generator import sample_inputs
+from emission_calculator import calculator as ec
+from emission_calculator.validation import validate_frame
+
+PERCENTILES = (50, 90, 95, 99)
+# the History tab choice of the stored emissions, app.AS_SUBMITTED
+AS_SUBMITTED = "As submitted"
+# companies generated at once by dummy_data_generator
+GENERATE_CHUNK = 1_000
+REQUEST_TIMEOUT = 120
+
+
+class EventError(Exception):
+    """
+    Raised when an event of the app ends with an error
+    """
+
+
+class LoadStats:
+    """
+    Latencies and errors of every endpoint, in seconds
+    """
+
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.first_error: dict[str, str] = {}
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        self.latencies.setdefault(endpoint, []).append(seconds)
+
+    def fail(self, endpoint: str, error: Exception) -> None:
+        self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        self.first_error.setdefault(endpoint, f"{type(error).__name__}: {error}")
+
+    def summary(self, elapsed: float) -> dict:
+        results = {}
+        for endpoint in sorted(self.latencies.keys() | self.errors.keys()):
+            times = [t * 1000 for t in self.latencies.get(endpoint, [])]
+            errors = self.errors.get(endpoint, 0)
+            result = {
+                "requests": len(times) + errors,
+                "errors": errors,
+                "error_rate": errors / (len(times) + errors),
+                "throughput_per_s": len(times) / elapsed,
+            }
+            if times:
+                percentiles = np.percentile(times, PERCENTILES)
+                result["median_ms"] = statistics.median(times)
+                for q, value in zip(PERCENTILES, percentiles):
+                    result[f"p{q}_ms"] = float(value)
+                result["max_ms"] = max(times)
+            if endpoint in self.first_error:
+                result["first_error"] = self.first_error[endpoint]
+            results[endpoint] = result
+        return results
+
+
+def submissions(seed: int, prefix: str) -> Iterator[list]:
+    """
+    Yields the inputs of compute for synthetic companies of dummy_data_generator,
+    only those passing validation. Names are unique, so every submission can be
+    found in the history.
+    """
+    rng = np.random.default_rng(seed)
+    for start in count(0, GENERATE_CHUNK):
+        inputs = sample_inputs(rng, start, start + GENERATE_CHUNK)
+        inputs = inputs[validate_frame(inputs) == ""]
+        inputs["company_name"] = prefix + inputs["company_name"]
+        for row in inputs[["company_name", *ec.INPUT_COLUMNS]].itertuples(index=False):
+            yield [row[0], *[int(value) for value in row[1:]]]
+
+
+async def call(client: httpx.AsyncClient, endpoint: str, data: list) -> float | None:
+    """
+    Run an event through the Gradio API and wait for its result
+    Returns:
+        seconds until its first streamed update, for generators
+    """
+    start = perf_counter()
+    response = await client.post(f"/gradio_api/call/{endpoint}", json={"data": data})
+    response.raise_for_status()
+    event_id = response.json()["event_id"]
+
+    first = None
+    event = None
+    async with client.stream(
+        "GET", f"/gradio_api/call/{endpoint}/{event_id}"
+    ) as stream:
+        async for line in stream.aiter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:") :].strip()
+            elif line.startswith("data:"):
+                if event == "generating" and first is None:
+                    first = perf_counter() - start
+                elif event == "complete":
+                    return first
+                elif event == "error":
+                    raise EventError(line[len("data:") :].strip())
+    raise EventError("The event stream ended without a result")
+
+
+async def timed(
+    stats: LoadStats, endpoint: str, client: httpx.AsyncClient, data: list
+) -> bool:
+    start = perf_counter()
+    try:
+        first = await call(client, endpoint, data)
+    except Exception as e:
+        stats.fail(endpoint, e)
+        return False
+    stats.record(endpoint, perf_counter() - start)
+    if first is not None:
+        stats.record(f"{endpoint}_first_update", first)
+    return True
+
+
+async def session(
+    client: httpx.AsyncClient,
+    submission: list,
+    stats: LoadStats,
+    history_share: float,
+    rng: np.random.Generator,
+    computed: set[str],
+) -> None:
+    """
+    One user: a report, then for `history_share` of them the History tab and
+    the trend of their company
+    """
+    start = perf_counter()
+    if await timed(stats, "compute", client, submission):
+        computed.add(submission[0])
+    if rng.random() < history_share:
+        await timed(stats, "load_history", client, [AS_SUBMITTED])
+        await timed(stats, "company_history", client, [submission[0]])
+    stats.record("session", perf_counter() - start)
+
+
+async def run_load(
+    port: int,
+    duration: float,
+    concurrency: int,
+    rate: float | None,
+    history_share: float,
+    think_time: float,
+    seed: int,
+    prefix: str,
+) -> tuple[LoadStats, float, dict[str, list], set[str]]:
+    """
+    Drive the app for `duration` seconds. Without `rate`, `concurrency` users
+    each start a new session once theirs is done, after `think_time`. With
+    `rate`, sessions arrive as a Poisson process of `rate` per second whatever
+    the latency, on at most `concurrency` connections.
+    Returns:
+        the statistics, the elapsed seconds, the inputs of every submission by
+        company and the companies whose report completed
+    """
+    stats = LoadStats()
+    submitted: dict[str, list] = {}
+    computed: set[str] = set()
+    companies = submissions(seed, prefix)
+    rng = np.random.default_rng(seed)
+
+    def next_submission() -> list:
+        submission = next(companies)
+        submitted[submission[0]] = submission[1:]
+        return submission
+
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}",
+        limits=limits,
+        timeout=REQUEST_TIMEOUT,
+    ) as client:
+        # the first report loads what the app prepares lazily, it is not measured
+        try:
+            await call(client, "compute", next_submission())
+        except EventError as e:
+            raise RuntimeError(f"The app could not compute a first report: {e}")
+
+        start = perf_counter()
+        deadline = start + duration
+        args = (stats, history_share, rng, computed)
+        if rate is None:
+
+            async def user() -> None:
+                while perf_counter() < deadline:
+                    await session(client, next_submission(), *args)
+                    await asyncio.sleep(think_time)
+
+            await asyncio.gather(*[user() for _ in range(concurrency)])
+        else:
+            tasks = []
+            arrival = start
+            while True:
+                arrival += rng.exponential(1 / rate)
+                if arrival >= deadline:
+                    break
+                await asyncio.sleep(max(0.0, arrival - perf_counter()))
+                tasks.append(
+                    asyncio.create_task(session(client, next_submission(), *args))
+                )
+            await asyncio.gather(*tasks)
+        elapsed = perf_counter() - start
+
+    return stats, elapsed, submitted, computed
+
+
+def count_rows(path: str) -> int:
+    if not os_path.exists(path):
+        return 0
+    with open(path, newline="", encoding="utf-8") as f:
+        return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+
+def check_history(
+    path: str, rows_before: int, submitted: dict[str, list], computed: set[str]
+) -> dict:
+    """
+    Check the history CSV written under load: complete lines of the header's
+    width, one row per submission with the emissions of its inputs, and a row
+    for every report that completed
+    Returns:
+        counts of the rows and of every kind of problem found
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        data = f.read()
+    rows = list(csv.reader(data.splitlines()))
+    header, new = rows[0], rows[1 + rows_before :]
+    problems = {
+        "incomplete_last_line": int(bool(data) and not data.endswith("\n")),
+        # older rows may predate columns added to the header, new ones may not
+        "malformed": sum(len(row) != len(header) for row in new)
+        + sum(len(row) > len(header) for row in rows[1 : 1 + rows_before]),
+    }
+
+    df = read_csv(path, skiprows=range(1, 1 + rows_before))
+    names = df["Name"].astype(str)
+    expected = ec.make_batch_dataframe(
+        {
+            "company_name": list(submitted),
+            **{
+                column: [inputs[i] for inputs in submitted.values()]
+                for i, column in enumerate(ec.INPUT_COLUMNS)
+            },
+        }
+    ).set_index("Name")
+    known = names.isin(expected.index)
+    problems["unexpected"] = int((~known).sum())
+    problems["duplicated"] = int(names.duplicated().sum())
+    problems["missing"] = len(computed - set(names))
+    found = df[known & ~names.duplicated()]
+    values = found[ec.CATEGORIES].to_numpy(dtype=np.float64)
+    reference = expected.loc[found["Name"], ec.CATEGORIES].to_numpy()
+    problems["mismatched"] = int((~np.isclose(values, reference).all(axis=1)).sum())
+
+    return {
+        "rows_before": rows_before,
+        "rows_after": len(rows) - 1,
+        "submitted": len(submitted),
+        "completed": len(computed),
+        **problems,
+        "ok": not any(problems.values()),
+    }
+
+
+def print_results(results: dict, elapsed: float) -> None:
+    print(f"{'endpoint':<28} {'requests':>9} {'errors':>7} {'req/s':>8} ", end="")
+    print(" ".join(f"{f'p{q}':>9}" for q in PERCENTILES), f"{'max':>9}")
+    for endpoint, result in results.items():
+        print(
+            f"{endpoint:<28} {result['requests']:>9} {result['errors']:>7} "
+            f"{result['throughput_per_s']:>8.1f} ",
+            end="",
+        )
+        if "median_ms" in result:
+            print(
+                " ".join(f"{result[f'p{q}_ms']:>9.1f}" for q in PERCENTILES),
+                f"{result['max_ms']:>9.1f}",
+            )
+        else:
+            print()
+        if "first_error" in result:
+            print(f"  first error: {result['first_error'][:200]}")
+    print(f"over {elapsed:.1f}s, latencies in ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Drive concurrent sessions against a local instance of the app"
+    )
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="users, or connections with --rate"
+    )
+    parser.add_argument(
+        "--rate", type=float, help="sessions started per second, open loop"
+    )
+    parser.add_argument(
+        "--history-share",
+        type=float,
+        default=0.2,
+        help="share of the sessions also opening the History tab",
+    )
+    parser.add_argument(
+        "--think-time", type=float, default=0, help="seconds between sessions"
+    )
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument(
+        "--report-mode",
+        default="plot",
+        help="REPORT_MODE of the app, png needs Kaleido and Chrome",
+    )
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    cwd = workdir(prefix="loadtest-")
+    history_path = os_path.join(cwd, "reports", "historic_data.csv")
+    log_path = os_path.join(cwd, "server.log")
+    rows_before = count_rows(history_path)
+    port = free_port()
+    try:
+        with open(log_path, "w") as log:
+            server = start_app(
+                cwd,
+                port,
+                # not compacted, so every submission is checked in the CSV
+                env={
+                    "REPORT_MODE": args.report_mode,
+                    "HISTORY_BACKEND": "csv",
+                    "HISTORY_RETENTION_INTERVAL": "0",
+                },
+                output=log,
+            )
+            try:
+                wait_until_ready(server, port)
+                stats, elapsed, submitted, computed = asyncio.run(
+                    run_load(
+                        port,
+                        duration=args.duration,
+                        concurrency=args.concurrency,
+                        rate=args.rate,
+                        history_share=args.history_share,
+                        think_time=args.think_time,
+                        seed=args.seed,
+                        prefix=f"Load {args.seed} ",
+                    )
+                )
+            finally:
+                # stopped before the history is checked, so every row was written
+                server.terminate()
+                try:
+                    server.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+                    server.wait()
+
+        results = stats.summary(elapsed)
+        print_results(results, elapsed)
+        integrity = check_history(history_path, rows_before, submitted, computed)
+        print(f"History integrity: {integrity}")
+        if any(result["errors"] for result in results.values()):
+            with open(log_path) as log:
+                print("Last lines of the server log:")
+                print("".join(log.readlines()[-20:]))
+    finally:
+        shutil.rmtree(cwd, ignore_errors=True)
+
+    config = {
+        key: getattr(args, key)
+        for key in (
+            "duration",
+            "concurrency",
+            "rate",
+            "history_share",
+            "think_time",
+            "seed",
+            "report_mode",
+        )
+    }
+    current = {
+        "environment": environment(),
+        "config": config,
+        "integrity": integrity,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    failed = not integrity["ok"]
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("The baseline was run with another configuration")
+        regressions = compare(current, baseline, args.threshold)
+        for endpoint, result in results.items():
+            base = baseline["results"].get(endpoint, {})
+            if result["error_rate"] > base.get("error_rate", 0):
+                regressions.append(f"{endpoint} errors")
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            failed = True
+    if failed:
+        raise SystemExit(1)
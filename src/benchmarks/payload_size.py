@@ -0,0 +1,67 @@
+import argparse
+import base64
+import json
+from time import perf_counter
+
+import plotly.io as pio
+from benchmarks.suite import sample_inputs
+from emission_calculator import calculator as ec
+from reporting.render import REPORT_HEIGHT, REPORT_WIDTH
+
+
+def sample_report() -> dict:
+    """
+    The serialized report figure of one typical company
+    """
+    df = ec.make_dataframe(**sample_inputs())
+    return json.loads(pio.to_json(ec.draw_report_figure(df), validate=False))
+
+
+def measure(name: str, build, repeat: int) -> dict:
+    """
+    Returns:
+        payload size in bytes and best-of-`repeat` server time of `build`
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        payload = build()
+        best = min(best, perf_counter() - start)
+    return {"mode": name, "bytes": len(payload.encode("utf-8")), "ms": best * 1000}
+
+
+def png_payload(figure: dict) -> str:
+    png = pio.to_image(
+        figure,
+        format="png",
+        width=REPORT_WIDTH,
+        height=REPORT_HEIGHT,
+        validate=False,
+    )
+    img_data = base64.b64encode(png).decode("utf-8")
+    return f'<img src="data:image/png;base64,{img_data}"/>'
+
+
+def plot_payload(figure: dict) -> str:
+    return json.dumps(figure, separators=(",", ":"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the report payload of REPORT_MODE=png and plot"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="runs per mode")
+    args = parser.parse_args()
+
+    figure = sample_report()
+    results = [measure("plot", lambda: plot_payload(figure), args.repeat)]
+    try:
+        results.append(measure("png", lambda: png_payload(figure), args.repeat))
+    except Exception as e:
+        print(f"Skipping png, the report could not be exported: {e}")
+
+    for result in results:
+        print(
+            f"{result['mode']:>4}: {result['bytes'] / 1024:8.1f} KiB, "
+            f"{result['ms']:8.2f} ms"
+        )
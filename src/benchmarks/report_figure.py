@@ -0,0 +1,42 @@
+import argparse
+from time import perf_counter
+
+from benchmarks.suite import sample_inputs
+from emission_calculator import calculator as ec
+
+
+def sample_dataframe():
+    return ec.make_dataframe(**sample_inputs())
+
+
+def time_per_call(run, repeat: int) -> float:
+    """
+    Returns:
+        mean milliseconds per call of `run`
+    """
+    start = perf_counter()
+    for _ in range(repeat):
+        run()
+    return (perf_counter() - start) / repeat * 1000
+
+
+def draw_uncached(df) -> None:
+    # the layout is built and validated again, as before the template
+    ec.report_template.cache_clear()
+    ec.draw_report_figure(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time building the report figure with and without its template"
+    )
+    parser.add_argument("--repeat", type=int, default=50, help="calls per case")
+    args = parser.parse_args()
+
+    df = sample_dataframe()
+    uncached = time_per_call(lambda: draw_uncached(df), args.repeat)
+    ec.report_template()
+    cached = time_per_call(lambda: ec.draw_report_figure(df), args.repeat)
+
+    print(f"template rebuilt per call: {uncached:8.2f} ms")
+    print(f"cached template:           {cached:8.2f} ms ({uncached / cached:.1f}x)")
@@ -0,0 +1,495 @@
+import argparse
+import asyncio
+import fnmatch
+import json
+import os.path as os_path
+import platform
+import shutil
+import statistics
+import tempfile
+from collections.abc import Callable
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+from time import perf_counter
+
+import numpy as np
+from pandas import concat, date_range
+import plotly.io as pio
+from dummy_data_generator import generate_chunk, generate_dummy_data
+from emission_calculator import calculator as ec
+from emission_calculator import scenarios
+from emission_calculator.factors import FactorSet
+from history.archive import HistoryArchive
+from history.backends import CsvHistoryBackend
+from history.retention import archive_path, compact
+from history.store import SUBMITTED_AT
+from reporting.render import REPORT_HEIGHT, REPORT_WIDTH
+
+SEED = 42
+HISTORIC_SIZES = (10, 1_000, 100_000)
+HISTORY_CSV_SIZES = (1_000, 100_000)
+# a case is a regression when its median is this much slower than the baseline
+DEFAULT_THRESHOLD = 0.25
+PACKAGES = ("numpy", "pandas", "plotly", "kaleido", "gradio", "pyarrow")
+# synthetic history files, generated once per run
+TEMP_DIR = tempfile.TemporaryDirectory(prefix="benchmarks-")
+
+# name -> setup, which prepares the data and returns the timed function
+Case = Callable[[], Callable[[], object]]
+CASES: dict[str, Case] = {}
+
+
+def case(name: str) -> Callable[[Case], Case]:
+    def register(setup: Case) -> Case:
+        CASES[name] = setup
+        return setup
+
+    return register
+
+
+class SkipCase(Exception):
+    """
+    Raised by a setup when the case cannot run here, e.g. Kaleido without Chrome
+    """
+
+
+def sample_inputs() -> dict:
+    """
+    The inputs of one typical company, shared by the benchmarks
+    """
+    return dict(
+        company_name="Benchmark Inc",
+        avg_electric_bill=1_000,
+        avg_gas_bill=500,
+        avg_transport_bill=2_000,
+        monthly_waste_generated=300,
+        recycled_waste_percent=40,
+        annual_travel_kms=20_000,
+        fuel_efficiency=10,
+    )
+
+
+@case("make_dataframe")
+def bench_make_dataframe():
+    inputs = sample_inputs()
+    return lambda: ec.make_dataframe(**inputs)
+
+
+@case("dataframe_to_dict")
+def bench_dataframe_to_dict():
+    df = ec.make_dataframe(**sample_inputs())
+    return lambda: ec.dataframe_to_dict(df)
+
+
+@case("draw_report_figure")
+def bench_draw_report_figure():
+    df = ec.make_dataframe(**sample_inputs())
+    return lambda: ec.draw_report_figure(df)
+
+
+def bench_draw_historic_figure(company_count: int):
+    def setup():
+        df = generate_chunk(SEED, 0, company_count, company_count)
+        return lambda: ec.draw_historic_figure(df)
+
+    return setup
+
+
+for company_count in HISTORIC_SIZES:
+    case(f"draw_historic_figure[{company_count}]")(
+        bench_draw_historic_figure(company_count)
+    )
+
+
+def history_csv(company_count: int) -> str:
+    path = os_path.join(TEMP_DIR.name, f"history_{company_count}.csv")
+    if not os_path.exists(path):
+        generate_dummy_data(company_count, path=path, seed=SEED)
+    return path
+
+
+def bench_compute_history(company_count: int):
+    def setup():
+        path = history_csv(company_count)
+
+        # a cold load: the CSV is parsed and the figure drawn by a new backend
+        def run():
+            return CsvHistoryBackend(path).rollup_figure(ec.draw_rollup_figure)
+
+        return run
+
+    return setup
+
+
+def bench_compute_history_append(company_count: int):
+    def setup():
+        path = os_path.join(TEMP_DIR.name, f"history_append_{company_count}.csv")
+        shutil.copy(history_csv(company_count), path)
+        backend = CsvHistoryBackend(path)
+        row = generate_chunk(SEED, 0, 1, 1).to_dict("records")
+        # the first append adds the "Submitted At" column the generated file lacks
+        backend.append(row)
+        backend.rollup_figure(ec.draw_rollup_figure)
+
+        # one new row, only it is parsed and added to the rollups
+        def run():
+            backend.append(row)
+            return backend.rollup_figure(ec.draw_rollup_figure)
+
+        return run
+
+    return setup
+
+
+for company_count in HISTORY_CSV_SIZES:
+    case(f"compute_history_csv[{company_count}]")(bench_compute_history(company_count))
+    case(f"compute_history_csv_append[{company_count}]")(
+        bench_compute_history_append(company_count)
+    )
+
+
+def bench_lookup_company(company_count: int):
+    def setup():
+        path = os_path.join(TEMP_DIR.name, f"history_lookup_{company_count}.csv")
+        shutil.copy(history_csv(company_count), path)
+        backend = CsvHistoryBackend(path)
+        backend.lookup("Company 1")
+
+        # one company read through the name index, then its trend drawn
+        def run():
+            rows = backend.lookup(f"company {company_count // 2}")
+            return ec.draw_company_trend(rows, "Company")
+
+        return run
+
+    return setup
+
+
+for company_count in HISTORY_CSV_SIZES:
+    case(f"lookup_company_csv[{company_count}]")(bench_lookup_company(company_count))
+
+
+def bench_compact_history(company_count: int):
+    def setup():
+        # every company submitted ten times, spread over the last year
+        df = generate_chunk(SEED, 0, company_count, company_count)
+        history = concat([df] * 10, ignore_index=True)
+        history[SUBMITTED_AT] = (
+            date_range(
+                end=datetime.now(timezone.utc), periods=len(history), freq="5min"
+            )
+            .strftime("%Y-%m-%dT%H:%M:%S+00:00")
+            .tolist()
+        )
+        source = os_path.join(TEMP_DIR.name, f"history_repeats_{company_count}.csv")
+        history.to_csv(source, index=False)
+        path = os_path.join(TEMP_DIR.name, f"history_compact_{company_count}.csv")
+
+        # the latest row of every company kept, the others archived by month;
+        # each run compacts a fresh copy, the copy included
+        def run():
+            shutil.copy(source, path)
+            shutil.rmtree(archive_path(path), ignore_errors=True)
+            return compact(path, HistoryArchive(archive_path(path)))
+
+        return run
+
+    return setup
+
+
+for company_count in HISTORY_CSV_SIZES:
+    case(f"compact_history_csv[{company_count}]")(bench_compact_history(company_count))
+
+
+# every factor changed, so no emission is left as it was stored
+BENCHMARK_FACTORS = FactorSet(
+    name="benchmark",
+    version=1,
+    electricity=4e-4,
+    gas=5e-3,
+    transport=2.3,
+    waste=0.5,
+    recycling=0.9,
+    travel=2.2,
+)
+
+
+def bench_rescore_history(company_count: int):
+    def setup():
+        df = CsvHistoryBackend(history_csv(company_count)).read()
+
+        # the whole history scored again in one vectorized pass
+        def run():
+            return ec.rescore(df, BENCHMARK_FACTORS)
+
+        return run
+
+    return setup
+
+
+def bench_switch_factors(company_count: int):
+    def setup():
+        backend = CsvHistoryBackend(history_csv(company_count))
+        backend.rollup_figure(ec.draw_rollup_figure)
+        backend.rollup_figure(ec.draw_rollup_figure, BENCHMARK_FACTORS)
+
+        # back and forth between factor sets, each keeps its rollups and figure
+        def run():
+            backend.rollup_figure(ec.draw_rollup_figure, BENCHMARK_FACTORS)
+            return backend.rollup_figure(ec.draw_rollup_figure)
+
+        return run
+
+    return setup
+
+
+for company_count in HISTORY_CSV_SIZES:
+    case(f"rescore_history[{company_count}]")(bench_rescore_history(company_count))
+    case(f"switch_factors_csv[{company_count}]")(bench_switch_factors(company_count))
+
+
+SCENARIO_COUNTS = (10_000, 1_000_000)
+
+
+def bench_scenarios(count: int, grid: bool):
+    def setup():
+        base = {column: sample_inputs()[column] for column in ec.INPUT_COLUMNS}
+        ranges = {column: (-0.2, 0.2) for column in ec.INPUT_COLUMNS}
+        if grid:
+            # the same number of steps for every input, about `count` in total
+            steps = round(count ** (1 / len(ranges)))
+            deltas = scenarios.grid_deltas(
+                {column: np.linspace(-0.2, 0.2, steps) for column in ranges}
+            )
+        else:
+            deltas = scenarios.sample_deltas(ranges, count, seed=SEED)
+
+        # evaluation and the tables, the figure is drawn from binned values
+        def run():
+            emissions = scenarios.evaluate_scenarios(base, deltas)
+            scenarios.sensitivity_table(base, deltas, emissions)
+            scenarios.summary_table(emissions)
+            return scenarios.tornado_table(base, ranges)
+
+        return run
+
+    return setup
+
+
+for count in SCENARIO_COUNTS:
+    case(f"scenarios_grid[{count}]")(bench_scenarios(count, grid=True))
+    case(f"scenarios_monte_carlo[{count}]")(bench_scenarios(count, grid=False))
+
+
+API_BATCH_SIZES = (1, 1_000)
+
+
+def bench_score_api(count: int):
+    def setup():
+        import httpx
+        from fastapi import FastAPI
+        from scoring_api import create_scoring_api
+
+        server = FastAPI()
+        server.include_router(create_scoring_api())
+        loop = asyncio.new_event_loop()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=server), base_url="http://benchmark"
+        )
+        row = sample_inputs()
+        payload = row if count == 1 else [row] * count
+
+        # one request through the ASGI app, as a local test client sends it
+        def run():
+            response = loop.run_until_complete(client.post("/api/score", json=payload))
+            response.raise_for_status()
+            return response
+
+        return run
+
+    return setup
+
+
+for count in API_BATCH_SIZES:
+    case(f"score_api[{count}]")(bench_score_api(count))
+
+
+def bench_export(format: str):
+    def setup():
+        df = ec.make_dataframe(**sample_inputs())
+        figure = json.loads(pio.to_json(ec.draw_report_figure(df), validate=False))
+
+        def run():
+            return pio.to_image(
+                figure,
+                format=format,
+                width=REPORT_WIDTH,
+                height=REPORT_HEIGHT,
+                validate=False,
+            )
+
+        try:
+            run()
+        except Exception as e:
+            raise SkipCase(f"Kaleido cannot export: {str(e).strip().splitlines()[0]}")
+        return run
+
+    return setup
+
+
+case("export_png")(bench_export("png"))
+case("export_pdf")(bench_export("pdf"))
+
+
+def measure(run: Callable[[], object], repeat: int, min_time: float) -> dict:
+    """
+    Time `run` after one warm-up call, at least `repeat` times and for at least
+    `min_time` seconds
+    Returns:
+        timings in milliseconds
+    """
+    run()
+    times = []
+    start = perf_counter()
+    while len(times) < repeat or perf_counter() - start < min_time:
+        call_start = perf_counter()
+        run()
+        times.append((perf_counter() - call_start) * 1000)
+    return {
+        "runs": len(times),
+        "min_ms": min(times),
+        "median_ms": statistics.median(times),
+        "mean_ms": statistics.fmean(times),
+    }
+
+
+def matches(name: str, pattern: str) -> bool:
+    """
+    Whether a case name matches a glob pattern, brackets matching themselves as
+    they do in case names such as `compute_history_csv[1000]`
+    """
+    return fnmatch.fnmatchcase(name, pattern.replace("[", "[[]"))
+
+
+def run_suite(patterns: list[str], repeat: int, min_time: float) -> dict:
+    """
+    Run the cases matching any of `patterns`
+    Returns:
+        the results with the environment they were measured in
+    """
+    results = {}
+    for name, setup in CASES.items():
+        if not any(matches(name, pattern) for pattern in patterns):
+            continue
+        try:
+            result = measure(setup(), repeat, min_time)
+        except SkipCase as e:
+            result = {"skipped": str(e)}
+            print(f"{name:<32} skipped, {e}")
+        else:
+            print(
+                f"{name:<32} {result['median_ms']:10.3f} ms median "
+                f"({result['runs']} runs)"
+            )
+        results[name] = result
+
+    return {"environment": environment(), "results": results}
+
+
+def environment() -> dict:
+    packages = {}
+    for package in PACKAGES:
+        try:
+            packages[package] = version(package)
+        except PackageNotFoundError:
+            packages[package] = None
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packages": packages,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Print the change of every case against the baseline
+    Returns:
+        the cases whose median is slower than the baseline by more than `threshold`
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or "median_ms" not in base or "median_ms" not in result:
+            print(f"{name:<32} not compared")
+            continue
+
+        ratio = result["median_ms"] / base["median_ms"]
+        status = "ok"
+        if ratio > 1 + threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            status = "faster"
+        print(
+            f"{name:<32} {base['median_ms']:10.3f} -> {result['median_ms']:10.3f} ms "
+            f"({ratio:5.2f}x) {status}"
+        )
+
+    changed = [
+        package
+        for package, installed in current["environment"]["packages"].items()
+        if baseline["environment"]["packages"].get(package) != installed
+    ]
+    for package in changed:
+        print(
+            f"{package} changed: {baseline['environment']['packages'].get(package)} "
+            f"-> {current['environment']['packages'][package]}"
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the calculator, figures, exports and history"
+    )
+    parser.add_argument(
+        "-k",
+        "--cases",
+        nargs="*",
+        default=["*"],
+        help="glob patterns of the cases to run, * and ? as wildcards (default: all)",
+    )
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--results", help="compare these JSON results instead of running the suite"
+    )
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--repeat", type=int, default=5, help="least runs per case")
+    parser.add_argument(
+        "--min-time", type=float, default=0.5, help="least seconds per case"
+    )
+    parser.add_argument("--list", action="store_true", help="list the cases")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(CASES))
+        raise SystemExit
+
+    if args.results:
+        with open(args.results) as f:
+            current = json.load(f)
+    else:
+        current = run_suite(args.cases, args.repeat, args.min_time)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            raise SystemExit(1)
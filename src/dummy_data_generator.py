@@ -1,7 +1,10 @@
-from random import choice
-from emission_calculator.calculator import make_dataframe, dataframe_to_dict
-from pandas import DataFrame
-from csv import DictWriter
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from emission_calculator.calculator import make_batch_dataframe
+from pandas import DataFrame, Series
 
 company_types = ["small", "medium", "large"]
 
@@ -90,29 +93,143 @@ def vehicle_fuel_efficiency(company_type: str) -> range:
         return range(9, 15)
 
 
-def generate_dummy_data(company_count: int = 10):
-    data: list[dict] = []
-    for i in range(company_count):
-        company_type = company_types[choice(range(len(company_types)))]
-        df: DataFrame = make_dataframe(
-            company_name=f"Company {i+1}",
-            avg_electric_bill=choice(avg_electric_bill(company_type)),
-            avg_gas_bill=choice(avg_gas_bill(company_type)),
-            avg_transport_bill=choice(avg_transport_cost(company_type)),
-            monthly_waste_generated=choice(waste_generated(company_type)),
-            recycled_waste_percent=choice(recycled_waste(company_type)),
-            annual_travel_kms=choice(travel_kms(company_type)),
-            fuel_efficiency=choice(vehicle_fuel_efficiency(company_type)),
-        )
-        data.append(dataframe_to_dict(df))
-
-    with open("./reports/dummy_data.csv", "w") as f:
-        w = DictWriter(f, fieldnames=data[0].keys())
-        w.writeheader()
-        w.writerows(data)
+# calculator input -> sampling range per company size
+INPUT_RANGES = {
+    "avg_electric_bill": avg_electric_bill,
+    "avg_gas_bill": avg_gas_bill,
+    "avg_transport_bill": avg_transport_cost,
+    "monthly_waste_generated": waste_generated,
+    "recycled_waste_percent": recycled_waste,
+    "annual_travel_kms": travel_kms,
+    "fuel_efficiency": vehicle_fuel_efficiency,
+}
+DUMMY_DATA_PATH = "./reports/dummy_data.csv"
+CHUNK_SIZE = 100_000
+FORMATS = ("csv", "parquet")
+
+
+def sample_inputs(rng: np.random.Generator, start: int, stop: int) -> DataFrame:
+    """
+    Calculator inputs for companies `start + 1` to `stop`, each of a random size
+    """
+    count = stop - start
+    tiers = rng.integers(0, len(company_types), count)
+    inputs = {
+        "company_name": "Company " + Series(np.arange(start + 1, stop + 1)).astype(str)
+    }
+    for column, value_range in INPUT_RANGES.items():
+        ranges = [value_range(company_type) for company_type in company_types]
+        low = np.array([r.start for r in ranges])[tiers]
+        high = np.array([r.stop for r in ranges])[tiers]
+        inputs[column] = rng.integers(low, high)
+    return DataFrame(inputs)
+
+
+def generate_chunk(seed: int, index: int, company_count: int, chunk_size: int):
+    """
+    Emissions of the companies in chunk `index`, the same for a given seed no
+    matter which process generates it
+    """
+    start = index * chunk_size
+    stop = min(start + chunk_size, company_count)
+    rng = np.random.default_rng([seed, index])
+    return make_batch_dataframe(sample_inputs(rng, start, stop))
+
+
+def _encode_chunk(
+    seed: int, index: int, company_count: int, chunk_size: int, format: str
+):
+    df = generate_chunk(seed, index, company_count, chunk_size)
+    if format == "csv":
+        return df.to_csv(header=index == 0, index=False).encode("utf-8")
+
+    import pyarrow as pa
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def generate_dummy_data(
+    company_count: int = 10,
+    path: str = DUMMY_DATA_PATH,
+    seed: int | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    format: str = "csv",
+    workers: int = 1,
+) -> int:
+    """
+    Stream synthetic company emissions to a CSV or Parquet file, `chunk_size`
+    companies at a time, optionally generated across `workers` processes.
+    The output only depends on `seed`, `company_count` and `chunk_size`.
+    Returns:
+        the seed used
+    """
+    if format not in FORMATS:
+        raise Exception(f"Format must be one of {FORMATS}")
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2**32)
+
+    chunk_count = -(-company_count // chunk_size)
+    jobs = [
+        (seed, index, company_count, chunk_size, format) for index in range(chunk_count)
+    ]
+
+    writer = None
+    with open(path, "wb") as f:
+        for chunk in _run_jobs(jobs, workers):
+            if format == "csv":
+                f.write(chunk)
+                continue
+
+            import pyarrow.parquet as pq
+
+            if writer is None:
+                writer = pq.ParquetWriter(f, chunk.schema)
+            writer.write_table(chunk)
+        if writer is not None:
+            writer.close()
+
+    return seed
+
+
+def _run_jobs(jobs: list[tuple], workers: int):
+    """
+    Yields the encoded chunks in order, with at most two chunks per worker in memory
+    """
+    if workers <= 1:
+        for job in jobs:
+            yield _encode_chunk(*job)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for job in jobs:
+            pending.append(executor.submit(_encode_chunk, *job))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
 
 if __name__ == "__main__":
-    n = int(input("Enter number of companies: "))
-    generate_dummy_data(company_count=n)
-    print("Done!")
+    parser = argparse.ArgumentParser(description="Generate dummy company data")
+    parser.add_argument(
+        "-n", "--count", type=int, default=10, help="number of companies"
+    )
+    parser.add_argument("-o", "--output", default=DUMMY_DATA_PATH, help="output file")
+    parser.add_argument("--seed", type=int, help="seed, random when not given")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="processes generating chunks"
+    )
+    args = parser.parse_args()
+
+    seed = generate_dummy_data(
+        company_count=args.count,
+        path=args.output,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+        format=args.format,
+        workers=args.workers,
+    )
+    print(f"Done! (seed {seed})")
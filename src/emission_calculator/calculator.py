@@ -1,12 +1,72 @@
+from collections.abc import Mapping
+from copy import deepcopy
+from functools import cache
+from typing import TYPE_CHECKING
+
+import numpy as np
+from numpy.typing import ArrayLike
 from pandas import DataFrame
 
-from plotly.subplots import make_subplots
-from plotly.graph_objects import Figure, Pie, Bar, Scatter, Scatterpolar
+from emission_calculator.factors import FACTOR_SET, FactorSet, current_factors
 
+# plotly is slow to import, it is only loaded once a figure is drawn
+if TYPE_CHECKING:
+    from plotly.graph_objects import Figure
+
+    from history.rollups import HistoryRollup
+
+# emissions (kgCO2) above which a recommendation is shown, per category
+REPORT_THRESHOLD = (15_000, 5_000, 15_000)
+
+CATEGORIES = ["Energy Usage", "Waste Generated", "Business Travel"]
+# calculator inputs, in the order of the make_dataframe arguments
+INPUT_COLUMNS = [
+    "avg_electric_bill",
+    "avg_gas_bill",
+    "avg_transport_bill",
+    "monthly_waste_generated",
+    "recycled_waste_percent",
+    "annual_travel_kms",
+    "fuel_efficiency",
+]
+
+# above this many companies the historic figure is aggregated
+HISTORY_ROW_THRESHOLD = 200
+HISTORY_MAX_POINTS = 1000
+HISTORY_TOP_COMPANIES = 10
+
+
+# style of the recommendation boxes of the report
+RECOMMENDATION_STYLE = dict(
+    xref="paper",
+    yref="paper",
+    x=0,
+    showarrow=False,
+    font=dict(size=12),
+    align="center",
+    bordercolor="black",
+    borderwidth=1,
+    borderpad=10,
+    bgcolor="lightyellow",
+)
+RECOMMENDATION_TEXTS = [
+    "- Reduce energy usage by adopting energy-efficient practices.\n",
+    "- Minimize waste by recycling and using sustainable materials.\n",
+    "- Limit business travel and opt for virtual meetings where possible.",
+]
+
+
+@cache
+def report_template() -> dict:
+    """
+    The report figure without its data: subplots, traces styling and layout.
+    Built and validated once, `draw_report_figure` only fills in the data.
+    Returns:
+        the template as a plotly figure dict, which must not be modified
+    """
+    from plotly.graph_objects import Bar, Pie
+    from plotly.subplots import make_subplots
 
-def draw_report_figure(
-    df: DataFrame, threshold: tuple[float] = [15_000, 5_000, 15_000]
-) -> Figure:
     figure_specs = [
         [{"type": "xy"}, {"type": "domain"}],
         [{"type": "xy"}, {"type": "xy"}],
@@ -23,13 +83,9 @@ def draw_report_figure(
     )
 
     # Pie chart settings
-    pie_pull = [0.15 if x == min(df["Value"]) else 0.0 for x in df["Value"]]
     fig.add_trace(
         Pie(
-            values=df["Value"],
-            labels=df["Category"],
             hole=0.3,
-            pull=pie_pull,
             name="Emission Distribution",
             marker={"colors": ["#6DA34D", "#81C3D7", "#FFC857"]},
         ),
@@ -40,8 +96,6 @@ def draw_report_figure(
     # Bar chart for emissions by category
     fig.add_trace(
         Bar(
-            x=df["Category"],
-            y=df["Value"],
             name="Carbon Emission (kgCO2)",
             marker_color=["#6DA34D", "#81C3D7", "#FFC857"],
         ),
@@ -49,22 +103,8 @@ def draw_report_figure(
         col=1,
     )
 
-    # Annotation for highest emission
-    fig.add_annotation(
-        x=df["Category"][df["Value"].idxmax()],
-        y=df["Value"].max(),
-        text="Highest Emission",
-        showarrow=True,
-        arrowhead=1,
-        ax=0,
-        ay=-40,
-        row=1,
-        col=1,
-    )
-
     # Update layout for axes and overall layout
     fig.update_layout(
-        title_text=f"Carbon Footprint of {df['Name'][0]}",
         plot_bgcolor="white",
         legend_title_text="Breakdown",
         xaxis_title="Emission Category",
@@ -99,57 +139,174 @@ def draw_report_figure(
         gridcolor="lightgrey",
     )
 
+    return fig.to_dict()
+
+
+def draw_report_figure(
+    df: DataFrame, threshold: tuple[float] = REPORT_THRESHOLD
+) -> "Figure":
+    """
+    The report of one company, the `report_template` filled with its emissions.
+    The template is already valid and the data is known to be, so the figure is
+    built without running the plotly validators again.
+    """
+    spec = deepcopy(report_template())
+    pie, bar = spec["data"]
+    layout = spec["layout"]
+
+    categories = df["Category"].tolist()
+    values = df["Value"].to_numpy()
+    pie.update(
+        values=values,
+        labels=categories,
+        pull=[0.15 if x == values.min() else 0.0 for x in values],
+    )
+    bar.update(x=categories, y=values)
+    layout["title"] = {"text": f"Carbon Footprint of {df['Name'][0]}"}
+
+    # Annotation for highest emission
+    annotations = layout["annotations"]
+    annotations.append(
+        dict(
+            x=categories[values.argmax()],
+            y=values.max(),
+            text="Highest Emission",
+            showarrow=True,
+            arrowhead=1,
+            ax=0,
+            ay=-40,
+            xref="x",
+            yref="y",
+        )
+    )
+
     # Add a single general recommendation text box
-    e, w, b = df["Value"]
+    e, w, b = values
     threshold_values = [e >= threshold[0], w >= threshold[1], b >= threshold[2]]
-    recommendations = []
-    texts = [
-        "- Reduce energy usage by adopting energy-efficient practices.\n",
-        "- Minimize waste by recycling and using sustainable materials.\n",
-        "- Limit business travel and opt for virtual meetings where possible."
+    recommendations = [
+        text for text, above in zip(RECOMMENDATION_TEXTS, threshold_values) if above
     ]
-    if any(threshold_values):
-        fig.add_annotation(
-            text=("Recommendations to reduce carbon footprint:\n"),
-            xref="paper",
-            yref="paper",
-            x=0,
-            y=0.2,  # Positioning inside the plot area, just below center
-            showarrow=False,
-            font=dict(size=12),
-            align="center",
-            bordercolor="black",
-            borderwidth=1,
-            borderpad=10,
-            bgcolor="lightyellow",
+    if recommendations:
+        annotations.append(
+            dict(
+                text="Recommendations to reduce carbon footprint:\n",
+                y=0.2,  # Positioning inside the plot area, just below center
+                **RECOMMENDATION_STYLE,
+            )
         )
-        if threshold_values[0]:
-            recommendations.append(texts[0]) 
-        if threshold_values[1]:
-            recommendations.append(texts[1])
-        if threshold_values[2]:
-            recommendations.append(texts[2]) 
-
     for i, text in enumerate(recommendations):
-        fig.add_annotation(
-            text=(text),
-            xref="paper",
-            yref="paper",
-            x=0,
-            y=(i + 1) * 0.05,  # Positioning inside the plot area, just below center
-            showarrow=False,
-            font=dict(size=12),
-            align="center",
-            bordercolor="black",
-            borderwidth=1,
-            borderpad=10,
-            bgcolor="lightyellow",
+        annotations.append(dict(text=text, y=(i + 1) * 0.05, **RECOMMENDATION_STYLE))
+
+    from plotly.graph_objects import Figure
+
+    return Figure(spec, _validate=False)
+
+
+def lttb_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling of evenly spaced points.
+    Keeps the first and last point and, per bucket, the point spanning the
+    largest triangle with its neighbours, which preserves peaks and troughs.
+    Returns:
+        sorted indices of the `n_out` points to keep
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # average of the next bucket, the last point for the last bucket
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = (end + next_end - 1) / 2
+        next_y = y[end:next_end].mean()
+
+        xs = np.arange(start, end)
+        areas = np.abs(
+            (previous - next_x) * (y[start:end] - y[previous])
+            - (previous - xs) * (next_y - y[previous])
         )
+        previous = start + int(areas.argmax())
+        indices[i + 1] = previous
 
-    return fig
+    return indices
+
+
+def draw_historic_figure(
+    df: DataFrame,
+    max_rows: int = HISTORY_ROW_THRESHOLD,
+    max_points: int = HISTORY_MAX_POINTS,
+    top_n: int = HISTORY_TOP_COMPANIES,
+) -> "Figure":
+    """
+    Above `max_rows` companies the figure is aggregated so its size stays bounded:
+    the area chart is downsampled to `max_points` with LTTB, and the radar chart
+    shows the `top_n` largest footprints over the 10th-90th percentile band.
+    """
+    # Calculate each company's total carbon footprint as the sum of the three metrics,
+    # unless the history backend already computed it
+    if "Carbon Footprint" not in df.columns:
+        df = df.assign(
+            **{
+                "Carbon Footprint": df["Energy Usage"]
+                + df["Waste Generated"]
+                + df["Business Travel"]
+            }
+        )
+    if len(df) <= max_rows:
+        return _historic_figure(df, df)
+
+    line = df.iloc[lttb_indices(df["Carbon Footprint"].to_numpy(), max_points)]
+    # percentile band of every company, drawn below the largest footprints
+    band = np.percentile(df[CATEGORIES].to_numpy(), [10, 50, 90], axis=0)
+    return _historic_figure(
+        line,
+        df.nlargest(top_n, "Carbon Footprint"),
+        band=band,
+        radial_range=[df[CATEGORIES].values.min(), df[CATEGORIES].values.max()],
+    )
 
 
-def draw_historic_figure(df: DataFrame) -> Figure:
+def draw_rollup_figure(rollup: "HistoryRollup") -> "Figure":
+    """
+    The historic figure from the precomputed aggregates of the history: every
+    company while there are few, otherwise the decimated footprint line, the
+    percentile band and the largest footprints kept by the rollup
+    """
+    rows = rollup.rows()
+    if rows is not None:
+        return draw_historic_figure(rows, max_rows=rollup.max_rows)
+
+    categories = len(CATEGORIES)
+    return _historic_figure(
+        rollup.line(),
+        rollup.top,
+        band=rollup.percentiles([10, 50, 90])[:categories].T,
+        radial_range=[
+            rollup.minimum[:categories].min(),
+            rollup.maximum[:categories].max(),
+        ],
+    )
+
+
+def _historic_figure(
+    line: DataFrame,
+    companies: DataFrame,
+    band: np.ndarray | None = None,
+    radial_range: list[float] | None = None,
+) -> "Figure":
+    """
+    The footprint `line` over the companies and a radar chart of `companies`,
+    drawn over the 10th, 50th and 90th percentiles of `band` when given
+    """
+    from plotly.graph_objects import Scatter, Scatterpolar
+    from plotly.subplots import make_subplots
+
     # Create subplots with 2 rows and 1 column
     fig = make_subplots(
         rows=2,
@@ -162,16 +319,11 @@ def draw_historic_figure(df: DataFrame) -> Figure:
         row_heights=[0.6, 0.4],
     )
 
-    # Calculate each company's total carbon footprint as the sum of the three metrics
-    df["Carbon Footprint"] = (
-        df["Energy Usage"] + df["Waste Generated"] + df["Business Travel"]
-    )
-
     # Add gradient-filled area trace for the Carbon Footprint
     fig.add_trace(
         Scatter(
-            x=df["Name"],
-            y=df["Carbon Footprint"],
+            x=line["Name"],
+            y=line["Carbon Footprint"],
             mode="lines",
             fill="tozeroy",
             line=dict(color="blue"),
@@ -183,8 +335,28 @@ def draw_historic_figure(df: DataFrame) -> Figure:
     )
 
     # Prepare data for radar chart (normalizing values for better comparability)
-    categories = ["Energy Usage", "Waste Generated", "Business Travel"]
-    for _, company in df.iterrows():
+    categories = CATEGORIES
+    if band is not None:
+        low, median, high = band
+        for name, values, fill in [
+            ("90th percentile", high, "toself"),
+            ("10th percentile", low, "tonext"),
+            ("Median", median, "none"),
+        ]:
+            fig.add_trace(
+                Scatterpolar(
+                    r=[*values, values[0]],
+                    theta=categories + [categories[0]],
+                    fill=fill,
+                    fillcolor="rgba(128, 128, 128, 0.2)",
+                    line=dict(color="grey", dash="dot"),
+                    name=name,
+                ),
+                row=2,
+                col=1,
+            )
+
+    for _, company in companies.iterrows():
         fig.add_trace(
             Scatterpolar(
                 r=[
@@ -216,19 +388,82 @@ def draw_historic_figure(df: DataFrame) -> Figure:
     fig.update_yaxes(title_text="Carbon Footprint (total)", row=1, col=1)
 
     # Customize polar (radar) chart layout
-    fig.update_polars(
-        radialaxis=dict(
-            visible=True,
-            range=[
-                df[categories].values.min(),
-                df[categories].values.max(),
-            ],
+    if radial_range is None and not companies.empty:
+        radial_range = [
+            companies[categories].values.min(),
+            companies[categories].values.max(),
+        ]
+    if radial_range is not None:
+        fig.update_polars(radialaxis=dict(visible=True, range=radial_range))
+
+    return fig
+
+
+def draw_company_trend(df: DataFrame, name: str) -> "Figure":
+    """
+    Emissions of the submissions of one company over time, per category and in
+    total. Submissions without a time are placed by their order.
+    """
+    from plotly.graph_objects import Figure, Scatter
+
+    x = np.arange(1, len(df) + 1)
+    x_title = "Submission"
+    if "Submitted At" in df.columns and df["Submitted At"].notna().all():
+        x = df["Submitted At"]
+        x_title = "Submitted At"
+
+    fig = Figure()
+    for category in CATEGORIES:
+        fig.add_trace(
+            Scatter(x=x, y=df[category], mode="lines+markers", name=category)
+        )
+    fig.add_trace(
+        Scatter(
+            x=x,
+            y=df[CATEGORIES].sum(axis=1),
+            mode="lines+markers",
+            line=dict(color="black", dash="dash"),
+            name="Carbon Footprint",
         )
     )
-
+    fig.update_layout(
+        title=f"Carbon Footprint of {name}",
+        template="plotly_white",
+        xaxis_title=x_title,
+        yaxis_title="Emissions (kgCO2)",
+    )
     return fig
 
 
+def emission_values(
+    avg_electric_bill: float | np.ndarray,
+    avg_gas_bill: float | np.ndarray,
+    avg_transport_bill: float | np.ndarray,
+    monthly_waste_generated: float | np.ndarray,
+    recycled_waste_percent: float | np.ndarray,
+    annual_travel_kms: float | np.ndarray,
+    fuel_efficiency: float | np.ndarray,
+    factors: FactorSet | None = None,
+) -> tuple:
+    """
+    Emissions (kgCO2) per category, for single values or NumPy arrays of them,
+    with the current factor set unless `factors` is given
+    Returns:
+        energy_usage, waste_generated, business_travel
+    """
+    f = factors or current_factors()
+    energy_usage = (
+        (avg_electric_bill * 12 * f.electricity)
+        + (avg_gas_bill * 12 * f.gas)
+        + (avg_transport_bill * 12 * f.transport)
+    )
+    waste_generated = (
+        monthly_waste_generated * 12 * f.waste - recycled_waste_percent * f.recycling
+    )
+    business_travel = annual_travel_kms * 1 / fuel_efficiency * f.travel
+    return energy_usage, waste_generated, business_travel
+
+
 def make_dataframe(
     company_name: str,
     avg_electric_bill: float,
@@ -238,24 +473,81 @@ def make_dataframe(
     recycled_waste_percent: float,
     annual_travel_kms: float,
     fuel_efficiency: float,
+    factors: FactorSet | None = None,
 ) -> DataFrame:
-    energy_usage = (
-        (avg_electric_bill * 12 * 5e-4)
-        + (avg_gas_bill * 12 * 5.3e-3)
-        + (avg_transport_bill * 12 * 2.32)
+    energy_usage, waste_generated, business_travel = emission_values(
+        avg_electric_bill=avg_electric_bill,
+        avg_gas_bill=avg_gas_bill,
+        avg_transport_bill=avg_transport_bill,
+        monthly_waste_generated=monthly_waste_generated,
+        recycled_waste_percent=recycled_waste_percent,
+        annual_travel_kms=annual_travel_kms,
+        fuel_efficiency=fuel_efficiency,
+        factors=factors,
     )
-    waste_generated = monthly_waste_generated * 12 * 0.57 - recycled_waste_percent
-    business_travel = annual_travel_kms * 1 / fuel_efficiency * 2.31
 
     return DataFrame(
         {
             "Name": company_name,
-            "Category": ["Energy Usage", "Waste Generated", "Business Travel"],
+            "Category": CATEGORIES,
             "Value": [energy_usage, waste_generated, business_travel],
         }
     )
 
 
+def make_batch_dataframe(
+    inputs: DataFrame | Mapping[str, ArrayLike], factors: FactorSet | None = None
+) -> DataFrame:
+    """
+    Emissions for many companies in one vectorized pass.
+    `inputs` holds a `company_name` column and one column per make_dataframe argument.
+    Returns:
+        wide DataFrame with the columns of historic_data.csv, one row per company:
+        the emissions, the inputs they were computed from and the factor set used
+    """
+    factors = factors or current_factors()
+    columns = {
+        column: np.asarray(inputs[column], dtype=np.float64) for column in INPUT_COLUMNS
+    }
+    values = emission_values(**columns, factors=factors)
+
+    return DataFrame(
+        {
+            "Name": np.asarray(inputs["company_name"], dtype=object),
+            **dict(zip(CATEGORIES, values)),
+            **columns,
+            FACTOR_SET: factors.id,
+        }
+    )
+
+
+def rescore(df: DataFrame, factors: FactorSet) -> DataFrame:
+    """
+    History rows scored again under `factors` in one vectorized pass, from the
+    inputs kept with them. Rows saved without their inputs keep their emissions.
+    Returns:
+        a copy of `df`, with its emissions, footprint and factor set replaced
+    """
+    df = df.copy()
+    if df.empty or any(column not in df.columns for column in INPUT_COLUMNS):
+        return df
+
+    inputs = {
+        column: df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        for column in INPUT_COLUMNS
+    }
+    known = ~np.isnan(np.column_stack(list(inputs.values()))).any(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = emission_values(**inputs, factors=factors)
+    for category, value in zip(CATEGORIES, values):
+        df[category] = np.where(known, value, df[category].to_numpy(dtype=np.float64))
+    if "Carbon Footprint" in df.columns:
+        df["Carbon Footprint"] = df[CATEGORIES].sum(axis=1)
+    if FACTOR_SET in df.columns:
+        df[FACTOR_SET] = np.where(known, factors.id, df[FACTOR_SET].to_numpy(object))
+    return df
+
+
 def dataframe_to_dict(df: DataFrame) -> dict:
     return {
         "Name": df["Name"][0],
@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import os.path as os_path
+import threading
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# extra factor sets, a JSON list of FactorSet fields
+FACTORS_PATH = os.environ.get("EMISSION_FACTORS_PATH", "./reports/factors.json")
+# factor set new submissions are scored with, as "name@version"
+CURRENT_FACTORS = os.environ.get("EMISSION_FACTORS", "default@1")
+
+# history column of the factor set a row was scored with
+FACTOR_SET = "Factor Set"
+
+
+@dataclass(frozen=True)
+class FactorSet:
+    """
+    Emission factors of the calculator formulas, in kgCO2 per unit.
+    A set is identified by name and version, and never changes once registered:
+    new factors are registered as a new version.
+    """
+
+    name: str
+    version: int
+    # per € of monthly electricity, gas and transport fuel bill
+    electricity: float
+    gas: float
+    transport: float
+    # per kg of monthly waste
+    waste: float
+    # subtracted per recycled percent
+    recycling: float
+    # per litre of fuel used for business travel
+    travel: float
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}@{self.version}"
+
+
+DEFAULT_FACTORS = FactorSet(
+    name="default",
+    version=1,
+    electricity=5e-4,
+    gas=5.3e-3,
+    transport=2.32,
+    waste=0.57,
+    recycling=1.0,
+    travel=2.31,
+)
+
+_registry: dict[str, FactorSet] = {DEFAULT_FACTORS.id: DEFAULT_FACTORS}
+_registry_lock = threading.Lock()
+_loaded = False
+
+
+def register(factors: FactorSet) -> None:
+    """
+    Add a factor set, an id already registered with other factors is refused
+    """
+    with _registry_lock:
+        existing = _registry.get(factors.id)
+        if existing is not None and existing != factors:
+            raise ValueError(
+                f"Factor set {factors.id} is already registered with other "
+                "factors, register them as a new version"
+            )
+        _registry[factors.id] = factors
+
+
+def load_factor_sets(path: str = FACTORS_PATH) -> int:
+    """
+    Register the factor sets of a JSON file, when it exists
+    Returns:
+        number of factor sets read
+    """
+    if not os_path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    for entry in entries:
+        register(FactorSet(**entry))
+    return len(entries)
+
+
+def factor_sets() -> dict[str, FactorSet]:
+    """
+    Returns:
+        id -> factor set, of the built-in sets and those of FACTORS_PATH
+    """
+    global _loaded
+    if not _loaded:
+        try:
+            load_factor_sets()
+        except Exception as e:
+            logger.warning("Could not load the factor sets of %s: %s", FACTORS_PATH, e)
+        _loaded = True
+    with _registry_lock:
+        return dict(_registry)
+
+
+def get_factors(factor_id: str) -> FactorSet:
+    factors = factor_sets().get(factor_id)
+    if factors is None:
+        raise KeyError(f"Unknown factor set: {factor_id}")
+    return factors
+
+
+def current_factors() -> FactorSet:
+    """
+    The factor set selected by EMISSION_FACTORS
+    """
+    return get_factors(CURRENT_FACTORS)
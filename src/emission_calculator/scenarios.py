@@ -0,0 +1,249 @@
+import os
+from collections.abc import Mapping
+from typing import TYPE_CHECKING
+
+import numpy as np
+from numpy.typing import ArrayLike
+from pandas import DataFrame
+
+from emission_calculator.calculator import CATEGORIES, INPUT_COLUMNS, emission_values
+
+# plotly is slow to import, it is only loaded once a figure is drawn
+if TYPE_CHECKING:
+    from plotly.graph_objects import Figure
+
+# most scenarios evaluated by one sweep
+MAX_SCENARIOS = int(os.environ.get("MAX_SCENARIOS", 5_000_000))
+# bars of the footprint distribution, however many scenarios there are
+HISTOGRAM_BINS = 60
+PERCENTILES = [5, 25, 50, 75, 95]
+
+INPUT_LABELS = {
+    "avg_electric_bill": "Electricity Bill",
+    "avg_gas_bill": "Gas Bill",
+    "avg_transport_bill": "Transport Cost",
+    "monthly_waste_generated": "Monthly Waste",
+    "recycled_waste_percent": "Recycled Waste",
+    "annual_travel_kms": "Annual Travel Distance",
+    "fuel_efficiency": "Fuel Efficiency",
+}
+
+# Scenarios are relative changes of the calculator inputs: a delta of -0.2
+# lowers an input by 20%. Deltas of a sweep are arrays broadcasting to the
+# shape of the sweep, so a grid never materializes one array per input.
+
+
+def grid_deltas(steps: Mapping[str, ArrayLike]) -> dict[str, np.ndarray]:
+    """
+    Every combination of the given deltas of each input
+    Returns:
+        input -> deltas, broadcasting to a grid with one axis per input
+    """
+    grids = np.meshgrid(
+        *[np.asarray(values, dtype=np.float64) for values in steps.values()],
+        indexing="ij",
+        sparse=True,
+    )
+    return dict(zip(steps, grids))
+
+
+def sample_deltas(
+    ranges: Mapping[str, tuple[float, float]], count: int, seed: int | None = None
+) -> dict[str, np.ndarray]:
+    """
+    Monte Carlo scenarios, each input changed uniformly within its (low, high)
+    Returns:
+        input -> `count` deltas
+    """
+    rng = np.random.default_rng(seed)
+    return {
+        column: rng.uniform(low, high, count) for column, (low, high) in ranges.items()
+    }
+
+
+def scenario_count(deltas: Mapping[str, np.ndarray]) -> int:
+    return int(np.prod(np.broadcast_shapes(*(np.shape(d) for d in deltas.values()))))
+
+
+def evaluate_scenarios(
+    base: Mapping[str, float], deltas: Mapping[str, np.ndarray]
+) -> np.ndarray:
+    """
+    The formulas of make_dataframe over every scenario at once, inputs without
+    deltas are kept at their base value
+    Returns:
+        emissions (kgCO2) per category, of shape (3, *shape of the scenarios)
+    """
+    inputs = {
+        column: (
+            base[column] * (1 + deltas[column]) if column in deltas else base[column]
+        )
+        for column in INPUT_COLUMNS
+    }
+    values = emission_values(**inputs)
+    shape = np.broadcast_shapes(*(np.shape(value) for value in values))
+    return np.stack([np.broadcast_to(value, shape) for value in values])
+
+
+def baseline_footprint(base: Mapping[str, float]) -> float:
+    return float(evaluate_scenarios(base, {}).sum())
+
+
+def tornado_table(
+    base: Mapping[str, float], ranges: Mapping[str, tuple[float, float]]
+) -> DataFrame:
+    """
+    The footprint with one input at a time at its low and high delta, the
+    others at their base values
+    Returns:
+        one row per input, the widest swing first
+    """
+    columns = list(ranges)
+    deltas = {column: np.zeros(2 * len(columns) + 1) for column in columns}
+    for i, column in enumerate(columns):
+        deltas[column][2 * i : 2 * i + 2] = ranges[column]
+    # the last scenario has no change, it is the baseline
+    footprint = evaluate_scenarios(base, deltas).sum(axis=0)
+    baseline = footprint[-1]
+    low, high = footprint[:-1:2], footprint[1:-1:2]
+
+    table = DataFrame(
+        {
+            "Input": [INPUT_LABELS[column] for column in columns],
+            "Low Change (%)": [ranges[column][0] * 100 for column in columns],
+            "High Change (%)": [ranges[column][1] * 100 for column in columns],
+            "Footprint at Low": low,
+            "Footprint at High": high,
+            "Low - Baseline": low - baseline,
+            "High - Baseline": high - baseline,
+            "Swing": np.abs(high - low),
+        }
+    )
+    return table.sort_values("Swing", ascending=False, ignore_index=True)
+
+
+def sensitivity_table(
+    base: Mapping[str, float], deltas: Mapping[str, np.ndarray], emissions: np.ndarray
+) -> DataFrame:
+    """
+    How the footprint responds to each input: its change when that input alone
+    rises by 1% from its base value, the others held, the correlation of the
+    input's deltas with the footprint over the scenarios, and the share of the
+    spread of the footprint its changes explain
+    Returns:
+        one row per input, the most influential first
+    """
+    columns = list(deltas)
+    # one scenario per input raised by 1%, the last one is the baseline
+    steps = {column: np.zeros(len(columns) + 1) for column in columns}
+    for i, column in enumerate(columns):
+        steps[column][i] = 0.01
+    stepped = evaluate_scenarios(base, steps).sum(axis=0)
+    slopes = stepped[:-1] - stepped[-1]
+
+    footprint = emissions.sum(axis=0)
+    y = footprint.ravel()
+    y_centered = y - y.mean()
+    y_std = y.std()
+    correlations = []
+    for column in columns:
+        x = np.broadcast_to(deltas[column], footprint.shape).ravel()
+        x_std = x.std()
+        covariance = np.dot(x - x.mean(), y_centered) / len(y)
+        correlations.append(covariance / (x_std * y_std) if x_std and y_std else 0.0)
+
+    # a grid repeats every delta as often, so its spread is that of its axis
+    spreads = np.array([np.std(deltas[column]) * 100 for column in columns])
+    explained = (slopes * spreads) ** 2
+    table = DataFrame(
+        {
+            "Input": [INPUT_LABELS[column] for column in columns],
+            "kgCO2 per +1%": slopes,
+            "Correlation": correlations,
+            # first order shares, exact for independent inputs and linear formulas
+            "Variance Share (%)": (
+                explained / explained.sum() * 100 if explained.sum() else 0.0
+            ),
+        }
+    )
+    return table.sort_values("Variance Share (%)", ascending=False, ignore_index=True)
+
+
+def summary_table(emissions: np.ndarray) -> DataFrame:
+    """
+    Returns:
+        mean and percentiles of every category and of the footprint
+    """
+    values = np.concatenate(
+        [emissions.reshape(len(CATEGORIES), -1), emissions.sum(axis=0).reshape(1, -1)]
+    )
+    percentiles = np.percentile(values, PERCENTILES, axis=1)
+    table = DataFrame({"Metric": [*CATEGORIES, "Carbon Footprint"]})
+    table["Mean"] = values.mean(axis=1)
+    for q, column in zip(PERCENTILES, percentiles):
+        table[f"p{q}"] = column
+    return table
+
+
+def draw_scenario_figure(
+    tornado: DataFrame, emissions: np.ndarray, baseline: float
+) -> "Figure":
+    """
+    One figure for a whole sweep: the tornado of the inputs and the distribution
+    of the footprint, binned so its size does not grow with the scenarios
+    """
+    from plotly.graph_objects import Bar
+    from plotly.subplots import make_subplots
+
+    fig = make_subplots(
+        rows=1,
+        cols=2,
+        subplot_titles=("Footprint Swing per Input", "Footprint over the Scenarios"),
+        column_widths=[0.5, 0.5],
+    )
+
+    # widest swing at the top
+    tornado = tornado.iloc[::-1]
+    for column, name, color in [
+        ("Low - Baseline", "Low change", "seagreen"),
+        ("High - Baseline", "High change", "indianred"),
+    ]:
+        fig.add_trace(
+            Bar(
+                y=tornado["Input"],
+                x=tornado[column],
+                base=baseline,
+                orientation="h",
+                name=name,
+                marker_color=color,
+            ),
+            row=1,
+            col=1,
+        )
+
+    counts, edges = np.histogram(emissions.sum(axis=0), bins=HISTOGRAM_BINS)
+    fig.add_trace(
+        Bar(
+            x=(edges[:-1] + edges[1:]) / 2,
+            y=counts,
+            width=np.diff(edges),
+            name="Scenarios",
+            marker_color="steelblue",
+        ),
+        row=1,
+        col=2,
+    )
+    fig.add_vline(x=baseline, line_dash="dash", line_color="black", row=1, col=1)
+    fig.add_vline(x=baseline, line_dash="dash", line_color="black", row=1, col=2)
+
+    fig.update_layout(
+        title="What-If Scenarios",
+        template="plotly_white",
+        barmode="overlay",
+        height=500,
+        legend=dict(orientation="h", y=-0.15),
+    )
+    fig.update_xaxes(title_text="Carbon Footprint (kgCO2)", row=1, col=1)
+    fig.update_xaxes(title_text="Carbon Footprint (kgCO2)", row=1, col=2)
+    fig.update_yaxes(title_text="Scenarios", row=1, col=2)
+    return fig
@@ -0,0 +1,127 @@
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+from pandas import DataFrame, Series, to_numeric
+
+# input column -> label used in the error messages, in the order they are checked
+POSITIVE_FIELDS = {
+    "avg_electric_bill": "Electricity Bill",
+    "avg_gas_bill": "Gas Bill",
+    "avg_transport_bill": "Transport Cost",
+    "monthly_waste_generated": "Monthly Waste",
+    "annual_travel_kms": "Annual Travel Distance",
+    "fuel_efficiency": "Fuel Efficiency",
+}
+REQUIRED_COLUMNS = ["company_name", *POSITIVE_FIELDS, "recycled_waste_percent"]
+
+
+def validate_frame(df: DataFrame) -> Series:
+    """
+    The checks of validate_values run column-wise over the rows of a DataFrame
+    Returns:
+        the first error of every row, an empty string for valid rows
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    names = df["company_name"].astype("string").fillna("").tolist()
+    values = {
+        column: to_numeric(df[column], errors="coerce").to_numpy(
+            dtype=np.float64, na_value=np.nan
+        )
+        for column in REQUIRED_COLUMNS[1:]
+    }
+    return Series(validate_values(names, values), index=df.index, dtype=object)
+
+
+def validate_records(
+    records: Sequence[Mapping],
+) -> tuple[list[str], dict[str, np.ndarray], np.ndarray]:
+    """
+    The checks of validate_frame over JSON objects, without building a DataFrame.
+    Missing or non-numeric inputs are read as NaN and reported as invalid.
+    Returns:
+        the company names, input column -> values and the first error of every
+        record, an empty string for valid records
+    """
+    names = [_text(record.get("company_name")) for record in records]
+    values = {
+        column: np.fromiter(
+            (_number(record.get(column)) for record in records),
+            dtype=np.float64,
+            count=len(records),
+        )
+        for column in REQUIRED_COLUMNS[1:]
+    }
+    return names, values, validate_values(names, values)
+
+
+def validate_values(names: list[str], values: Mapping[str, np.ndarray]) -> np.ndarray:
+    """
+    Returns:
+        the first error of every company, an empty string for valid ones
+    """
+    errors = np.full(len(names), "", dtype=object)
+    # companies without an error yet, only their first error is kept
+    pending = np.ones(len(names), dtype=bool)
+
+    def check(mask: np.ndarray, message: str) -> None:
+        failed = pending & mask
+        errors[failed] = message
+        pending[failed] = False
+
+    check(
+        np.fromiter((not name.strip() for name in names), dtype=bool, count=len(names)),
+        "Company name cannot be empty or just whitespace!",
+    )
+    check(
+        np.fromiter((len(name) > 100 for name in names), dtype=bool, count=len(names)),
+        "Company name is too long (maximum 100 characters)!",
+    )
+
+    for column, name in POSITIVE_FIELDS.items():
+        column_values = values[column]
+        check(np.isnan(column_values), f"{name} must be a valid number!")
+        check(
+            column_values <= 0, f"{name} must be a positive number greater than zero!"
+        )
+
+        if column == "avg_electric_bill":
+            check(
+                column_values > 10000,
+                "Electricity bill seems unrealistically high. "
+                "Please check the amount!",
+            )
+        if column == "monthly_waste_generated":
+            check(
+                column_values > 1000,
+                "Monthly waste generation seems extremely high. Please verify!",
+            )
+        if column == "fuel_efficiency":
+            check(
+                column_values < 5,
+                "Fuel efficiency seems unrealistically low. Please verify!",
+            )
+            check(column_values > 15, "Fuel efficiency is very high. Please verify!")
+
+    recycled = values["recycled_waste_percent"]
+    check(np.isnan(recycled), "Recycled waste percentage must be a valid number!")
+    check(
+        (recycled < 0) | (recycled > 100),
+        "Recycled waste percentage must be between 1 and 100!",
+    )
+
+    return errors
+
+
+def _text(value: object) -> str:
+    return "" if value is None else str(value)
+
+
+def _number(value: object) -> float:
+    # as to_numeric(errors="coerce"): numeric strings are read, anything else is NaN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
@@ -0,0 +1,243 @@
+import gzip
+import os
+import os.path as os_path
+import shutil
+import threading
+from datetime import datetime
+
+from pandas import DataFrame, concat, read_csv, to_datetime
+
+from history.name_index import normalize_name
+from history.store import HISTORY_COLUMNS
+
+# partition of the rows saved before their submission time was kept
+UNDATED = "undated"
+SEGMENT = ".csv.gz"
+NAMES = ".names"
+# zlib's default, most of the ratio of the highest level in a fraction of the time
+COMPRESS_LEVEL = 6
+
+
+def partition_of(submitted: datetime | None) -> str:
+    """
+    Returns:
+        the partition of a row submitted at `submitted`, its UTC month as YYYY-MM
+    """
+    if submitted is None or submitted != submitted:
+        return UNDATED
+    return to_datetime(submitted, utc=True).strftime("%Y-%m")
+
+
+class HistoryArchive:
+    """
+    Rows moved out of the live history by compaction, as gzip compressed CSV
+    segments in one directory per month of submission,
+    `<directory>/<YYYY-MM>/<segment>.csv.gz`, rows without a submission time
+    in `undated/`.
+
+    Segments are written once and never changed: every compaction adds new
+    ones, staged outside the partitions and renamed into place once complete.
+    Next to each segment, `<segment>.names` lists the normalized names of its
+    companies, so the rows of one company are only read from its segments.
+    Segments are named so that sorting them lists their rows in submission
+    order.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        # segment path -> the normalized names in it, segments never change
+        self._names: dict[str, frozenset[str]] = {}
+        self._lock = threading.Lock()
+
+    def partitions(self) -> list[str]:
+        """
+        Returns:
+            the partitions, oldest first, undated rows being the oldest
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        partitions = [
+            name
+            for name in names
+            if not name.startswith(".")
+            and os_path.isdir(os_path.join(self.directory, name))
+        ]
+        return sorted(partitions, key=lambda name: (name != UNDATED, name))
+
+    def segments(
+        self, since: datetime | None = None, until: datetime | None = None
+    ) -> list[str]:
+        """
+        Returns:
+            the segments of the partitions that can hold rows submitted in
+            [since, until), in submission order
+        """
+        first = None if since is None else partition_of(since)
+        last = None if until is None else partition_of(until)
+        segments = []
+        for partition in self.partitions():
+            if partition == UNDATED:
+                if first is not None or last is not None:
+                    continue
+            elif (first is not None and partition < first) or (
+                last is not None and partition > last
+            ):
+                continue
+            directory = os_path.join(self.directory, partition)
+            try:
+                names = sorted(os.listdir(directory))
+            except FileNotFoundError:
+                # expired since it was listed
+                continue
+            segments.extend(
+                os_path.join(directory, name)
+                for name in names
+                if name.endswith(SEGMENT)
+            )
+        return segments
+
+    def read(
+        self, since: datetime | None = None, until: datetime | None = None
+    ) -> DataFrame:
+        """
+        Returns:
+            the archived rows of the partitions overlapping [since, until), to
+            be filtered by the caller
+        """
+        return self._read(self.segments(since, until))
+
+    def rows(self, name: str) -> DataFrame:
+        """
+        Returns:
+            the archived rows of a company, matched ignoring case and whitespace,
+            in submission order
+        """
+        key = normalize_name(name)
+        segments = [
+            path for path in self.segments() if key in self._segment_names(path)
+        ]
+        df = self._read(segments)
+        if df.empty:
+            return df
+        return df[df["Name"].map(normalize_name) == key].reset_index(drop=True)
+
+    def stage(self, tag: str) -> str:
+        """
+        Returns:
+            an empty staging directory for the segments of one compaction
+        """
+        staging = os_path.join(self.directory, ".staging", tag)
+        os.makedirs(staging)
+        return staging
+
+    def write_segment(
+        self,
+        staging: str,
+        partition: str,
+        name: str,
+        header: bytes,
+        lines: list[bytes],
+        keys: set[str],
+    ) -> None:
+        """
+        Write history CSV lines, kept byte for byte, as a segment of `partition`
+        into a staging directory, with `keys`, the normalized names of their
+        companies
+        """
+        directory = os_path.join(staging, partition)
+        os.makedirs(directory, exist_ok=True)
+        path = os_path.join(directory, name)
+        # synced, the rows are only in the segment once the live history is replaced
+        with open(f"{path}{SEGMENT}", mode="wb") as f:
+            with gzip.GzipFile(
+                fileobj=f, mode="wb", compresslevel=COMPRESS_LEVEL
+            ) as compressed:
+                compressed.write(header + b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(f"{path}{NAMES}", mode="w", encoding="utf-8") as f:
+            f.write("".join(f"{key}\n" for key in sorted(keys)))
+
+    def publish(self, staging: str) -> int:
+        """
+        Move the segments of a staging directory into their partitions, each
+        segment after its list of companies
+        Returns:
+            number of published segments
+        """
+        published = 0
+        for partition in sorted(os.listdir(staging)):
+            source = os_path.join(staging, partition)
+            if not os_path.isdir(source):
+                continue
+            target = os_path.join(self.directory, partition)
+            os.makedirs(target, exist_ok=True)
+            names = sorted(os.listdir(source), key=lambda name: name.endswith(SEGMENT))
+            for name in names:
+                os.replace(os_path.join(source, name), os_path.join(target, name))
+                published += name.endswith(SEGMENT)
+        shutil.rmtree(staging)
+        return published
+
+    def staged(self) -> list[str]:
+        """
+        Returns:
+            the staging directories left by compactions that did not finish
+        """
+        directory = os_path.join(self.directory, ".staging")
+        try:
+            return [
+                os_path.join(directory, name) for name in sorted(os.listdir(directory))
+            ]
+        except FileNotFoundError:
+            return []
+
+    def expire(self, months: int, now: datetime) -> list[str]:
+        """
+        Keep the partitions of the last `months` calendar months, the month of
+        `now` included, and delete the older ones. Undated rows are kept as
+        their age is unknown
+        Returns:
+            the deleted partitions
+        """
+        now = to_datetime(now, utc=True)
+        # months since year 0 of the oldest month kept
+        index = now.year * 12 + now.month - months
+        oldest = f"{index // 12:04d}-{index % 12 + 1:02d}"
+        expired = [
+            partition
+            for partition in self.partitions()
+            if partition != UNDATED and partition < oldest
+        ]
+        for partition in expired:
+            shutil.rmtree(os_path.join(self.directory, partition))
+        return expired
+
+    def _segment_names(self, path: str) -> frozenset[str]:
+        with self._lock:
+            names = self._names.get(path)
+        if names is None:
+            try:
+                with open(path[: -len(SEGMENT)] + NAMES, encoding="utf-8") as f:
+                    names = frozenset(f.read().splitlines())
+            except FileNotFoundError:
+                # expired since it was listed
+                names = frozenset()
+            with self._lock:
+                self._names[path] = names
+        return names
+
+    def _read(self, segments: list[str]) -> DataFrame:
+        frames = []
+        for path in segments:
+            try:
+                frames.append(read_csv(path))
+            except FileNotFoundError:
+                # expired since it was listed
+                continue
+        if not frames:
+            return DataFrame(columns=HISTORY_COLUMNS)
+        # segments written before columns were added read them as empty
+        return concat(frames, ignore_index=True)
@@ -0,0 +1,346 @@
+import logging
+import os
+import threading
+from collections.abc import Callable
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+
+from pandas import DataFrame, concat, to_datetime
+
+from emission_calculator.calculator import INPUT_COLUMNS, rescore
+from emission_calculator.factors import FactorSet
+from history import retention
+from history.archive import HistoryArchive
+from history.name_index import NameIndex, normalize_name
+from history.retention import RETENTION_INTERVAL, Compaction, RetentionPolicy
+from history.rollups import METRICS, HistoryRollup
+from history.store import HistoryStore, SUBMITTED_AT
+from history.writer import HistoryWriter
+
+if TYPE_CHECKING:
+    from plotly.graph_objects import Figure
+
+logger = logging.getLogger(__name__)
+
+HISTORY_BACKEND = os.environ.get("HISTORY_BACKEND", "csv")
+# columns read for the aggregates, and to score the rows again under other factors
+ROLLUP_COLUMNS = ["Name", *METRICS]
+RESCORE_COLUMNS = [*ROLLUP_COLUMNS, *INPUT_COLUMNS]
+
+
+def stamp(rows: list[dict]) -> list[dict]:
+    """
+    Add the submission time to rows that do not have one yet
+    """
+    now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    return [
+        row if row.get(SUBMITTED_AT) else {**row, SUBMITTED_AT: now} for row in rows
+    ]
+
+
+def filter_history(
+    df: DataFrame,
+    columns: list[str] | None = None,
+    names: list[str] | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> DataFrame:
+    """
+    Apply the `HistoryBackend.read` filters to an in-memory history
+    """
+    mask = None
+    if names is not None:
+        mask = df["Name"].isin(names)
+    if (since is not None or until is not None) and SUBMITTED_AT in df.columns:
+        submitted = to_datetime(df[SUBMITTED_AT], utc=True, errors="coerce")
+        if since is not None:
+            after = submitted >= to_datetime(since, utc=True)
+            mask = after if mask is None else mask & after
+        if until is not None:
+            before = submitted < to_datetime(until, utc=True)
+            mask = before if mask is None else mask & before
+
+    if mask is not None:
+        df = df[mask]
+    if columns is not None:
+        df = df[[column for column in columns if column in df.columns]]
+    return df.copy()
+
+
+class HistoryBackend:
+    """
+    Storage for submitted company rows, shared by `compute` and `compute_history`
+    """
+
+    def __init__(self) -> None:
+        self._figure_lock = threading.Lock()
+        # factor set id, None for the stored emissions -> (aggregates, cursor)
+        self._rollups: dict[str | None, tuple[HistoryRollup, object]] = {}
+        self._rollup_lock = threading.Lock()
+        self._rollup_figures: dict[str | None, tuple[tuple, "Figure"]] = {}
+
+    def append(self, rows: list[dict]) -> None:
+        """
+        Store rows, returning once they are committed
+        """
+        raise NotImplementedError
+
+    def read(
+        self,
+        columns: list[str] | None = None,
+        names: list[str] | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> DataFrame:
+        """
+        Returns:
+            the `columns` of the rows submitted by `names` in [since, until)
+        """
+        raise NotImplementedError
+
+    def audit(
+        self,
+        columns: list[str] | None = None,
+        names: list[str] | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> DataFrame:
+        """
+        As `read`, with the rows compaction moved out of the live history.
+        Backends without an archive only have live rows.
+        Returns:
+            the `columns` of every row submitted by `names` in [since, until)
+        """
+        return self.read(columns, names, since, until)
+
+    def lookup(self, name: str, columns: list[str] | None = None) -> DataFrame:
+        """
+        Read the rows of one company, matched ignoring case and whitespace.
+        This reads the whole history, backends override it to use an index.
+        Returns:
+            the `columns` of the company's rows, in submission order
+        """
+        df = self.read()
+        matches = df["Name"].map(normalize_name) == normalize_name(name)
+        return filter_history(df[matches], columns).reset_index(drop=True)
+
+    def latest(self, columns: list[str] | None = None) -> DataFrame:
+        """
+        Read the most recent row of every company, matched ignoring case and
+        whitespace. This reads the whole history, backends override it to only
+        read those rows.
+        Returns:
+            the `columns` of the rows, in submission order
+        """
+        df = self.read()
+        names = df["Name"]
+        keys = names.map({name: normalize_name(name) for name in names.unique()})
+        return filter_history(df[~keys.duplicated(keep="last")], columns).reset_index(
+            drop=True
+        )
+
+    def summary(self, factors: FactorSet | None = None) -> dict:
+        """
+        Returns:
+            `HistoryRollup.summary` of the stored emissions or, with `factors`,
+            of the history scored again under them
+        """
+        return self.rollup(factors).summary()
+
+    def rows_since(
+        self, cursor: object, columns: list[str] = ROLLUP_COLUMNS
+    ) -> tuple[DataFrame, object, bool]:
+        """
+        Read the `columns` of the rows stored after `cursor`, None reading from
+        the first row. This reads everything on every call, backends override
+        it to only read the new rows.
+        Returns:
+            the rows, the cursor after them, and whether they replace all the
+            rows read before
+        """
+        return self.read(columns=columns), None, True
+
+    def rollup(self, factors: FactorSet | None = None) -> HistoryRollup:
+        """
+        The aggregates of the stored emissions or, with `factors`, of the
+        history scored again under them. Each factor set keeps its own
+        aggregates, updated with the rows stored since its last call, so
+        switching between factor sets only scores the new rows.
+        Returns:
+            the aggregates, not to be mutated
+        """
+        key = None if factors is None else factors.id
+        columns = ROLLUP_COLUMNS if factors is None else RESCORE_COLUMNS
+        with self._rollup_lock:
+            rollup, cursor = self._rollups.get(key, (None, None))
+            rows, cursor, reset = self.rows_since(cursor, columns)
+            if rollup is None or reset:
+                rollup = HistoryRollup()
+            if factors is not None:
+                rows = rescore(rows, factors)
+            rollup.update(rows)
+            self._rollups[key] = (rollup, cursor)
+            return rollup
+
+    def rollup_figure(
+        self,
+        draw: Callable[[HistoryRollup], "Figure"],
+        factors: FactorSet | None = None,
+    ) -> "Figure":
+        """
+        Returns:
+            `draw` applied to the history aggregates of `factors`, rebuilt only
+            when they changed
+        """
+        with self._figure_lock:
+            rollup = self.rollup(factors)
+            key = None if factors is None else factors.id
+            figure_key = (self._rollups[key][1], rollup.count, draw)
+            cached = self._rollup_figures.get(key)
+            if cached is None or cached[0] != figure_key:
+                cached = (figure_key, draw(rollup))
+                self._rollup_figures[key] = cached
+            return cached[1]
+
+
+class CsvHistoryBackend(HistoryBackend):
+    """
+    History appended to a CSV, whose live rows are read and aggregated as they
+    are appended. With a `retention_interval`, off by default, a background
+    thread compacts the CSV every that many seconds once rows were appended,
+    moving the rows `policy` does not keep live to the archive next to it: the
+    History tab only reads the live rows, company lookups and `audit` read the
+    archived ones too.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        policy: RetentionPolicy | None = None,
+        retention_interval: float = RETENTION_INTERVAL,
+    ) -> None:
+        super().__init__()
+        self.path = path
+        self.store = HistoryStore(path)
+        self.writer = HistoryWriter(path)
+        self.names = NameIndex(path)
+        self.archive = HistoryArchive(retention.archive_path(path))
+        self.policy = policy or RetentionPolicy()
+        self.retention_interval = retention_interval
+
+        self._compactor = None
+        self._compactor_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def append(self, rows: list[dict]) -> None:
+        self.writer.append_many(stamp(rows)).result()
+        # only the new rows are scanned
+        self.names.refresh()
+        self._start_compactor()
+
+    def lookup(self, name: str, columns: list[str] | None = None) -> DataFrame:
+        # the older rows of the company may have been archived
+        archived = self.archive.rows(name)
+        rows = self.names.rows(name)
+        if not archived.empty:
+            rows = concat([archived, rows], ignore_index=True)
+        return filter_history(rows, columns)
+
+    def audit(
+        self,
+        columns: list[str] | None = None,
+        names: list[str] | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> DataFrame:
+        # only the archived months overlapping [since, until) are read
+        archived = self.archive.read(since, until)
+        rows = self.store.load()
+        if not archived.empty:
+            rows = concat([archived, rows], ignore_index=True)
+        return filter_history(rows, columns, names, since, until)
+
+    def read(
+        self,
+        columns: list[str] | None = None,
+        names: list[str] | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> DataFrame:
+        return filter_history(self.store.load(), columns, names, since, until)
+
+    def rows_since(
+        self, cursor: object, columns: list[str] = ROLLUP_COLUMNS
+    ) -> tuple[DataFrame, object, bool]:
+        # the store only parses what was appended, so are the rollups
+        df, generation = self.store.snapshot()
+        new_cursor = (generation, len(df))
+        if cursor is None or cursor[0] != generation:
+            return filter_history(df, columns=columns), new_cursor, True
+        rows = df.iloc[cursor[1] :]
+        return filter_history(rows, columns=columns), new_cursor, False
+
+    def compact(self, policy: RetentionPolicy | None = None) -> Compaction | None:
+        """
+        Move the rows not kept live by `policy`, or the backend's, to the
+        archive, see `retention.compact`. Readers pick up the compacted CSV
+        as a replaced file.
+        Returns:
+            what was done, None when it did not run
+        """
+        result = retention.compact(self.path, self.archive, policy or self.policy)
+        self.names.refresh()
+        return result
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+
+    def _start_compactor(self) -> None:
+        if self.retention_interval <= 0:
+            return
+        with self._compactor_lock:
+            if self._compactor is None:
+                self._compactor = threading.Thread(
+                    target=self._compact_loop, name="history-retention", daemon=True
+                )
+                self._compactor.start()
+
+    def _compact_loop(self) -> None:
+        while not self._stop.wait(self.retention_interval):
+            try:
+                result = self.compact()
+            except Exception:
+                logger.exception("History compaction failed")
+                continue
+            if result is not None and (result.archived or result.dropped):
+                logger.info(
+                    "Compacted %s: %d rows live, %d archived, %d dropped",
+                    self.path,
+                    result.kept,
+                    result.archived,
+                    result.dropped,
+                )
+
+
+def get_backend(csv_path: str, name: str = HISTORY_BACKEND) -> HistoryBackend:
+    """
+    The history backend selected by HISTORY_BACKEND: csv, parquet or sqlite
+    """
+    if name == "csv":
+        return CsvHistoryBackend(csv_path)
+    if name == "sqlite":
+        from history.sqlite_backend import open_sqlite_backend
+
+        return open_sqlite_backend(
+            os.path.splitext(csv_path)[0] + ".sqlite", csv_path=csv_path
+        )
+    if name == "parquet":
+        from history.parquet_backend import open_parquet_backend
+
+        return open_parquet_backend(
+            os.path.join(os.path.dirname(csv_path), "historic_parquet"),
+            csv_path=csv_path,
+        )
+    raise ValueError(f"Unknown history backend: {name}")
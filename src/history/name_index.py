@@ -0,0 +1,178 @@
+import csv
+import os
+import threading
+from io import BytesIO
+
+from pandas import DataFrame, read_csv
+
+from history.store import HISTORY_COLUMNS
+from history.writer import _lock, _unlock
+
+
+def normalize_name(name: str) -> str:
+    """
+    The key a company is looked up by: case and whitespace are ignored
+    """
+    return " ".join(str(name).split()).casefold()
+
+
+class NameIndex:
+    """
+    Persistent index from normalized company name to the byte offsets of its
+    rows in a history CSV, stored in `<path>.index` next to it.
+
+    The index file is an append-only list of `offset<TAB>key` lines after a
+    first line naming the inode of the CSV it describes, each batch closed by
+    an `end<TAB>offset` line with the CSV offset it indexed up to. `refresh`
+    indexes the rows appended to the CSV since the last refresh, so only new
+    rows are ever scanned, and picks up entries added by other processes. It
+    holds the writers' lock on `<path>.lock` while doing so. The index is
+    rebuilt when the CSV was replaced or truncated.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.index_path = f"{path}.index"
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def offsets(self, name: str) -> list[int]:
+        """
+        Returns:
+            byte offsets of the rows of the company, in submission order
+        """
+        self.refresh()
+        with self._lock:
+            return list(self._offsets.get(normalize_name(name), []))
+
+    def rows(self, name: str) -> DataFrame:
+        """
+        Returns:
+            the rows of the company, read by seeking to each of them
+        """
+        while True:
+            offsets = self.offsets(name)
+            with self._lock:
+                header, inode = self._header, self._inode
+            if not offsets:
+                return DataFrame(columns=header or HISTORY_COLUMNS)
+
+            with open(self.path, mode="rb") as f:
+                # replaced since it was indexed, e.g. by compaction
+                if os.fstat(f.fileno()).st_ino != inode:
+                    continue
+                lines = []
+                for offset in offsets:
+                    f.seek(offset)
+                    lines.append(f.readline())
+            return read_csv(BytesIO(b"".join(lines)), header=None, names=header)
+
+    def refresh(self) -> None:
+        with self._lock, open(f"{self.path}.lock", mode="a+b") as lock:
+            _lock(lock)
+            try:
+                self._refresh()
+            finally:
+                _unlock(lock)
+
+    def _refresh(self) -> None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset(None)
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._indexed:
+            self._load(stat.st_ino, stat.st_size)
+        else:
+            # entries appended by other processes since the last refresh
+            self._read_entries()
+        if stat.st_size > self._indexed:
+            self._scan(stat.st_size)
+
+    def _load(self, inode: int, size: int) -> None:
+        self._reset(inode)
+        try:
+            with open(self.index_path, mode="rb") as f:
+                first = f.readline()
+        except FileNotFoundError:
+            first = b""
+        if first.strip() == f"inode {inode}".encode("ascii"):
+            self._index_offset = len(first)
+            self._read_entries()
+            if self._indexed <= size:
+                return
+            # the CSV was truncated in place, the index is rebuilt
+            self._reset(inode)
+        with open(self.index_path, mode="wb") as f:
+            f.write(f"inode {inode}\n".encode("ascii"))
+            self._index_offset = f.tell()
+
+    def _read_entries(self) -> None:
+        with open(self.index_path, mode="rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # entries only count once the "end" line of their batch was written
+        end = data.rfind(b"\nend\t")
+        if end < 0:
+            return
+        end = data.index(b"\n", end + 1) + 1
+        batch: dict[str, list[int]] = {}
+        for line in data[:end].decode("utf-8").splitlines():
+            first, _, rest = line.partition("\t")
+            if first == "end":
+                for key, offsets in batch.items():
+                    self._offsets.setdefault(key, []).extend(offsets)
+                batch = {}
+                self._indexed = int(rest)
+            elif first == "header":
+                self._header = next(csv.reader([rest]))
+            else:
+                batch.setdefault(rest, []).append(int(first))
+        self._index_offset += end
+
+    def _scan(self, size: int) -> None:
+        with open(self.path, mode="rb") as f:
+            f.seek(self._indexed)
+            data = f.read(size - self._indexed)
+        # only complete lines, a row still being written is indexed next time
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return
+
+        entries = []
+        offsets, lines = [], []
+        offset = self._indexed
+        start = 0
+        while start < end:
+            stop = data.index(b"\n", start) + 1
+            line = data[start:stop].decode("utf-8").strip()
+            if offset == 0:
+                self._header = next(csv.reader([line]))
+                entries.append(f"header\t{line}\n")
+            elif line:
+                offsets.append(offset)
+                lines.append(line)
+            offset += stop - start
+            start = stop
+
+        column = self._header.index("Name")
+        for row_offset, fields in zip(offsets, csv.reader(lines)):
+            key = normalize_name(fields[column])
+            self._offsets.setdefault(key, []).append(row_offset)
+            entries.append(f"{row_offset}\t{key}\n")
+        entries.append(f"end\t{offset}\n")
+
+        with open(self.index_path, mode="r+b") as f:
+            # drops what a writer that crashed wrote after its last "end" line
+            f.seek(self._index_offset)
+            f.truncate()
+            f.write("".join(entries).encode("utf-8"))
+            self._index_offset = f.tell()
+        self._indexed = offset
+
+    def _reset(self, inode: int | None) -> None:
+        self._inode = inode
+        self._offsets: dict[str, list[int]] = {}
+        self._header: list[str] | None = None
+        self._indexed = 0
+        self._index_offset = 0
@@ -0,0 +1,327 @@
+import logging
+import os
+import os.path as os_path
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import count
+from time import time_ns
+
+from pandas import DataFrame, read_csv, to_datetime
+
+from emission_calculator.calculator import INPUT_COLUMNS
+from emission_calculator.factors import FACTOR_SET
+from history.backends import ROLLUP_COLUMNS, HistoryBackend, stamp
+from history.name_index import normalize_name
+from history.store import FOOTPRINT, HISTORY_COLUMNS, SUBMITTED_AT
+from history.writer import _lock, _lock_shared, _unlock
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError as e:
+    raise ImportError(
+        "The parquet history backend needs pyarrow: pip install pyarrow"
+    ) from e
+
+logger = logging.getLogger(__name__)
+
+COMPACT_MIN_FILES = int(os.environ.get("HISTORY_COMPACT_MIN_FILES", 32))
+COMPACT_INTERVAL = float(os.environ.get("HISTORY_COMPACT_INTERVAL", 60))
+
+# <sequence>-part-<pid>-<n>.parquet, <sequence>-imported-<pid>-<n>.parquet and
+# <first>-compacted-<last>.parquet, the parts from first to last merged
+FILE_NAME = re.compile(
+    r"(\d+)-(part|imported)-\d+-\d+\.parquet|(\d+)-compacted-(\d+)\.parquet"
+)
+
+SCHEMA = pa.schema(
+    [
+        ("Name", pa.string()),
+        ("Energy Usage", pa.float64()),
+        ("Waste Generated", pa.float64()),
+        ("Business Travel", pa.float64()),
+        (SUBMITTED_AT, pa.timestamp("us", tz="UTC")),
+        # files written before the inputs were kept read them as nulls
+        *[(column, pa.float64()) for column in INPUT_COLUMNS],
+        (FACTOR_SET, pa.string()),
+    ]
+)
+
+
+class ParquetHistoryBackend(HistoryBackend):
+    """
+    History stored as append-only Parquet files in one directory.
+
+    Every `append` writes its rows as a new part file, renamed into place once
+    complete so readers never see a partial file. Files are named after a
+    sequence number, higher than that of every file already there, and read in
+    its order. Reads go through a pyarrow dataset, so only the requested columns
+    are decoded and name and date filters are pushed down to the row groups.
+
+    A background thread compacts the part files into one once there are
+    `compact_min_files` of them. The compacted file names the sequence numbers
+    of the parts it replaces, so once it is renamed into place those parts are
+    ignored, and deleted by the next compaction or start if a crash left them.
+    Compaction holds an exclusive lock on `<directory>.lock`, and appends and
+    reads a shared one, so processes sharing the directory never merge the same
+    files twice or read a directory that is being swapped.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        compact_min_files: int = COMPACT_MIN_FILES,
+        compact_interval: float = COMPACT_INTERVAL,
+    ) -> None:
+        super().__init__()
+        self.directory = directory
+        self.compact_min_files = compact_min_files
+        os.makedirs(directory, exist_ok=True)
+
+        # numbers the files of this process written with the same sequence
+        self._counter = count()
+        with self._locked(shared=False):
+            self._recover()
+        self._stop = threading.Event()
+        self._compactor = threading.Thread(
+            target=self._compact_loop,
+            args=(compact_interval,),
+            name="history-compactor",
+            daemon=True,
+        )
+        self._compactor.start()
+
+    def append(self, rows: list[dict]) -> None:
+        if not rows:
+            return
+        df = DataFrame(stamp(rows)).reindex(columns=HISTORY_COLUMNS)
+        df[SUBMITTED_AT] = to_datetime(df[SUBMITTED_AT], utc=True)
+        table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+        with self._locked(shared=True):
+            self._write(table, "part")
+
+    def read(
+        self,
+        columns: list[str] | None = None,
+        names: list[str] | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> DataFrame:
+        conditions = []
+        if names is not None:
+            conditions.append(ds.field("Name").isin(names))
+        if since is not None:
+            conditions.append(ds.field(SUBMITTED_AT) >= _timestamp(since))
+        if until is not None:
+            conditions.append(ds.field(SUBMITTED_AT) < _timestamp(until))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        projection = None
+        if columns is not None:
+            projection = _projection(columns)
+
+        with self._locked(shared=True):
+            files = self._files()
+            if not files:
+                return DataFrame(columns=columns or HISTORY_COLUMNS)
+            table = ds.dataset(files, schema=SCHEMA, format="parquet").to_table(
+                columns=projection, filter=expression
+            )
+        return table.to_pandas()
+
+    def lookup(self, name: str, columns: list[str] | None = None) -> DataFrame:
+        # only the names are decoded to find how the company was spelled
+        with self._locked(shared=True):
+            files = self._files()
+            if not files:
+                return DataFrame(columns=columns or HISTORY_COLUMNS)
+            names = ds.dataset(files, schema=SCHEMA, format="parquet").to_table(
+                columns=["Name"]
+            )
+        spellings = [
+            spelling
+            for spelling in pc.unique(names["Name"]).to_pylist()
+            if normalize_name(spelling) == normalize_name(name)
+        ]
+        if not spellings:
+            return DataFrame(columns=columns or HISTORY_COLUMNS)
+        return self.read(columns=columns, names=spellings)
+
+    def rows_since(
+        self, cursor: object, columns: list[str] = ROLLUP_COLUMNS
+    ) -> tuple[DataFrame, object, bool]:
+        with self._locked(shared=True):
+            files = self._files()
+            # compaction replaces files already read, everything is read again
+            reset = cursor is None or not cursor <= set(files)
+            new = files if reset else [path for path in files if path not in cursor]
+            if not new:
+                return DataFrame(columns=columns), frozenset(files), reset
+            table = ds.dataset(new, schema=SCHEMA, format="parquet").to_table(
+                columns=_projection(columns)
+            )
+        return table.to_pandas(), frozenset(files), reset
+
+    def compact(self) -> bool:
+        """
+        Merge the part files into one file
+        Returns:
+            whether anything was compacted
+        """
+        with self._locked(shared=False):
+            # listed under the lock, another process may have merged them
+            self._recover()
+            parts = [
+                (sequence, path)
+                for sequence, _, kind, path in self._listing()
+                if kind == "part"
+            ]
+            if len(parts) < 2:
+                return False
+            paths = [path for _, path in parts]
+            table = ds.dataset(paths, schema=SCHEMA, format="parquet").to_table()
+            # the parts are superseded once this file is renamed into place
+            self._write_file(
+                table, f"{parts[0][0]:020d}-compacted-{parts[-1][0]:020d}.parquet"
+            )
+            for path in paths:
+                os.remove(path)
+        return True
+
+    def import_csv(self, csv_path: str, chunk_size: int = 50_000) -> int:
+        """
+        Copy every row of a history CSV into the directory, one file per chunk,
+        before any row appended meanwhile
+        Returns:
+            number of imported rows
+        """
+        imported = 0
+        with self._locked(shared=False):
+            for chunk in read_csv(csv_path, chunksize=chunk_size):
+                # legacy rows without a submission time or inputs keep null ones
+                df = chunk.reindex(columns=HISTORY_COLUMNS)
+                df[SUBMITTED_AT] = to_datetime(
+                    df[SUBMITTED_AT], utc=True, errors="coerce"
+                )
+                df["Name"] = df["Name"].astype(str)
+                df[FACTOR_SET] = df[FACTOR_SET].astype(object)
+                table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+                self._write(table, "imported")
+                imported += len(df)
+        return imported
+
+    def close(self) -> None:
+        self._stop.set()
+        self._compactor.join()
+
+    def _listing(self) -> list[tuple[int, int, str, str]]:
+        """
+        Returns:
+            sequence, last merged sequence, kind and path of every file, in
+            sequence order
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            match = FILE_NAME.fullmatch(name)
+            if match is None:
+                continue
+            sequence, kind, first, last = match.groups()
+            if kind is None:
+                files.append((int(first), int(last), "compacted", name))
+            else:
+                files.append((int(sequence), int(sequence), kind, name))
+        return [
+            (first, last, kind, os_path.join(self.directory, name))
+            for first, last, kind, name in sorted(files)
+        ]
+
+    def _files(self) -> list[str]:
+        listing = self._listing()
+        merged = [
+            (first, last) for first, last, kind, _ in listing if kind == "compacted"
+        ]
+        # parts a crash left after their compacted file was renamed into place
+        return [
+            path
+            for first, _, kind, path in listing
+            if kind != "part" or not any(low <= first <= high for low, high in merged)
+        ]
+
+    def _recover(self) -> None:
+        # under the exclusive lock, no file is being written
+        kept = set(self._files())
+        for name in os.listdir(self.directory):
+            path = os_path.join(self.directory, name)
+            if name.endswith(".tmp") or (
+                FILE_NAME.fullmatch(name) and path not in kept
+            ):
+                os.remove(path)
+
+    def _write(self, table: pa.Table, kind: str) -> None:
+        # later than every file, even when the clock went back
+        sequence = max([time_ns(), *(last + 1 for _, last, _, _ in self._listing())])
+        self._write_file(
+            table, f"{sequence:020d}-{kind}-{os.getpid()}-{next(self._counter)}.parquet"
+        )
+
+    def _write_file(self, table: pa.Table, name: str) -> None:
+        path = os_path.join(self.directory, name)
+        pq.write_table(table, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    @contextmanager
+    def _locked(self, shared: bool):
+        with open(f"{self.directory}.lock", mode="a+b") as lock:
+            if shared:
+                _lock_shared(lock)
+            else:
+                _lock(lock)
+            try:
+                yield
+            finally:
+                _unlock(lock)
+
+    def _compact_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            parts = [path for _, _, kind, path in self._listing() if kind == "part"]
+            if len(parts) >= self.compact_min_files:
+                try:
+                    self.compact()
+                except Exception:
+                    logger.exception("History compaction failed")
+
+
+def open_parquet_backend(directory: str, csv_path: str) -> ParquetHistoryBackend:
+    """
+    Open the directory, importing the CSV history once when it is new
+    """
+    is_new = not os_path.exists(directory)
+    backend = ParquetHistoryBackend(directory)
+    if is_new and os_path.exists(csv_path):
+        logger.info("Imported %d rows from %s", backend.import_csv(csv_path), csv_path)
+    return backend
+
+
+def _projection(columns: list[str]) -> dict:
+    # the footprint total is computed while scanning
+    return {
+        column: (
+            ds.field("Energy Usage")
+            + ds.field("Waste Generated")
+            + ds.field("Business Travel")
+            if column == FOOTPRINT
+            else ds.field(column)
+        )
+        for column in columns
+    }
+
+
+def _timestamp(value: datetime) -> pa.Scalar:
+    timestamp = to_datetime(value, utc=True)
+    return pa.scalar(timestamp, type=SCHEMA.field(SUBMITTED_AT).type)
@@ -0,0 +1,45 @@
+import argparse
+from time import perf_counter
+
+from emission_calculator.calculator import CATEGORIES, rescore
+from emission_calculator.factors import CURRENT_FACTORS, FACTOR_SET, get_factors
+from history.backends import HISTORY_BACKEND, get_backend
+from history.store import HISTORY_COLUMNS
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Score the whole history again under a factor set"
+    )
+    parser.add_argument(
+        "--history", default="./reports/historic_data.csv", help="history CSV"
+    )
+    parser.add_argument("--backend", default=HISTORY_BACKEND, help="history backend")
+    parser.add_argument(
+        "--factors", default=CURRENT_FACTORS, help="factor set, as name@version"
+    )
+    parser.add_argument("-o", "--output", required=True, help="CSV to write")
+    args = parser.parse_args()
+
+    factors = get_factors(args.factors)
+    # histories not written since the inputs were kept lack their columns
+    history = (
+        get_backend(args.history, args.backend)
+        .read(columns=HISTORY_COLUMNS)
+        .reindex(columns=HISTORY_COLUMNS)
+    )
+    start = perf_counter()
+    rescored = rescore(history, factors)
+    elapsed = perf_counter() - start
+
+    rescored.to_csv(args.output, index=False)
+    kept = rescored[FACTOR_SET] != factors.id
+    print(
+        f"Scored {len(rescored) - kept.sum()} rows under {factors.id} in "
+        f"{elapsed:.3f}s, {kept.sum()} rows saved without their inputs kept "
+        "their emissions"
+    )
+    print(
+        "Totals: "
+        + ", ".join(f"{column} {rescored[column].sum():,.0f}" for column in CATEGORIES)
+        + f" -> {args.output}"
+    )
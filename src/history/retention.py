@@ -0,0 +1,361 @@
+import argparse
+import csv
+import os
+import os.path as os_path
+import shutil
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from time import time_ns
+
+import numpy as np
+from pandas import Series, to_datetime
+
+from history.archive import UNDATED, HistoryArchive
+from history.name_index import normalize_name
+from history.store import SUBMITTED_AT
+from history.writer import _lock, _try_lock, _unlock
+
+# most recent rows of every company kept in the live history
+KEEP_LATEST = int(os.environ.get("HISTORY_KEEP_LATEST", 1))
+# rows submitted in the last days are kept live as well, 0 only keeps the latest
+KEEP_DAYS = float(os.environ.get("HISTORY_KEEP_DAYS", 0))
+# calendar months of archived rows kept, the current one included, 0 keeps
+# the whole archive
+ARCHIVE_MONTHS = int(os.environ.get("HISTORY_ARCHIVE_MONTHS", 0))
+# archived rows repeating the previous submission of their company are dropped
+DROP_REPEATS = os.environ.get("HISTORY_DROP_REPEATS", "0") == "1"
+# seconds between compactions of the live history, off unless set: compaction
+# changes what the History tab shows, and takes about 2s per 100k rows
+RETENTION_INTERVAL = float(os.environ.get("HISTORY_RETENTION_INTERVAL", 0))
+
+# written in the staging directory right before the live history is replaced
+COMMIT = "commit"
+
+
+def archive_path(path: str) -> str:
+    """
+    Returns:
+        the archive directory of the history CSV at `path`
+    """
+    return os_path.splitext(path)[0] + "_archive"
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """
+    Which rows stay in the live history and how long archived rows are kept
+    """
+
+    keep_latest: int = KEEP_LATEST
+    keep_days: float = KEEP_DAYS
+    archive_months: int = ARCHIVE_MONTHS
+    # only archived rows are dropped, the live history keeps every latest row
+    drop_repeats: bool = DROP_REPEATS
+
+    def __post_init__(self) -> None:
+        if self.keep_latest < 1:
+            raise ValueError("At least the latest row of every company is kept")
+
+
+@dataclass
+class Compaction:
+    """
+    Rows left live, moved to the archive and dropped by one compaction
+    """
+
+    kept: int = 0
+    archived: int = 0
+    dropped: int = 0
+    segments: int = 0
+    expired: list[str] = field(default_factory=list)
+
+
+def live_rows(
+    keys: Series, submitted: Series, policy: RetentionPolicy, now: datetime
+) -> np.ndarray:
+    """
+    Returns:
+        whether each row stays live: the `keep_latest` most recent rows of its
+        company, by `keys` its normalized name, or a row `submitted` in the last
+        `keep_days` days
+    """
+    rank = keys.groupby(keys, sort=False).cumcount(ascending=False)
+    live = (rank < policy.keep_latest).to_numpy()
+    if policy.keep_days > 0:
+        recent = submitted >= to_datetime(now, utc=True) - timedelta(
+            days=policy.keep_days
+        )
+        live |= recent.to_numpy()
+    return live
+
+
+def repeated_rows(
+    rows: list[list[str]], keys: np.ndarray, submitted_at: int | None
+) -> np.ndarray:
+    """
+    Returns:
+        whether each row has the same fields as the previous row of its company,
+        `keys` being their normalized names, but for the submission time
+    """
+    last: dict[str, tuple] = {}
+    repeated = np.zeros(len(rows), dtype=bool)
+    for i, (row, key) in enumerate(zip(rows, keys)):
+        values = tuple(
+            value for column, value in enumerate(row) if column != submitted_at
+        )
+        repeated[i] = last.get(key) == values
+        last[key] = values
+    return repeated
+
+
+def compact(
+    path: str,
+    archive: HistoryArchive,
+    policy: RetentionPolicy = RetentionPolicy(),
+    now: datetime | None = None,
+) -> Compaction | None:
+    """
+    Move the rows of the history CSV at `path` that `policy` does not keep live
+    into `archive`, then delete the archived months it no longer keeps.
+
+    Runs online: the history is read, and the archive segments and the new live
+    file written, without the writers' lock on `<path>.lock`. The lock is only
+    held to copy the rows appended meanwhile and rename the new file into place,
+    so readers see the old or the new file and no row is lost. One compaction
+    runs at a time, under `<path>.compact.lock`. One interrupted by a crash is
+    finished or rolled back by the next one. The whole live history is parsed
+    and written again, about 2s per 100k rows, so large histories are best
+    compacted from the command line rather than by the app.
+    Returns:
+        what was done, None when it did not run: another compaction was running,
+        or the history was replaced meanwhile
+    """
+    now = now or datetime.now(timezone.utc)
+    with open(f"{path}.compact.lock", mode="a+b") as guard:
+        if not _try_lock(guard):
+            return None
+        try:
+            recover(path, archive)
+            result = _compact(path, archive, policy, now)
+            if result is not None and policy.archive_months > 0:
+                result.expired = archive.expire(policy.archive_months, now)
+            return result
+        finally:
+            _unlock(guard)
+
+
+def recover(path: str, archive: HistoryArchive) -> None:
+    """
+    Finish the compactions that replaced the live history before they were
+    interrupted, and roll back the others
+    """
+    try:
+        inode = os.stat(path).st_ino
+    except FileNotFoundError:
+        inode = None
+    for staging in archive.staged():
+        try:
+            with open(os_path.join(staging, COMMIT), encoding="ascii") as f:
+                replaced = int(f.read())
+        except (FileNotFoundError, ValueError):
+            replaced = None
+        # the old file is still live when the rename did not happen, its rows
+        # must not be archived twice
+        if replaced is not None and replaced != inode:
+            archive.publish(staging)
+        else:
+            shutil.rmtree(staging)
+    if os_path.exists(f"{path}.compact"):
+        os.remove(f"{path}.compact")
+
+
+def _compact(
+    path: str, archive: HistoryArchive, policy: RetentionPolicy, now: datetime
+) -> Compaction | None:
+    try:
+        with open(path, mode="rb") as f:
+            inode = os.fstat(f.fileno()).st_ino
+            data = f.read()
+    except FileNotFoundError:
+        return Compaction()
+
+    # only complete lines, the rest is copied as it is with the appended rows
+    header_end = data.find(b"\n") + 1
+    end = data.rfind(b"\n") + 1
+    if header_end == 0:
+        return Compaction()
+    header = data[:header_end]
+    columns = next(csv.reader([header.decode("utf-8")]))
+    lines = [
+        line for line in data[header_end:end].splitlines(keepends=True) if line.strip()
+    ]
+    rows = list(csv.reader(line.decode("utf-8") for line in lines))
+    name_column = columns.index("Name")
+    submitted_at = columns.index(SUBMITTED_AT) if SUBMITTED_AT in columns else None
+    names = Series([_field(row, name_column) for row in rows], dtype=object)
+    # normalized once per spelling, companies submit many times
+    keys = names.map({name: normalize_name(name) for name in names.unique()})
+    submitted = to_datetime(
+        Series([_field(row, submitted_at) for row in rows], dtype=object),
+        utc=True,
+        errors="coerce",
+    )
+
+    live = live_rows(keys, submitted, policy, now)
+    dropped = np.zeros(len(rows), dtype=bool)
+    if policy.drop_repeats:
+        dropped = ~live & repeated_rows(rows, keys.to_numpy(), submitted_at)
+    archived = ~live & ~dropped
+    if live.all():
+        return Compaction(kept=len(lines))
+
+    # segments are named after the compaction, so sorting them keeps their order
+    tag = f"{time_ns():020d}-{os.getpid()}"
+    staging = archive.stage(tag)
+    # months since year 0, -1 for rows without a submission time
+    months = (
+        (submitted.dt.year * 12 + submitted.dt.month - 1)
+        .fillna(-1)
+        .to_numpy(dtype=np.int64)
+    )
+    keys = keys.to_numpy()
+    segments = 0
+    for month in np.unique(months[archived]):
+        (indices,) = np.nonzero(archived & (months == month))
+        archive.write_segment(
+            staging,
+            UNDATED if month < 0 else f"{month // 12:04d}-{month % 12 + 1:02d}",
+            tag,
+            header,
+            [lines[i] for i in indices],
+            set(keys[indices]),
+        )
+        segments += 1
+
+    new_path = f"{path}.compact"
+    with open(new_path, mode="wb") as new:
+        new.write(header)
+        new.writelines(line for line, keep in zip(lines, live) if keep)
+        # synced before writers wait, only the rows appended meanwhile are after
+        new.flush()
+        os.fsync(new.fileno())
+        with open(f"{path}.lock", mode="a+b") as lock:
+            _lock(lock)
+            try:
+                with open(path, mode="rb") as f:
+                    if os.fstat(f.fileno()).st_ino != inode:
+                        # its header was migrated, it is compacted next time
+                        replaced = True
+                    else:
+                        replaced = False
+                        f.seek(end)
+                        shutil.copyfileobj(f, new)
+                if not replaced:
+                    new.flush()
+                    os.fsync(new.fileno())
+                    with open(os_path.join(staging, COMMIT), mode="w") as f:
+                        f.write(str(inode))
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(new_path, path)
+            finally:
+                _unlock(lock)
+
+    if replaced:
+        os.remove(new_path)
+        shutil.rmtree(staging)
+        return None
+    archive.publish(staging)
+    return Compaction(
+        kept=int(live.sum()),
+        archived=int(archived.sum()),
+        dropped=int(dropped.sum()),
+        segments=segments,
+    )
+
+
+def _field(row: list[str], column: int | None) -> str:
+    # a row torn by a crash can lack its last fields
+    if column is None or column >= len(row):
+        return ""
+    return row[column]
+
+
+if __name__ == "__main__":
+    from history.backends import CsvHistoryBackend, filter_history
+
+    parser = argparse.ArgumentParser(
+        description="Compact the CSV history, or query it with its archive"
+    )
+    parser.add_argument(
+        "--history", default="./reports/historic_data.csv", help="history CSV"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compact_parser = commands.add_parser(
+        "compact", help="move the rows that are not kept live into the archive"
+    )
+    compact_parser.add_argument(
+        "--keep-latest",
+        type=int,
+        default=KEEP_LATEST,
+        help="most recent rows of every company kept live",
+    )
+    compact_parser.add_argument(
+        "--keep-days",
+        type=float,
+        default=KEEP_DAYS,
+        help="rows submitted in the last days are kept live as well",
+    )
+    compact_parser.add_argument(
+        "--archive-months",
+        type=int,
+        default=ARCHIVE_MONTHS,
+        help="archived months kept, the current one included, 0 keeps them all",
+    )
+    compact_parser.add_argument(
+        "--drop-repeats",
+        action="store_true",
+        default=DROP_REPEATS,
+        help="drop archived rows repeating the previous submission of their company",
+    )
+
+    query_parser = commands.add_parser(
+        "query", help="read the live and archived rows as CSV"
+    )
+    query_parser.add_argument("--name", help="company, matched ignoring case")
+    query_parser.add_argument("--since", help="first submission time, ISO 8601")
+    query_parser.add_argument("--until", help="submissions before, ISO 8601")
+    query_parser.add_argument("-o", "--output", help="CSV to write, default stdout")
+    args = parser.parse_args()
+
+    backend = CsvHistoryBackend(args.history)
+    if args.command == "compact":
+        try:
+            policy = RetentionPolicy(
+                keep_latest=args.keep_latest,
+                keep_days=args.keep_days,
+                archive_months=args.archive_months,
+                drop_repeats=args.drop_repeats,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        result = backend.compact(policy)
+        if result is None:
+            sys.exit("Another compaction is running, or the history was replaced")
+        print(
+            f"Kept {result.kept} rows live, archived {result.archived} in "
+            f"{result.segments} segments and dropped {result.dropped} repeated "
+            f"ones -> {backend.archive.directory}"
+        )
+        if result.expired:
+            print(f"Deleted the archived months {', '.join(result.expired)}")
+    else:
+        since = to_datetime(args.since, utc=True) if args.since else None
+        until = to_datetime(args.until, utc=True) if args.until else None
+        if args.name:
+            rows = filter_history(backend.lookup(args.name), since=since, until=until)
+        else:
+            rows = backend.audit(since=since, until=until)
+        rows.to_csv(args.output or sys.stdout, index=False)
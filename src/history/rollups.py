@@ -0,0 +1,243 @@
+import threading
+
+import numpy as np
+from pandas import DataFrame, concat
+
+from emission_calculator.calculator import (
+    CATEGORIES,
+    HISTORY_MAX_POINTS,
+    HISTORY_ROW_THRESHOLD,
+    HISTORY_TOP_COMPANIES,
+)
+from history.name_index import normalize_name
+from history.store import FOOTPRINT
+
+METRICS = [*CATEGORIES, FOOTPRINT]
+# log-spaced bins of the percentile histograms, each 1.5% wide, mirrored for
+# negative values (Waste Generated is negative when most waste is recycled) with
+# one bin for (-1e-3, 1e-3]: percentiles are exact to within 1.5% for absolute
+# values between 1e-3 and 1e10 kgCO2
+_POSITIVE_EDGES = np.geomspace(1e-3, 1e10, 2001)
+BIN_EDGES = np.concatenate([-_POSITIVE_EDGES[::-1], _POSITIVE_EDGES])
+
+
+class HistoryRollup:
+    """
+    Aggregates of the history, updated with the rows appended since the last
+    update so that drawing the History tab never rescans the whole history:
+    count, totals, min/max, percentiles, the largest footprints, the latest
+    values of every company and a min/max decimation of the footprint line.
+    The rows themselves are only kept while there are at most `max_rows`.
+    """
+
+    def __init__(
+        self,
+        max_rows: int = HISTORY_ROW_THRESHOLD,
+        max_points: int = HISTORY_MAX_POINTS,
+        top_n: int = HISTORY_TOP_COMPANIES,
+    ) -> None:
+        self.max_rows = max_rows
+        self.max_points = max_points
+        self.top_n = top_n
+
+        self.count = 0
+        self.totals = np.zeros(len(METRICS))
+        self.minimum = np.full(len(METRICS), np.inf)
+        self.maximum = np.full(len(METRICS), -np.inf)
+        self.histograms = np.zeros((len(METRICS), len(BIN_EDGES) + 1), dtype=np.int64)
+        # normalized company name -> its most recent METRICS values
+        self.latest: dict[str, list[float]] = {}
+        self.top = DataFrame(columns=["Name", *METRICS])
+        self.lock = threading.RLock()
+
+        self._rows: list[DataFrame] | None = []
+        # footprint line: per bucket of `_width` rows, its lowest and highest point
+        self._width = 1
+        self._buckets = DataFrame(
+            {
+                "min_index": np.array([], dtype=np.int64),
+                "min_value": np.array([], dtype=float),
+                "min_name": np.array([], dtype=object),
+                "max_index": np.array([], dtype=np.int64),
+                "max_value": np.array([], dtype=float),
+                "max_name": np.array([], dtype=object),
+            }
+        )
+
+    def update(self, df: DataFrame) -> None:
+        """
+        Add rows appended to the history, with a "Name" column and the three
+        categories; the footprint is computed when the rows do not have it
+        """
+        if df.empty:
+            return
+        if FOOTPRINT not in df.columns:
+            df = df.assign(**{FOOTPRINT: df[CATEGORIES].sum(axis=1)})
+        df = df[["Name", *METRICS]].reset_index(drop=True)
+        df.index += self.count
+        values = df[METRICS].to_numpy(dtype=float)
+
+        with self.lock:
+            self.totals += values.sum(axis=0)
+            self.minimum = np.minimum(self.minimum, values.min(axis=0))
+            self.maximum = np.maximum(self.maximum, values.max(axis=0))
+            for i, column in enumerate(values.T):
+                bins = np.searchsorted(BIN_EDGES, column)
+                self.histograms[i] += np.bincount(bins, minlength=len(BIN_EDGES) + 1)
+
+            # later rows of a company replace its earlier ones, its name matched
+            # ignoring case and whitespace as in lookups
+            names = df["Name"].tolist()
+            keys = {name: normalize_name(name) for name in set(names)}
+            self.latest.update(zip([keys[name] for name in names], values.tolist()))
+            # rows of earlier updates come first, so ties keep the oldest rows
+            top = df.nlargest(self.top_n, FOOTPRINT)
+            if not self.top.empty:
+                top = concat([self.top, top]).nlargest(self.top_n, FOOTPRINT)
+            self.top = top
+
+            self._update_line(df)
+            self.count += len(df)
+            if self._rows is not None:
+                self._rows.append(df)
+                if self.count > self.max_rows:
+                    self._rows = None
+
+    def rows(self) -> DataFrame | None:
+        """
+        Returns:
+            every row while there are at most `max_rows`, otherwise None
+        """
+        with self.lock:
+            if self._rows is None:
+                return None
+            if not self._rows:
+                return DataFrame(columns=["Name", *METRICS])
+            return concat(self._rows)
+
+    def percentiles(self, q: list[float]) -> np.ndarray:
+        """
+        Returns:
+            the `q` percentiles of every metric, one row per metric
+        """
+        with self.lock:
+            result = np.zeros((len(METRICS), len(q)))
+            if self.count == 0:
+                return result
+            # geometric middle of each bin, 0 for the bin around zero, the first
+            # and last bins are open
+            low, high = BIN_EDGES[:-1], BIN_EDGES[1:]
+            middles = np.sign(low + high) * np.sqrt(np.abs(low * high))
+            middles = np.concatenate([[BIN_EDGES[0]], middles, [BIN_EDGES[-1]]])
+            for i, histogram in enumerate(self.histograms):
+                ranks = np.cumsum(histogram)
+                positions = np.searchsorted(
+                    ranks, np.asarray(q) / 100 * (self.count - 1), side="right"
+                )
+                result[i] = np.clip(
+                    middles[positions], self.minimum[i], self.maximum[i]
+                )
+            return result
+
+    def line(self) -> DataFrame:
+        """
+        Returns:
+            at most `max_points` points of the footprint line, in history order,
+            keeping the lowest and highest footprint of every stretch of rows
+        """
+        with self.lock:
+            buckets = self._buckets
+            points = DataFrame(
+                {
+                    "index": np.concatenate(
+                        [buckets["min_index"], buckets["max_index"]]
+                    ),
+                    "Name": np.concatenate([buckets["min_name"], buckets["max_name"]]),
+                    FOOTPRINT: np.concatenate(
+                        [buckets["min_value"], buckets["max_value"]]
+                    ),
+                }
+            )
+        return (
+            points.drop_duplicates("index").sort_values("index").drop(columns="index")
+        )
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            count, total, mean, min, max and median of every metric
+        """
+        with self.lock:
+            medians = self.percentiles([50])[:, 0]
+            return {
+                metric: {
+                    "total": self.totals[i],
+                    "mean": self.totals[i] / self.count if self.count else 0.0,
+                    "min": self.minimum[i] if self.count else 0.0,
+                    "max": self.maximum[i] if self.count else 0.0,
+                    "median": medians[i],
+                }
+                for i, metric in enumerate(METRICS)
+            } | {"count": self.count, "companies": len(self.latest)}
+
+    def _update_line(self, df: DataFrame) -> None:
+        capacity = max(self.max_points // 2, 1)
+        total = self.count + len(df)
+        width = self._width
+        while -(-total // width) > capacity:
+            width *= 2
+        buckets = self._buckets
+        while self._width < width:
+            buckets = _merge_pairs(buckets)
+            self._width *= 2
+
+        # the last bucket may still have room, it is rebuilt with the new rows
+        values = df[FOOTPRINT].to_numpy(dtype=float)
+        names = df["Name"].to_numpy(dtype=object)
+        indices = df.index.to_numpy()
+        start = self.count - self.count % width
+        if start < self.count and not buckets.empty:
+            last = buckets.iloc[-1]
+            buckets = buckets.iloc[:-1]
+            values = np.concatenate([[last["min_value"], last["max_value"]], values])
+            names = np.concatenate([[last["min_name"], last["max_name"]], names])
+            indices = np.concatenate([[last["min_index"], last["max_index"]], indices])
+
+        groups = (indices - start) // width
+        frame = DataFrame(
+            {"group": groups, "index": indices, "name": names, "value": values}
+        )
+        lowest = frame.loc[frame.groupby("group", sort=True)["value"].idxmin()]
+        highest = frame.loc[frame.groupby("group", sort=True)["value"].idxmax()]
+        new = DataFrame(
+            {
+                "min_index": lowest["index"].to_numpy(),
+                "min_value": lowest["value"].to_numpy(),
+                "min_name": lowest["name"].to_numpy(),
+                "max_index": highest["index"].to_numpy(),
+                "max_value": highest["value"].to_numpy(),
+                "max_name": highest["name"].to_numpy(),
+            }
+        )
+        self._buckets = concat([buckets, new], ignore_index=True)
+
+
+def _merge_pairs(buckets: DataFrame) -> DataFrame:
+    """
+    Merge every two neighbouring buckets into one of twice the width
+    """
+    if len(buckets) < 2:
+        return buckets
+    pair = np.arange(len(buckets)) // 2
+    lowest = buckets.loc[buckets.groupby(pair)["min_value"].idxmin()]
+    highest = buckets.loc[buckets.groupby(pair)["max_value"].idxmax()]
+    return DataFrame(
+        {
+            "min_index": lowest["min_index"].to_numpy(),
+            "min_value": lowest["min_value"].to_numpy(),
+            "min_name": lowest["min_name"].to_numpy(),
+            "max_index": highest["max_index"].to_numpy(),
+            "max_value": highest["max_value"].to_numpy(),
+            "max_name": highest["max_name"].to_numpy(),
+        }
+    )
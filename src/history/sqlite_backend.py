@@ -0,0 +1,276 @@
+import argparse
+import logging
+import os.path as os_path
+import sqlite3
+import threading
+from datetime import datetime
+
+from pandas import DataFrame, read_csv, read_sql_query, to_datetime
+
+from emission_calculator.calculator import INPUT_COLUMNS
+from emission_calculator.factors import FACTOR_SET, FactorSet
+from history.backends import ROLLUP_COLUMNS, HistoryBackend, stamp
+from history.name_index import normalize_name
+from history.rollups import METRICS
+from history.store import FOOTPRINT, HISTORY_COLUMNS, SUBMITTED_AT
+
+logger = logging.getLogger(__name__)
+
+# history column -> SQL expression
+COLUMNS = {
+    "Name": "name",
+    "Energy Usage": "energy_usage",
+    "Waste Generated": "waste_generated",
+    "Business Travel": "business_travel",
+    SUBMITTED_AT: "submitted_at",
+    **{column: column for column in INPUT_COLUMNS},
+    FACTOR_SET: "factor_set",
+    FOOTPRINT: "energy_usage + waste_generated + business_travel",
+}
+# columns added after the first databases were created -> their SQL type
+ADDED_COLUMNS = {
+    "name_key": "TEXT",
+    **{column: "REAL" for column in INPUT_COLUMNS},
+    "factor_set": "TEXT",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    energy_usage REAL NOT NULL,
+    waste_generated REAL NOT NULL,
+    business_travel REAL NOT NULL,
+    submitted_at TEXT
+);
+CREATE INDEX IF NOT EXISTS history_name ON history (name);
+CREATE INDEX IF NOT EXISTS history_submitted_at ON history (submitted_at);
+"""
+
+INSERT = f"""
+INSERT INTO history (
+    name, energy_usage, waste_generated, business_travel, submitted_at, name_key,
+    {", ".join(INPUT_COLUMNS)}, factor_set
+)
+VALUES ({", ".join("?" * (7 + len(INPUT_COLUMNS)))})
+"""
+
+# the normalized name of every row, added to databases created without it
+NAME_KEY_SCHEMA = """
+UPDATE history SET name_key = normalize_name(name) WHERE name_key IS NULL;
+CREATE INDEX IF NOT EXISTS history_name_key ON history (name_key, id);
+"""
+
+
+class SqliteHistoryBackend(HistoryBackend):
+    """
+    History stored in an SQLite database in WAL mode, so readers never block the
+    writer. Name, normalized name and submission time are indexed. `read` and
+    `rows_since` compute the "Carbon Footprint" column in SQL when it is
+    requested. The latest row of every company and the count, totals, min and
+    max of the stored emissions are aggregated in SQL over the normalized name
+    index, only the percentiles of the History tab come from its rollup.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(history)")]
+        with connection:
+            for column, type in ADDED_COLUMNS.items():
+                if column not in columns:
+                    connection.execute(
+                        f"ALTER TABLE history ADD COLUMN {column} {type}"
+                    )
+        connection.executescript(NAME_KEY_SCHEMA)
+
+    def append(self, rows: list[dict]) -> None:
+        self._insert(stamp(rows))
+
+    def read(
+        self,
+        columns: list[str] | None = None,
+        names: list[str] | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> DataFrame:
+        columns = columns or HISTORY_COLUMNS
+        select = ", ".join(f'{COLUMNS[column]} AS "{column}"' for column in columns)
+
+        conditions, parameters = [], []
+        if names is not None:
+            conditions.append(f"name IN ({', '.join('?' * len(names))})")
+            parameters.extend(names)
+        if since is not None:
+            conditions.append("submitted_at >= ?")
+            parameters.append(_timestamp(since))
+        if until is not None:
+            conditions.append("submitted_at < ?")
+            parameters.append(_timestamp(until))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        return read_sql_query(
+            f"SELECT {select} FROM history {where} ORDER BY id",
+            self._connection(),
+            params=parameters,
+        )
+
+    def rows_since(
+        self, cursor: object, columns: list[str] = ROLLUP_COLUMNS
+    ) -> tuple[DataFrame, object, bool]:
+        connection = self._connection()
+        (last_id,) = connection.execute("SELECT max(id) FROM history").fetchone()
+        last_id = last_id or 0
+        # ids only grow, unless the database was replaced
+        reset = cursor is None or last_id < cursor
+        select = ", ".join(f'{COLUMNS[column]} AS "{column}"' for column in columns)
+        rows = read_sql_query(
+            f"SELECT {select} FROM history WHERE id > ? AND id <= ? ORDER BY id",
+            connection,
+            params=[0 if reset else cursor, last_id],
+        )
+        return rows, last_id, reset
+
+    def lookup(self, name: str, columns: list[str] | None = None) -> DataFrame:
+        columns = columns or HISTORY_COLUMNS
+        select = ", ".join(f'{COLUMNS[column]} AS "{column}"' for column in columns)
+        return read_sql_query(
+            f"SELECT {select} FROM history WHERE name_key = ? ORDER BY id",
+            self._connection(),
+            params=[normalize_name(name)],
+        )
+
+    def latest(self, columns: list[str] | None = None) -> DataFrame:
+        columns = columns or HISTORY_COLUMNS
+        select = ", ".join(f'{COLUMNS[column]} AS "{column}"' for column in columns)
+        # the highest id of every company is read from the (name_key, id) index
+        return read_sql_query(
+            f"SELECT {select} FROM history WHERE id IN "
+            "(SELECT max(id) FROM history GROUP BY name_key) ORDER BY id",
+            self._connection(),
+        )
+
+    def totals(self) -> dict:
+        """
+        Returns:
+            number of rows and companies, and the total, mean, min and max of
+            every metric of the stored emissions
+        """
+        aggregates = ", ".join(
+            f"sum({COLUMNS[metric]}), min({COLUMNS[metric]}), max({COLUMNS[metric]})"
+            for metric in METRICS
+        )
+        count, companies, *values = (
+            self._connection()
+            .execute(
+                f"SELECT count(*), count(DISTINCT name_key), {aggregates} FROM history"
+            )
+            .fetchone()
+        )
+        totals = {"count": count, "companies": companies}
+        for i, metric in enumerate(METRICS):
+            total, minimum, maximum = values[3 * i : 3 * i + 3]
+            totals[metric] = {
+                "total": total or 0.0,
+                "mean": total / count if count else 0.0,
+                "min": minimum or 0.0,
+                "max": maximum or 0.0,
+            }
+        return totals
+
+    def summary(self, factors: FactorSet | None = None) -> dict:
+        summary = super().summary(factors)
+        if factors is not None:
+            # scored again under other factors in Python, nothing to push down
+            return summary
+        totals = self.totals()
+        return {
+            key: value | totals[key] if isinstance(value, dict) else totals[key]
+            for key, value in summary.items()
+        }
+
+    def import_csv(self, csv_path: str, chunk_size: int = 50_000) -> int:
+        """
+        Copy every row of a history CSV into the database
+        Returns:
+            number of imported rows
+        """
+        imported = 0
+        for chunk in read_csv(csv_path, chunksize=chunk_size):
+            # legacy rows without a submission time or inputs keep NULL ones
+            rows = (
+                chunk.reindex(columns=HISTORY_COLUMNS).astype(object).to_dict("records")
+            )
+            for row in rows:
+                for column, value in row.items():
+                    if value != value:
+                        row[column] = None
+            self._insert(rows)
+            imported += len(rows)
+        return imported
+
+    def _insert(self, rows: list[dict]) -> None:
+        values = [
+            (
+                row["Name"],
+                float(row["Energy Usage"]),
+                float(row["Waste Generated"]),
+                float(row["Business Travel"]),
+                row.get(SUBMITTED_AT) or None,
+                normalize_name(row["Name"]),
+                *[_number(row.get(column)) for column in INPUT_COLUMNS],
+                row.get(FACTOR_SET) or None,
+            )
+            for row in rows
+        ]
+        connection = self._connection()
+        with self._write_lock, connection:
+            connection.executemany(INSERT, values)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.create_function(
+                "normalize_name", 1, normalize_name, deterministic=True
+            )
+            self._local.connection = connection
+        return connection
+
+
+def _number(value: object) -> float | None:
+    # missing inputs, None or NaN, are stored as NULL
+    if value is None or value != value:
+        return None
+    return float(value)
+
+
+def _timestamp(value: datetime) -> str:
+    return to_datetime(value, utc=True).isoformat(timespec="seconds")
+
+
+def open_sqlite_backend(path: str, csv_path: str) -> SqliteHistoryBackend:
+    """
+    Open the database, importing the CSV history once when the database is new
+    """
+    is_new = not os_path.exists(path)
+    backend = SqliteHistoryBackend(path)
+    if is_new and os_path.exists(csv_path):
+        logger.info("Imported %d rows from %s", backend.import_csv(csv_path), csv_path)
+    return backend
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a history CSV into SQLite")
+    parser.add_argument("csv_path", help="history CSV to import")
+    parser.add_argument("database", help="SQLite database to import into")
+    args = parser.parse_args()
+
+    count = SqliteHistoryBackend(args.database).import_csv(args.csv_path)
+    print(f"Imported {count} rows into {args.database}")
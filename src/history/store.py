@@ -0,0 +1,119 @@
+import os
+import threading
+from io import BytesIO
+
+from pandas import DataFrame, concat, read_csv
+
+from emission_calculator.calculator import INPUT_COLUMNS
+from emission_calculator.factors import FACTOR_SET
+
+SUBMITTED_AT = "Submitted At"
+# sum of the three metrics, computed by the backends that can push it down
+FOOTPRINT = "Carbon Footprint"
+# the calculator inputs and factor set are empty for rows saved before they
+# were kept, those rows cannot be scored again under other factors
+HISTORY_COLUMNS = [
+    "Name",
+    "Energy Usage",
+    "Waste Generated",
+    "Business Travel",
+    SUBMITTED_AT,
+    *INPUT_COLUMNS,
+    FACTOR_SET,
+]
+
+
+class HistoryStore:
+    """
+    In-memory copy of a history CSV that only parses what was appended since the
+    last load. Only complete lines are consumed, so a row that is still being
+    written is picked up on the next load. The file is re-read from the start
+    when it was replaced or truncated.
+    """
+
+    def __init__(self, path: str, columns: list[str] = HISTORY_COLUMNS) -> None:
+        self.path = path
+        self.version = 0
+        # incremented when the file is re-read from the start
+        self.generation = 0
+
+        self._default_columns = columns
+        self._columns = columns
+        self._df = DataFrame(columns=columns)
+        self._inode = None
+        self._size = None
+        self._mtime = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def load(self) -> DataFrame:
+        """
+        Returns:
+            the whole history, shared between callers and not to be mutated
+        """
+        with self._lock:
+            self._refresh()
+            return self._df
+
+    def snapshot(self) -> tuple[DataFrame, int]:
+        """
+        Returns:
+            the whole history, as `load`, and the generation it belongs to
+        """
+        with self._lock:
+            self._refresh()
+            return self._df, self.generation
+
+    def _refresh(self) -> None:
+        try:
+            f = open(self.path, mode="rb")
+        except FileNotFoundError:
+            if self._inode is not None:
+                self._reset()
+            return
+
+        # the file read is the one checked, even when it is replaced meanwhile
+        with f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._reset()
+                self._inode = stat.st_ino
+            elif stat.st_size == self._size and stat.st_mtime_ns == self._mtime:
+                return
+
+            f.seek(self._offset)
+            data = f.read(stat.st_size - self._offset)
+        self._size = stat.st_size
+        self._mtime = stat.st_mtime_ns
+
+        # only consume complete lines
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return
+        chunk = data[:end]
+
+        if self._offset == 0:
+            header, _, chunk = chunk.partition(b"\n")
+            self._columns = header.decode("utf-8").strip().split(",")
+        self._offset += end
+
+        if chunk.strip():
+            rows = read_csv(BytesIO(chunk), header=None, names=self._columns)
+            if self._df.empty:
+                self._df = rows
+            else:
+                self._df = concat([self._df, rows], ignore_index=True)
+            self.version += 1
+        elif self._df.columns.tolist() != self._columns:
+            self._df = DataFrame(columns=self._columns)
+            self.version += 1
+
+    def _reset(self) -> None:
+        self.generation += 1
+        self._columns = self._default_columns
+        self._df = DataFrame(columns=self._columns)
+        self._inode = None
+        self._size = None
+        self._mtime = None
+        self._offset = 0
+        self.version += 1
@@ -0,0 +1,270 @@
+import csv
+import logging
+import os
+import queue
+import shutil
+import threading
+from concurrent.futures import Future
+from io import StringIO
+from time import monotonic
+
+from history.store import HISTORY_COLUMNS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+FLUSH_ROWS = int(os.environ.get("HISTORY_FLUSH_ROWS", 256))
+FLUSH_INTERVAL_MS = float(os.environ.get("HISTORY_FLUSH_INTERVAL_MS", 20))
+FSYNC_POLICY = os.environ.get("HISTORY_FSYNC", "commit")
+FSYNC_POLICIES = ("commit", "interval", "never")
+FSYNC_INTERVAL = 1.0
+
+
+def _lock(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _lock_shared(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+    else:
+        # msvcrt has no shared locks, readers take turns
+        _lock(f)
+
+
+def _try_lock(f) -> bool:
+    """
+    Returns:
+        whether the exclusive lock was taken, without waiting for it
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class HistoryWriter:
+    """
+    Single writer for a history CSV with group commit.
+
+    Rows from every thread go through one queue and are written by one background
+    thread in groups, at most `flush_rows` rows or `flush_interval_ms` after the
+    first row of the group. Each group is written with a single `write` while
+    holding an exclusive lock on `<path>.lock`, so writers in other processes never
+    interleave with it. A header of `fieldnames` is written when the file is empty,
+    otherwise rows follow the header already in the file. A file written before
+    some of `fieldnames` were added is replaced once by a copy with them appended
+    to its header, its rows left as they are so they read with those columns empty.
+
+    Durability, by `fsync` policy, once the future returned by `append` is done:
+    - "commit": the rows were fsynced and survive a crash of the machine
+    - "interval": the rows are in the OS page cache and survive a crash of the
+      process; they are fsynced within FSYNC_INTERVAL seconds
+    - "never": as "interval", but syncing to disk is left to the OS
+    Readers that only consume complete lines never see a partial row. A row torn
+    by a crash in the middle of a write is closed by the next commit, never
+    continued by it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fieldnames: list[str] = HISTORY_COLUMNS,
+        flush_rows: int = FLUSH_ROWS,
+        flush_interval_ms: float = FLUSH_INTERVAL_MS,
+        fsync: str = FSYNC_POLICY,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+
+        self.path = path
+        self.fieldnames = fieldnames
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self.fsync = fsync
+
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_sync = monotonic()
+        self._dirty = False
+        # inode of the file whose header was checked for missing columns
+        self._checked = None
+
+    def append(self, row: dict) -> Future:
+        """
+        Queue one row
+        Returns:
+            future resolved once the row is committed
+        """
+        return self.append_many([row])
+
+    def append_many(self, rows: list[dict]) -> Future:
+        """
+        Queue rows that are committed together
+        Returns:
+            future resolved once the rows are committed
+        """
+        self._start()
+        future = Future()
+        self._queue.put((rows, future))
+        return future
+
+    def close(self) -> None:
+        """
+        Commit everything queued and stop the writer thread
+        """
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="history-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                timeout = FSYNC_INTERVAL if self._dirty else None
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._sync()
+                continue
+            if item is None:
+                break
+
+            group = [item]
+            count = len(item[0])
+            deadline = monotonic() + self.flush_interval
+            stop = False
+            while count < self.flush_rows:
+                timeout = deadline - monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                group.append(item)
+                count += len(item[0])
+
+            try:
+                self._commit([row for rows, _ in group for row in rows])
+            except Exception as e:
+                for _, future in group:
+                    future.set_exception(e)
+            else:
+                for _, future in group:
+                    future.set_result(None)
+
+            if stop:
+                break
+
+        if self._dirty:
+            self._sync()
+
+    def _commit(self, rows: list[dict]) -> None:
+        with open(f"{self.path}.lock", mode="a+b") as lock:
+            _lock(lock)
+            try:
+                self._add_columns()
+                with open(self.path, mode="a+b") as f:
+                    self._write(f, rows)
+            finally:
+                _unlock(lock)
+
+    def _add_columns(self) -> None:
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return
+        if inode == self._checked:
+            return
+
+        with open(self.path, mode="rb") as f:
+            # a header left without its newline is complete, only the lock
+            # holder writes, and the new header written below closes it
+            header = f.readline()
+            if not header.strip():
+                return
+            columns = next(csv.reader([header.decode("utf-8")]))
+            missing = [column for column in self.fieldnames if column not in columns]
+            if missing:
+                buffer = StringIO()
+                csv.writer(buffer).writerow(columns + missing)
+                # renamed into place once complete, readers see the old or new file
+                with open(f"{self.path}.tmp", mode="wb") as new:
+                    new.write(buffer.getvalue().encode("utf-8"))
+                    shutil.copyfileobj(f, new)
+                    new.flush()
+                    os.fsync(new.fileno())
+                os.replace(f"{self.path}.tmp", self.path)
+                logger.info("Added the columns %s to %s", ", ".join(missing), self.path)
+        self._checked = os.stat(self.path).st_ino
+
+    def _write(self, f, rows: list[dict]) -> None:
+        size = f.seek(0, os.SEEK_END)
+        fieldnames = self.fieldnames
+        if size > 0:
+            f.seek(0)
+            fieldnames = next(csv.reader([f.readline().decode("utf-8")]))
+
+        buffer = StringIO()
+        w = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction="ignore")
+        if size == 0:
+            w.writeheader()
+        else:
+            # never continue a line left without its newline
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                buffer.write("\r\n")
+        w.writerows(rows)
+
+        f.write(buffer.getvalue().encode("utf-8"))
+        f.flush()
+
+        if self.fsync == "commit" or (
+            self.fsync == "interval" and monotonic() - self._last_sync >= FSYNC_INTERVAL
+        ):
+            os.fsync(f.fileno())
+            self._last_sync = monotonic()
+            self._dirty = False
+        else:
+            self._dirty = self.fsync == "interval"
+
+    def _sync(self) -> None:
+        with open(self.path, mode="ab") as f:
+            os.fsync(f.fileno())
+        self._last_sync = monotonic()
+        self._dirty = False
@@ -0,0 +1,225 @@
+import cProfile
+import logging
+import os
+import random
+import threading
+from bisect import bisect_left
+from collections import deque
+from collections.abc import Callable
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+# requests slower than this are logged with their stages, and profiled if sampled
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 1000))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "./reports/profiles")
+
+METRIC_NAME = "carbon_footprint_stage_seconds"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUANTILES = (0.5, 0.95, 0.99)
+# recent durations kept per stage for the quantiles
+RESERVOIR_SIZE = 1024
+
+
+class Histogram:
+    """
+    Durations of one stage: cumulative Prometheus buckets over all observations,
+    and quantiles over the most recent RESERVOIR_SIZE of them
+    """
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.counts[bisect_left(BUCKETS, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            self.recent.append(seconds)
+
+    def quantiles(self) -> dict[float, float]:
+        with self._lock:
+            recent = sorted(self.recent)
+        if not recent:
+            return {}
+        return {
+            q: recent[min(int(q * len(recent)), len(recent) - 1)] for q in QUANTILES
+        }
+
+
+# (request, stage) -> durations
+_histograms: dict[tuple[str, str], Histogram] = {}
+_histograms_lock = threading.Lock()
+# only one request is profiled at a time, profilers cannot be nested
+_profile_lock = threading.Lock()
+
+
+def observe(request: str, stage: str, seconds: float) -> None:
+    """
+    Record the duration of a stage of a request
+    """
+    histogram = _histograms.get((request, stage))
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault((request, stage), Histogram())
+    histogram.observe(seconds)
+
+
+class Trace:
+    """
+    Stages of one request. Timed with `span` on the calling thread or `traced`
+    for functions run in an executor, and recorded when the trace exits.
+    """
+
+    def __init__(self, request: str, profile: bool) -> None:
+        self.request = request
+        self.stages: list[tuple[str, float]] = []
+        self.profiler = cProfile.Profile() if profile else None
+        self._start = perf_counter()
+
+    def __enter__(self) -> "Trace":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        total = perf_counter() - self._start
+        observe(self.request, "total", total)
+        if total * 1000 >= SLOW_REQUEST_MS:
+            stages = ", ".join(f"{s}={t * 1000:.1f}ms" for s, t in self.stages)
+            logger.warning("Slow %s: %.1fms (%s)", self.request, total * 1000, stages)
+        if self.profiler is not None:
+            if total * 1000 >= SLOW_REQUEST_MS:
+                self._dump_profile()
+            _profile_lock.release()
+
+    @contextmanager
+    def span(self, stage: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, perf_counter() - start)
+
+    def traced(self, stage: str, func: Callable) -> Callable:
+        """
+        Returns:
+            `func` timed as `stage`, and profiled when the request is sampled
+        """
+
+        def run(*args, **kwargs):
+            start = perf_counter()
+            if self.profiler is not None:
+                self.profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if self.profiler is not None:
+                    self.profiler.disable()
+                self.record(stage, perf_counter() - start)
+
+        return run
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages.append((stage, seconds))
+        observe(self.request, stage, seconds)
+
+    def _dump_profile(self) -> None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        now = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        path = os.path.join(PROFILE_DIR, f"{self.request}-{now}.prof")
+        self.profiler.dump_stats(path)
+        logger.warning("Profile of slow %s saved to %s", self.request, path)
+
+
+class _NullTrace:
+    def __enter__(self) -> "_NullTrace":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def span(self, stage: str):
+        return nullcontext()
+
+    def traced(self, stage: str, func: Callable) -> Callable:
+        return func
+
+    def record(self, stage: str, seconds: float) -> None:
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+def start_trace(request: str) -> Trace | _NullTrace:
+    """
+    Start timing the stages of a request, a no-op when METRICS_ENABLED is off.
+    A PROFILE_SAMPLE_RATE share of the requests also run their executor stages
+    under cProfile, and the profile is saved to PROFILE_DIR when they are slow.
+    """
+    if not METRICS_ENABLED:
+        return NULL_TRACE
+    profile = (
+        PROFILE_SAMPLE_RATE > 0
+        and random.random() < PROFILE_SAMPLE_RATE
+        and _profile_lock.acquire(blocking=False)
+    )
+    return Trace(request, profile)
+
+
+def snapshot() -> dict[tuple[str, str], dict]:
+    """
+    Returns:
+        count, mean and quantiles in seconds per (request, stage)
+    """
+    with _histograms_lock:
+        histograms = dict(_histograms)
+    return {
+        key: {
+            "count": histogram.count,
+            "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+            **{f"p{int(q * 100)}": v for q, v in histogram.quantiles().items()},
+        }
+        for key, histogram in sorted(histograms.items())
+    }
+
+
+def prometheus_text() -> str:
+    """
+    Returns:
+        the stage durations in the Prometheus text exposition format
+    """
+    with _histograms_lock:
+        histograms = sorted(_histograms.items())
+
+    lines = [
+        f"# HELP {METRIC_NAME} Duration of the stages of a request",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    quantile_lines = [
+        f"# HELP {METRIC_NAME}_quantile Recent quantiles of the stage durations",
+        f"# TYPE {METRIC_NAME}_quantile gauge",
+    ]
+    for (request, stage), histogram in histograms:
+        labels = f'request="{request}",stage="{stage}"'
+        with histogram._lock:
+            counts = list(histogram.counts)
+            count, total = histogram.count, histogram.sum
+        cumulative = 0
+        for bound, bucket in zip([*BUCKETS, "+Inf"], counts):
+            cumulative += bucket
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{METRIC_NAME}_sum{{{labels}}} {total}")
+        lines.append(f"{METRIC_NAME}_count{{{labels}}} {count}")
+        for q, value in histogram.quantiles().items():
+            quantile_lines.append(
+                f'{METRIC_NAME}_quantile{{{labels},quantile="{q}"}} {value}'
+            )
+    return "\n".join(lines + quantile_lines) + "\n"
@@ -0,0 +1,252 @@
+import argparse
+import json
+import logging
+import os
+import os.path as os_path
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import plotly.io as pio
+from pandas import DataFrame
+
+from emission_calculator import calculator as ec
+from emission_calculator.factors import current_factors
+from history.backends import HISTORY_BACKEND, get_backend
+from reporting.cache import report_filename, report_key
+from reporting.export_pool import warm_up_kaleido
+from reporting.render import REPORT_HEIGHT, REPORT_WIDTH
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_DIR = "./reports/batch"
+MANIFEST = "manifest.jsonl"
+BUNDLES = ("zip", "pdf")
+# companies rendered per task sent to a worker
+CHUNK_SIZE = 8
+
+# (company name, emissions per category, file name, report key)
+Job = tuple[str, list[float], str, str]
+
+
+def make_jobs(companies: DataFrame) -> list[Job]:
+    # keyed as the app keys its reports, so changing the factors redoes them
+    factors = current_factors().id
+    jobs = []
+    for name, *values in companies[["Name", *ec.CATEGORIES]].itertuples(index=False):
+        values = [float(value) for value in values]
+        key = report_key(name, values, threshold=ec.REPORT_THRESHOLD, factors=factors)
+        jobs.append((name, values, report_filename(name), key))
+    return jobs
+
+
+def read_manifest(output_dir: str) -> dict[str, str]:
+    """
+    Returns:
+        file name -> report key of the reports completed by earlier runs
+    """
+    path = os_path.join(output_dir, MANIFEST)
+    if not os_path.exists(path):
+        return {}
+    done = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            # a line cut short by a crash is ignored, its report is redone
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[entry["file"]] = entry["key"]
+    return done
+
+
+def render_chunk(jobs: list[Job], output_dir: str) -> list[tuple[Job, str | None]]:
+    """
+    Draw and export the PDF of every job, in a worker process
+    Returns:
+        every job with its error, None when its PDF was written
+    """
+    results = []
+    for job in jobs:
+        name, values, filename, _ = job
+        df = DataFrame({"Name": name, "Category": ec.CATEGORIES, "Value": values})
+        try:
+            pdf = pio.to_image(
+                ec.draw_report_figure(df, threshold=ec.REPORT_THRESHOLD),
+                format="pdf",
+                width=REPORT_WIDTH,
+                height=REPORT_HEIGHT,
+                validate=False,
+            )
+            # renamed into place once complete, a crash never leaves half a PDF
+            path = os_path.join(output_dir, filename)
+            with open(f"{path}.tmp", mode="wb") as f:
+                f.write(pdf)
+            os.replace(f"{path}.tmp", path)
+        except Exception as e:
+            results.append((job, f"{type(e).__name__}: {e}"))
+        else:
+            results.append((job, None))
+    return results
+
+
+def _run_chunks(chunks: list[list[Job]], output_dir: str, workers: int):
+    """
+    Yields the results of every chunk as they complete, with at most two chunks
+    per worker queued
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield render_chunk(chunk, output_dir)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=warm_up_kaleido
+    ) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(render_chunk, chunk, output_dir))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def export_reports(
+    companies: DataFrame,
+    output_dir: str = OUTPUT_DIR,
+    workers: int = os.cpu_count() or 1,
+    chunk_size: int = CHUNK_SIZE,
+    bundle: str | None = None,
+) -> dict:
+    """
+    Export the PDF report of every company across `workers` processes, each
+    keeping its own Kaleido browser. Completed reports are recorded in
+    `manifest.jsonl`, so a run started again after a crash only exports the
+    reports that are missing or whose inputs changed. With `bundle`, the
+    reports are also bundled into `reports.zip` or a multi-page `reports.pdf`.
+    Returns:
+        counts of exported, skipped and failed reports, and the bundle path
+    """
+    if bundle is not None and bundle not in BUNDLES:
+        raise ValueError(f"Bundle must be one of {BUNDLES}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = make_jobs(companies)
+    done = read_manifest(output_dir)
+    todo = [
+        job
+        for job in jobs
+        if done.get(job[2]) != job[3]
+        or not os_path.exists(os_path.join(output_dir, job[2]))
+    ]
+    chunks = [todo[i : i + chunk_size] for i in range(0, len(todo), chunk_size)]
+
+    exported, failed = 0, 0
+    start = perf_counter()
+    with open(os_path.join(output_dir, MANIFEST), mode="a", encoding="utf-8") as f:
+        for results in _run_chunks(chunks, output_dir, workers):
+            for (name, _, filename, key), error in results:
+                if error is not None:
+                    failed += 1
+                    logger.warning("Report for %s failed: %s", name, error)
+                    continue
+                exported += 1
+                entry = {"name": name, "file": filename, "key": key}
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    elapsed = perf_counter() - start
+    if exported:
+        logger.info(
+            "Exported %d reports in %.1fs (%.1f reports/s, %d workers)",
+            exported,
+            elapsed,
+            exported / elapsed,
+            workers,
+        )
+
+    bundle_path = None
+    if bundle is not None:
+        files = [
+            os_path.join(output_dir, filename)
+            for _, _, filename, _ in jobs
+            if os_path.exists(os_path.join(output_dir, filename))
+        ]
+        bundle_path = os_path.join(output_dir, f"reports.{bundle}")
+        if bundle == "zip":
+            bundle_zip(files, bundle_path)
+        else:
+            bundle_pdf(files, bundle_path)
+
+    return {
+        "exported": exported,
+        "skipped": len(jobs) - len(todo),
+        "failed": failed,
+        "bundle": bundle_path,
+    }
+
+
+def bundle_zip(files: list[str], path: str) -> None:
+    with zipfile.ZipFile(f"{path}.tmp", mode="w") as archive:
+        for file in files:
+            archive.write(file, arcname=os_path.basename(file))
+    os.replace(f"{path}.tmp", path)
+
+
+def bundle_pdf(files: list[str], path: str) -> None:
+    try:
+        from pypdf import PdfWriter
+    except ImportError as e:
+        raise ImportError(
+            "Bundling the reports into one PDF needs pypdf: pip install pypdf"
+        ) from e
+
+    writer = PdfWriter()
+    for file in files:
+        writer.append(file)
+    with open(f"{path}.tmp", mode="wb") as f:
+        writer.write(f)
+    os.replace(f"{path}.tmp", path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the report of every company in the history"
+    )
+    parser.add_argument(
+        "--history", default="./reports/historic_data.csv", help="history CSV"
+    )
+    parser.add_argument("--backend", default=HISTORY_BACKEND, help="history backend")
+    parser.add_argument("-o", "--output", default=OUTPUT_DIR, help="output directory")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="processes rendering reports",
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--bundle", choices=BUNDLES, help="also bundle the reports")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    # the most recent row of every company, selected in SQL by the SQLite backend
+    companies = get_backend(args.history, args.backend).latest(
+        columns=["Name", *ec.CATEGORIES]
+    )
+    result = export_reports(
+        companies,
+        output_dir=args.output,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        bundle=args.bundle,
+    )
+    print(
+        f"Done! {result['exported']} exported, {result['skipped']} already done, "
+        f"{result['failed']} failed"
+    )
+    if result["bundle"]:
+        print(f"Bundled into {result['bundle']}")
+    if result["failed"]:
+        raise SystemExit(1)
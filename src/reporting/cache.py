@@ -0,0 +1,288 @@
+import hashlib
+import json
+import os
+import os.path as os_path
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+from history.name_index import normalize_name
+from reporting.render import RenderedReport
+
+CACHE_DIR = "./reports/cache"
+MAX_ENTRIES = int(os.environ.get("REPORT_CACHE_ENTRIES", 128))
+MAX_MEMORY_BYTES = int(os.environ.get("REPORT_CACHE_MEMORY_MB", 64)) * 1024 * 1024
+MAX_DISK_BYTES = int(os.environ.get("REPORT_CACHE_DISK_MB", 256)) * 1024 * 1024
+METRIC_PREFIX = "carbon_footprint_report_cache"
+
+
+def report_key(
+    company_name: str,
+    inputs: list[float],
+    threshold: tuple,
+    factors: str | None = None,
+) -> str:
+    """
+    Content hash of the normalized report inputs, the recommendation thresholds
+    and the id of the factor set the inputs are scored with. The name is
+    normalized like in `report_filename`, so case and whitespace are ignored
+    """
+    payload = json.dumps(
+        {
+            "name": normalize_name(company_name),
+            "inputs": [float(value) for value in inputs],
+            "threshold": [float(value) for value in threshold],
+            "factors": factors,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def report_filename(company_name: str) -> str:
+    """
+    A PDF name unique to the company: a readable part of the name and a hash
+    of the whole normalized name, so truncated names never collide
+    """
+    key = normalize_name(company_name)
+    slug = re.sub(r"[^a-z0-9]+", "_", key).strip("_")[:40] or "company"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+    return f"{slug}-{digest}_report.pdf"
+
+
+class _Entry:
+    def __init__(
+        self, figure: dict, png: bytes | None, row: dict, pdf_name: str
+    ) -> None:
+        self.figure = figure
+        self.png = png
+        self.row = row
+        self.pdf_name = pdf_name
+        self.size = len(png or b"") + len(json.dumps(figure))
+
+
+class ReportCache:
+    """
+    Two level LRU cache of rendered reports.
+
+    Recent entries are kept in memory, bounded by `max_entries` and `max_memory_bytes`.
+    Every entry is also written to its own directory under `cache_dir`, next to the
+    PDF once it has been exported, and the least recently used directories are
+    removed once they take more than `max_disk_bytes`.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = CACHE_DIR,
+        max_entries: int = MAX_ENTRIES,
+        max_memory_bytes: int = MAX_MEMORY_BYTES,
+        max_disk_bytes: int = MAX_DISK_BYTES,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, _Entry] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        self._scan_disk()
+
+    def pdf_path(self, key: str, company_name: str) -> str:
+        return os_path.join(self.cache_dir, key, report_filename(company_name))
+
+    def get(self, key: str) -> tuple[RenderedReport, dict] | None:
+        """
+        Returns:
+            the cached report and history row, or None on a miss
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = self._read_disk(key)
+                if entry is None:
+                    self.misses += 1
+                    return None
+                self.disk_hits += 1
+                self._remember(key, entry)
+            self._touch_disk(key)
+
+        pdf_path = os_path.join(self.cache_dir, key, entry.pdf_name)
+        report = RenderedReport(
+            figure=entry.figure,
+            pdf_path=pdf_path,
+            png=entry.png,
+            pdf_ready=os_path.exists(pdf_path),
+        )
+        return report, entry.row
+
+    def put(self, key: str, report: RenderedReport, row: dict) -> None:
+        entry = _Entry(
+            figure=report.figure,
+            png=report.png,
+            row=row,
+            pdf_name=os_path.basename(report.pdf_path),
+        )
+        with self._lock:
+            self._remember(key, entry)
+            self._write_disk(key, entry)
+
+    def track_pdf(self, pdf_path: str) -> None:
+        """
+        Account for a PDF exported into an entry directory after `put`
+        """
+        key = os_path.basename(os_path.dirname(pdf_path))
+        with self._lock:
+            if key not in self._disk:
+                return
+            self._disk_bytes -= self._disk[key]
+            self._disk[key] = _dir_size(os_path.join(self.cache_dir, key))
+            self._disk_bytes += self._disk[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def prometheus_text(self) -> str:
+        """
+        Returns:
+            the lookup and eviction counters and the cache sizes in the
+            Prometheus text exposition format
+        """
+        stats = self.stats()
+        lines = [
+            f"# HELP {METRIC_PREFIX}_lookups_total Report cache lookups by result",
+            f"# TYPE {METRIC_PREFIX}_lookups_total counter",
+            f'{METRIC_PREFIX}_lookups_total{{result="hit"}} {stats["hits"]}',
+            f'{METRIC_PREFIX}_lookups_total{{result="disk_hit"}} {stats["disk_hits"]}',
+            f'{METRIC_PREFIX}_lookups_total{{result="miss"}} {stats["misses"]}',
+            f"# HELP {METRIC_PREFIX}_evictions_total Entries evicted from memory or disk",
+            f"# TYPE {METRIC_PREFIX}_evictions_total counter",
+            f"{METRIC_PREFIX}_evictions_total {stats['evictions']}",
+        ]
+        for name, unit in (("entries", "Cached entries"), ("bytes", "Cached bytes")):
+            lines += [
+                f"# HELP {METRIC_PREFIX}_{name} {unit} by level",
+                f"# TYPE {METRIC_PREFIX}_{name} gauge",
+            ]
+            for level in ("memory", "disk"):
+                value = stats[f"{level}_{name}"]
+                lines.append(f'{METRIC_PREFIX}_{name}{{level="{level}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def _remember(self, key: str, entry: _Entry) -> None:
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old.size
+        self._memory[key] = entry
+        self._memory_bytes += entry.size
+
+        while self._memory and (
+            len(self._memory) > self.max_entries
+            or self._memory_bytes > self.max_memory_bytes
+        ):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.size
+            self.evictions += 1
+
+    def _read_disk(self, key: str) -> _Entry | None:
+        entry_dir = os_path.join(self.cache_dir, key)
+        try:
+            with open(os_path.join(entry_dir, "entry.json")) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # reports shown as interactive plots have no PNG
+        png = None
+        if os_path.exists(os_path.join(entry_dir, "report.png")):
+            with open(os_path.join(entry_dir, "report.png"), mode="rb") as f:
+                png = f.read()
+        return _Entry(
+            figure=data["figure"], png=png, row=data["row"], pdf_name=data["pdf_name"]
+        )
+
+    def _write_disk(self, key: str, entry: _Entry) -> None:
+        entry_dir = os_path.join(self.cache_dir, key)
+        os.makedirs(entry_dir, exist_ok=True)
+        if entry.png is not None:
+            with open(os_path.join(entry_dir, "report.png"), mode="wb") as f:
+                f.write(entry.png)
+        with open(os_path.join(entry_dir, "entry.json"), mode="w") as f:
+            json.dump(
+                {"figure": entry.figure, "row": entry.row, "pdf_name": entry.pdf_name},
+                f,
+            )
+
+        self._disk_bytes -= self._disk.pop(key, 0)
+        self._disk[key] = _dir_size(entry_dir)
+        self._disk_bytes += self._disk[key]
+
+        while len(self._disk) > 1 and self._disk_bytes > self.max_disk_bytes:
+            evicted, size = self._disk.popitem(last=False)
+            shutil.rmtree(os_path.join(self.cache_dir, evicted), ignore_errors=True)
+            self._disk_bytes -= size
+            self.evictions += 1
+            # a memory hit would point at the PDF directory just removed
+            dropped = self._memory.pop(evicted, None)
+            if dropped is not None:
+                self._memory_bytes -= dropped.size
+
+    def _touch_disk(self, key: str) -> None:
+        if key in self._disk:
+            self._disk.move_to_end(key)
+            # keep the on disk order for the next start
+            try:
+                os.utime(os_path.join(self.cache_dir, key))
+            except OSError:
+                pass
+
+    def _scan_disk(self) -> None:
+        if not os_path.isdir(self.cache_dir):
+            return
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = os_path.join(self.cache_dir, key)
+            if os_path.isdir(entry_dir):
+                entries.append((os_path.getmtime(entry_dir), key, _dir_size(entry_dir)))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os_path.getsize(os_path.join(path, name))
+        for name in os.listdir(path)
+        if os_path.isfile(os_path.join(path, name))
+    )
+
+
+_cache: ReportCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ReportCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ReportCache()
+    return _cache
@@ -0,0 +1,247 @@
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# pool settings, overridable from the environment
+POOL_SIZE = int(os.environ.get("EXPORT_POOL_SIZE", min(2, os.cpu_count() or 1)))
+MAX_PENDING = int(os.environ.get("EXPORT_MAX_PENDING", 16))
+JOB_TIMEOUT = float(os.environ.get("EXPORT_JOB_TIMEOUT", 30.0))
+# longest wait for an export, queued or running, before the caller gives up
+WAIT_TIMEOUT = float(os.environ.get("EXPORT_WAIT_TIMEOUT", 60.0))
+STARTUP_TIMEOUT = 60.0
+
+
+class ExportBusyError(RuntimeError):
+    """Raised when the export queue is full"""
+
+
+class ExportTimeoutError(TimeoutError):
+    """Raised when an export did not finish within the job or wait timeout"""
+
+
+class ExportFailedError(RuntimeError):
+    """Raised when the exporter process failed to export the figure"""
+
+
+def warm_up_kaleido() -> None:
+    """
+    Keep one warm Kaleido browser for every export made in this process
+    """
+    import warnings
+
+    import kaleido
+    import plotly.io as pio
+
+    # plotly passes per-call browser options that a shared server ignores
+    warnings.filterwarnings("ignore", message="The kopts argument is ignored")
+    blank = {"data": [], "layout": {}}
+
+    # warm up, the first export pays the browser and plotly.js startup cost.
+    # This fails fast when no browser is available, so only then keep one
+    # persistent browser for every export made in this process.
+    try:
+        pio.to_image(blank, format="png", width=10, height=10)
+        if hasattr(kaleido, "start_sync_server"):
+            kaleido.start_sync_server(silence_warnings=True)
+            pio.to_image(blank, format="png", width=10, height=10)
+    except Exception as e:
+        logger.warning("Exporter %d warm up failed: %s", os.getpid(), e)
+
+
+def _worker_main(conn) -> None:
+    """
+    Exporter process: keeps one warm Kaleido browser and serves export jobs
+    """
+    import plotly.io as pio
+
+    warm_up_kaleido()
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        figure, format, width, height = job
+        try:
+            image = pio.to_image(
+                figure, format=format, width=width, height=height, validate=False
+            )
+            conn.send(("ok", image))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Exporter:
+    def __init__(self, ctx) -> None:
+        self._ctx = ctx
+        self.process = None
+        self.conn = None
+
+    def start(self) -> None:
+        self.conn, child_conn = self._ctx.Pipe()
+        self.process = self._ctx.Process(
+            target=_worker_main, args=(child_conn,), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        if not self.conn.poll(STARTUP_TIMEOUT):
+            self.stop()
+            raise ExportTimeoutError("Exporter did not start in time")
+        self.conn.recv()
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        self.process = None
+
+    def restart(self) -> None:
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+            self.conn.close()
+            self.process = None
+        self.start()
+
+
+class ExportPool:
+    """
+    A fixed number of pre-warmed exporter processes fed from one bounded job queue.
+
+    `submit` fails fast with `ExportBusyError` once `max_pending` jobs are waiting,
+    and an exporter that does not answer within `timeout` seconds is killed and
+    replaced, failing only the job it was working on. `export` waits at most
+    `wait_timeout` seconds in all, queued jobs included.
+    """
+
+    def __init__(
+        self,
+        size: int = POOL_SIZE,
+        max_pending: int = MAX_PENDING,
+        timeout: float = JOB_TIMEOUT,
+        wait_timeout: float = WAIT_TIMEOUT,
+    ) -> None:
+        if size < 1:
+            raise ValueError("Export pool needs at least one exporter")
+
+        self.size = size
+        self.timeout = timeout
+        self.wait_timeout = wait_timeout
+        self._jobs: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._ctx = mp.get_context("spawn")
+        self._threads = [
+            threading.Thread(target=self._dispatch, name=f"exporter-{i}", daemon=True)
+            for i in range(size)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, figure: dict, format: str, width: int, height: int) -> Future:
+        future = Future()
+        try:
+            self._jobs.put_nowait((figure, format, width, height, future))
+        except queue.Full:
+            raise ExportBusyError("Too many reports are being exported, try again")
+        return future
+
+    def export(self, figure: dict, format: str, width: int, height: int) -> bytes:
+        """
+        Submit a serialized figure and wait for the exported bytes, at most
+        `wait_timeout` seconds
+        """
+        future = self.submit(figure, format, width, height)
+        try:
+            return future.result(timeout=self.wait_timeout)
+        except FutureTimeoutError:
+            # a job still queued is skipped, a running one finishes unread
+            future.cancel()
+            raise ExportTimeoutError(
+                f"Export did not finish within {self.wait_timeout}s, try again"
+            )
+
+    def shutdown(self) -> None:
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _dispatch(self) -> None:
+        exporter = _Exporter(self._ctx)
+        try:
+            exporter.start()
+        except Exception as e:
+            logger.warning("Exporter failed to start: %s", e)
+
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+
+            figure, format, width, height, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                if exporter.process is None:
+                    exporter.start()
+                exporter.conn.send((figure, format, width, height))
+                if not exporter.conn.poll(self.timeout):
+                    future.set_exception(
+                        ExportTimeoutError(
+                            f"Export did not finish within {self.timeout}s"
+                        )
+                    )
+                    exporter.restart()
+                    continue
+                status, payload = exporter.conn.recv()
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(ExportFailedError(str(e)))
+                try:
+                    exporter.restart()
+                except Exception as e:
+                    logger.warning("Exporter failed to restart: %s", e)
+                continue
+
+            if status == "ok":
+                future.set_result(payload)
+            else:
+                future.set_exception(ExportFailedError(payload))
+
+        exporter.stop()
+
+
+_pool: ExportPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ExportPool | None:
+    """
+    The shared export pool, started on first use.
+    Returns None when EXPORT_POOL_SIZE is 0 and exports run in-process.
+    """
+    global _pool
+    if POOL_SIZE < 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ExportPool()
+    return _pool
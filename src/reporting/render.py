@@ -0,0 +1,108 @@
+import json
+import os
+import os.path as os_path
+import threading
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+import plotly.io as pio
+
+from reporting.export_pool import ExportFailedError, get_pool
+
+if TYPE_CHECKING:
+    from plotly.graph_objects import Figure
+
+REPORT_WIDTH = 1400
+REPORT_HEIGHT = 800
+
+
+@dataclass
+class RenderedReport:
+    """
+    A report figure serialized once, plus the artifacts exported from it.
+    The PNG and the PDF are exported by `export_png` and `export_pdf`.
+    """
+
+    figure: dict
+    pdf_path: str
+    png: bytes | None = None
+    pdf_ready: bool = False
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+def _export(figure: dict, format: str) -> bytes:
+    pool = get_pool()
+    if pool is not None:
+        return pool.export(figure, format, REPORT_WIDTH, REPORT_HEIGHT)
+
+    # the figure was serialized by plotly itself, no need to validate it again
+    try:
+        return pio.to_image(
+            figure,
+            format=format,
+            width=REPORT_WIDTH,
+            height=REPORT_HEIGHT,
+            validate=False,
+        )
+    except Exception as e:
+        # as the pool reports a failed export, e.g. Kaleido without Chrome
+        raise ExportFailedError(f"{type(e).__name__}: {e}") from e
+
+
+def render_report(fig: "Figure", pdf_path: str, png: bool = True) -> RenderedReport:
+    """
+    Serialize the figure once and, unless `png` is False, export the inline PNG
+    """
+    start = perf_counter()
+    figure = json.loads(pio.to_json(fig, validate=False))
+    report = RenderedReport(figure=figure, pdf_path=pdf_path)
+    report.timings["serialize"] = perf_counter() - start
+
+    if png:
+        export_png(report)
+    return report
+
+
+def export_png(report: RenderedReport) -> bytes:
+    """
+    Export the PNG from the already serialized figure, at most once per report
+    """
+    if report.png is None:
+        start = perf_counter()
+        report.png = _export(report.figure, format="png")
+        report.timings["png"] = perf_counter() - start
+    return report.png
+
+
+def export_pdf(report: RenderedReport) -> str:
+    """
+    Export the PDF from the already serialized figure, at most once per report
+    """
+    if report.pdf_ready and os_path.exists(report.pdf_path):
+        return report.pdf_path
+
+    start = perf_counter()
+    pdf = _export(report.figure, format="pdf")
+    # the cache may have evicted the directory of a report still shown
+    os.makedirs(os_path.dirname(report.pdf_path), exist_ok=True)
+    # renamed into place once complete, a failed write never leaves half a PDF
+    # for the cache to serve, and concurrent exports of a report do not mix
+    temp_path = f"{report.pdf_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, mode="wb") as f:
+            f.write(pdf)
+        os.replace(temp_path, report.pdf_path)
+    except BaseException:
+        if os_path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    report.pdf_ready = True
+    report.timings["pdf"] = perf_counter() - start
+    return report.pdf_path
+
+
+def format_timings(report: RenderedReport) -> str:
+    return ", ".join(
+        f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in report.timings.items()
+    )
@@ -0,0 +1,193 @@
+import json
+import os
+from collections.abc import AsyncIterator, Iterable
+
+import numpy as np
+from fastapi import APIRouter, Request
+from fastapi.responses import Response, StreamingResponse
+
+import emission_calculator.calculator as ec
+from emission_calculator.factors import FactorSet, current_factors, get_factors
+from emission_calculator.validation import validate_records
+from instrumentation import start_trace
+
+# most companies answered in one JSON response, larger batches are streamed
+API_MAX_BATCH = int(os.environ.get("API_MAX_BATCH", 10_000))
+# companies scored per NDJSON chunk
+STREAM_CHUNK = 1_000
+NDJSON = "application/x-ndjson"
+
+# emissions in the responses, as named in the requests' snake case
+RESULT_KEYS = ["energy_usage", "waste_generated", "business_travel"]
+FACTOR_SET_HEADER = "X-Factor-Set"
+
+
+def score_records(records: list, factors: FactorSet) -> list[dict]:
+    """
+    Validate and score companies given as JSON objects in one vectorized pass,
+    without building a DataFrame or drawing anything
+    Returns:
+        per company, in order, its emissions or the error that rejected it
+    """
+    objects = [record if isinstance(record, dict) else {} for record in records]
+    names, values, errors = validate_records(objects)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        emissions = ec.emission_values(
+            **{column: values[column] for column in ec.INPUT_COLUMNS},
+            factors=factors,
+        )
+    emissions = np.column_stack(emissions)
+    footprints = emissions.sum(axis=1)
+
+    results = []
+    for record, name, error, row, footprint in zip(
+        records, names, errors, emissions.tolist(), footprints.tolist()
+    ):
+        if not isinstance(record, dict):
+            results.append({"error": "Each company must be a JSON object!"})
+        elif error:
+            results.append({"company_name": name, "error": error})
+        else:
+            result = {"company_name": name, **dict(zip(RESULT_KEYS, row))}
+            result["carbon_footprint"] = footprint
+            results.append(result)
+    return results
+
+
+def dumps(value: object) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def json_response(
+    value: object, factors: FactorSet, status_code: int = 200
+) -> Response:
+    return Response(
+        dumps(value),
+        status_code=status_code,
+        media_type="application/json",
+        headers={FACTOR_SET_HEADER: factors.id},
+    )
+
+
+def error_response(message: str, status_code: int) -> Response:
+    return Response(
+        dumps({"error": message}),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+def scored_lines(records: list, factors: FactorSet) -> bytes:
+    """
+    Returns:
+        the results of `records` as NDJSON, one line per company
+    """
+    with start_trace("score_api_stream") as trace, trace.span("score"):
+        results = score_records(records, factors)
+    return "".join(f"{dumps(result)}\n" for result in results).encode("utf-8")
+
+
+def ndjson_response(lines: Iterable[bytes], factors: FactorSet) -> StreamingResponse:
+    return StreamingResponse(
+        lines, media_type=NDJSON, headers={FACTOR_SET_HEADER: factors.id}
+    )
+
+
+async def read_ndjson(request: Request) -> AsyncIterator[list]:
+    """
+    Yields the companies of an NDJSON body, STREAM_CHUNK at a time, as they are
+    received. A line that is not valid JSON is yielded as None, so it is
+    rejected in its place.
+    """
+    buffer = b""
+    chunk = []
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                chunk.append(_parse_line(line))
+            if len(chunk) >= STREAM_CHUNK:
+                yield chunk
+                chunk = []
+    if buffer.strip():
+        chunk.append(_parse_line(buffer))
+    if chunk:
+        yield chunk
+
+
+def _parse_line(line: bytes) -> object:
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def create_scoring_api() -> APIRouter:
+    """
+    JSON scoring endpoint, served next to the Gradio app without its queue.
+    POST /api/score takes one company as a JSON object, a JSON list of them, or
+    an NDJSON body of one company per line, with the fields of the bulk upload.
+    Emissions are computed with the current factor set, or the `factors` query
+    parameter, named in the X-Factor-Set response header. Nothing is rendered
+    and nothing is added to the history.
+    - an object is answered with its emissions, or a 422 with its error
+    - a list is answered with one result per company, in order, invalid ones
+      with their error; with `stream=true` as NDJSON, written in chunks
+    - an NDJSON body is answered with NDJSON, scored in chunks while it is
+      still being received
+    """
+    router = APIRouter()
+
+    # the query is read from the request, FastAPI's parameter parsing would
+    # cost more than scoring one company
+    @router.post("/api/score")
+    async def score(request: Request) -> Response:
+        factors = request.query_params.get("factors")
+        stream = request.query_params.get("stream", "").lower() in ("1", "true")
+        try:
+            factor_set = get_factors(factors) if factors else current_factors()
+        except KeyError as e:
+            return error_response(e.args[0], 400)
+
+        if request.headers.get("content-type", "").startswith(NDJSON):
+            # scored while it is received, answered once it was read: Starlette
+            # reads the request for a disconnect while streaming a response
+            lines = [
+                scored_lines(chunk, factor_set) async for chunk in read_ndjson(request)
+            ]
+            return ndjson_response(lines, factor_set)
+
+        with start_trace("score_api") as trace:
+            with trace.span("parse"):
+                try:
+                    payload = json.loads(await request.body())
+                except ValueError as e:
+                    return error_response(f"Invalid JSON: {e}", 400)
+
+            if isinstance(payload, dict):
+                with trace.span("score"):
+                    (result,) = score_records([payload], factor_set)
+                status_code = 422 if "error" in result else 200
+                return json_response(result, factor_set, status_code)
+
+            if not isinstance(payload, list):
+                return error_response("Send a company or a list of companies", 400)
+            if stream:
+                # each chunk is scored as the previous one is written
+                lines = (
+                    scored_lines(payload[start : start + STREAM_CHUNK], factor_set)
+                    for start in range(0, len(payload), STREAM_CHUNK)
+                )
+                return ndjson_response(lines, factor_set)
+            if len(payload) > API_MAX_BATCH:
+                return error_response(
+                    f"At most {API_MAX_BATCH} companies per request, "
+                    f"stream larger batches with stream=true or as {NDJSON}",
+                    413,
+                )
+            with trace.span("score"):
+                results = score_records(payload, factor_set)
+            return json_response(results, factor_set)
+
+    return router
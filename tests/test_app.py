@@ -0,0 +1,28 @@
+import os.path as os_path
+
+from pandas import DataFrame
+
+from benchmarks.suite import sample_inputs
+from emission_calculator import calculator as ec
+from emission_calculator.factors import current_factors
+from reporting.cache import ReportCache
+
+
+def test_bulk_report_round_trips_through_the_disk_cache(tmp_path):
+    # the app imports Gradio, only these tests need it
+    import app
+
+    path = tmp_path / "bulk_upload.csv"
+    DataFrame([sample_inputs()]).to_csv(path, index=False)
+    # integer columns are read as numpy int64, as from any uploaded file
+    inputs = app.read_upload(str(path)).iloc[0]
+    cache_dir = str(tmp_path / "cache")
+
+    report = app.bulk_report(inputs, current_factors(), ReportCache(cache_dir))
+    key = os_path.basename(os_path.dirname(report.pdf_path))
+
+    cached = ReportCache(cache_dir).get(key)
+    assert cached is not None
+    row = cached[1]
+    for column in ec.INPUT_COLUMNS:
+        assert row[column] == float(inputs[column])
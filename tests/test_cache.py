@@ -0,0 +1,87 @@
+import os.path as os_path
+
+from reporting.cache import ReportCache, report_filename, report_key
+from reporting.render import RenderedReport
+
+
+def make_report(cache: ReportCache, key: str, size: int = 1000) -> RenderedReport:
+    return RenderedReport(
+        figure={"data": []},
+        pdf_path=cache.pdf_path(key, "Acme Corp"),
+        png=b"x" * size,
+    )
+
+
+def test_put_then_get_from_memory_and_disk(tmp_path):
+    cache = ReportCache(str(tmp_path))
+    cache.put("a", make_report(cache, "a"), {"Name": "Acme Corp"})
+
+    report, row = cache.get("a")
+    assert report.png == b"x" * 1000
+    assert row == {"Name": "Acme Corp"}
+
+    # a new cache, as after a restart, reads the entry back from disk
+    report, row = ReportCache(str(tmp_path)).get("a")
+    assert report.png == b"x" * 1000
+    assert row == {"Name": "Acme Corp"}
+
+
+def test_disk_eviction_drops_the_memory_entry(tmp_path):
+    cache = ReportCache(str(tmp_path), max_disk_bytes=1500)
+    cache.put("a", make_report(cache, "a"), {})
+    cache.put("b", make_report(cache, "b"), {})
+
+    assert not os_path.exists(tmp_path / "a")
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    assert cache.stats()["memory_entries"] == 1
+
+
+def test_memory_eviction_keeps_the_disk_entry(tmp_path):
+    cache = ReportCache(str(tmp_path), max_entries=1)
+    cache.put("a", make_report(cache, "a"), {})
+    cache.put("b", make_report(cache, "b"), {})
+
+    assert cache.stats()["memory_entries"] == 1
+    assert cache.get("a") is not None
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_prometheus_text_counts_lookups_and_evictions(tmp_path):
+    cache = ReportCache(str(tmp_path), max_entries=1)
+    cache.put("a", make_report(cache, "a"), {})
+    cache.put("b", make_report(cache, "b"), {})
+    cache.get("a")
+    cache.get("a")
+    cache.get("missing")
+
+    lines = cache.prometheus_text().splitlines()
+    assert 'carbon_footprint_report_cache_lookups_total{result="hit"} 1' in lines
+    assert 'carbon_footprint_report_cache_lookups_total{result="disk_hit"} 1' in lines
+    assert 'carbon_footprint_report_cache_lookups_total{result="miss"} 1' in lines
+    assert "carbon_footprint_report_cache_evictions_total 2" in lines
+    assert 'carbon_footprint_report_cache_entries{level="memory"} 1' in lines
+    assert 'carbon_footprint_report_cache_entries{level="disk"} 2' in lines
+
+
+def test_report_key_normalizes_the_name_like_report_filename():
+    inputs, threshold = [1.0, 2.0], (0.5,)
+    assert report_key("Acme Corp", inputs, threshold) == report_key(
+        "  acme   CORP ", inputs, threshold
+    )
+    assert report_key("Acme Corp", inputs, threshold) != report_key(
+        "Acme Co", inputs, threshold
+    )
+
+
+def test_report_filename_matches_names_ignoring_case_and_spaces():
+    assert report_filename("Acme Corp") == report_filename("  acme   CORP ")
+
+
+def test_report_filename_does_not_collide_on_truncated_names():
+    prefix = "A" * 60
+    first = report_filename(f"{prefix} One")
+    second = report_filename(f"{prefix} Two")
+    assert first != second
+    assert first.endswith("_report.pdf")
+    assert report_filename("???") != report_filename("!!!")
@@ -0,0 +1,39 @@
+from dataclasses import replace
+
+import pytest
+from pandas import DataFrame
+
+from emission_calculator.factors import current_factors
+from reporting import batch_export
+from reporting.export_pool import ExportPool, ExportTimeoutError
+
+
+def test_export_gives_up_on_a_backed_up_queue(monkeypatch):
+    # no exporter ever picks the job up
+    monkeypatch.setattr(ExportPool, "_dispatch", lambda self: None)
+    pool = ExportPool(size=1, wait_timeout=0.1)
+
+    with pytest.raises(ExportTimeoutError):
+        pool.export({}, "png", 10, 10)
+    # the job left in the queue is skipped once an exporter gets to it
+    *_, future = pool._jobs.get_nowait()
+    assert future.cancelled()
+
+
+def test_batch_report_keys_change_with_the_factor_set(monkeypatch):
+    companies = DataFrame(
+        {
+            "Name": ["Acme"],
+            "Energy Usage": [1.0],
+            "Waste Generated": [2.0],
+            "Business Travel": [3.0],
+        }
+    )
+    (before,) = batch_export.make_jobs(companies)
+    monkeypatch.setattr(
+        batch_export, "current_factors", lambda: replace(current_factors(), version=99)
+    )
+    (after,) = batch_export.make_jobs(companies)
+
+    assert before[2] == after[2]
+    assert before[3] != after[3]
@@ -0,0 +1,67 @@
+import shutil
+
+import pytest
+
+from history.name_index import normalize_name
+
+parquet_backend = pytest.importorskip("history.parquet_backend")
+
+LEGACY_CSV = (
+    "Name,Energy Usage,Waste Generated,Business Travel\n"
+    "Adidas,27934.2,0,0\n"
+    "Nike,10,0,0\n"
+)
+
+
+def row(name: str, value: float) -> dict:
+    return {
+        "Name": name,
+        "Energy Usage": value,
+        "Waste Generated": 0.0,
+        "Business Travel": 0.0,
+    }
+
+
+@pytest.fixture
+def backend(tmp_path):
+    csv_path = tmp_path / "history.csv"
+    csv_path.write_text(LEGACY_CSV)
+    backend = parquet_backend.open_parquet_backend(
+        str(tmp_path / "parquet"), csv_path=str(csv_path)
+    )
+    yield backend
+    backend.close()
+
+
+def test_imports_the_csv_history_when_created(backend):
+    assert backend.read()["Name"].tolist() == ["Adidas", "Nike"]
+
+
+def test_appended_rows_follow_the_imported_ones_after_compaction(backend):
+    backend.append([row("Adidas", 2.0)])
+    backend.append([row("adidas ", 3.0)])
+    assert backend.compact()
+    backend.append([row("Adidas", 4.0)])
+
+    assert backend.lookup("ADIDAS")["Energy Usage"].tolist() == [27934.2, 2, 3, 4]
+    assert backend.read()["Energy Usage"].tolist() == [27934.2, 10, 2, 3, 4]
+    assert backend.rollup().latest[normalize_name("Adidas")][0] == 4.0
+
+
+def test_parts_left_by_a_crashed_compaction_are_not_read_twice(backend, tmp_path):
+    backend.append([row("Adidas", 2.0)])
+    backend.append([row("Adidas", 3.0)])
+    saved = tmp_path / "saved"
+    shutil.copytree(backend.directory, saved)
+    backend.compact()
+    # as if the process died after renaming the compacted file into place
+    for part in saved.glob("*-part-*.parquet"):
+        shutil.copy(part, backend.directory)
+
+    assert backend.read()["Energy Usage"].tolist() == [27934.2, 10, 2, 3]
+    reopened = parquet_backend.ParquetHistoryBackend(backend.directory)
+    try:
+        assert reopened.read()["Energy Usage"].tolist() == [27934.2, 10, 2, 3]
+        assert len(list((tmp_path / "parquet").glob("*-part-*"))) == 0
+    finally:
+        reopened.close()
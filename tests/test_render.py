@@ -0,0 +1,46 @@
+import pytest
+
+from reporting import render
+from reporting.export_pool import ExportFailedError
+
+
+@pytest.fixture
+def inline(monkeypatch):
+    # exports run in this process, as with EXPORT_POOL_SIZE=0
+    monkeypatch.setattr(render, "get_pool", lambda: None)
+
+
+def test_inline_export_errors_are_export_failures(inline, monkeypatch):
+    def to_image(*args, **kwargs):
+        raise RuntimeError("Kaleido requires Google Chrome to be installed.")
+
+    monkeypatch.setattr(render.pio, "to_image", to_image)
+    report = render.RenderedReport(figure={}, pdf_path="unused.pdf")
+
+    with pytest.raises(ExportFailedError, match="Google Chrome"):
+        render.export_png(report)
+
+
+def test_export_pdf_renames_the_complete_file(inline, monkeypatch, tmp_path):
+    monkeypatch.setattr(render.pio, "to_image", lambda *args, **kwargs: b"%PDF")
+    # the cache directory may have been evicted meanwhile
+    report = render.RenderedReport(figure={}, pdf_path=str(tmp_path / "a" / "r.pdf"))
+
+    assert render.export_pdf(report) == report.pdf_path
+    assert report.pdf_ready
+    assert [path.name for path in (tmp_path / "a").iterdir()] == ["r.pdf"]
+
+
+def test_failed_pdf_write_leaves_no_pdf(inline, monkeypatch, tmp_path):
+    monkeypatch.setattr(render.pio, "to_image", lambda *args, **kwargs: b"%PDF")
+
+    def replace(source, target):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(render.os, "replace", replace)
+    report = render.RenderedReport(figure={}, pdf_path=str(tmp_path / "r.pdf"))
+
+    with pytest.raises(OSError):
+        render.export_pdf(report)
+    assert not report.pdf_ready
+    assert list(tmp_path.iterdir()) == []
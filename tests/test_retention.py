@@ -0,0 +1,99 @@
+from datetime import datetime, timezone
+
+from pandas import read_csv
+
+from history.archive import HistoryArchive
+from history.backends import CsvHistoryBackend
+from history.retention import RetentionPolicy, archive_path, compact
+
+HEADER = "Name,Energy Usage,Waste Generated,Business Travel,Submitted At\n"
+NOW = datetime(2026, 5, 15, tzinfo=timezone.utc)
+
+
+def write_history(path, rows: list[tuple[str, float, str]]) -> None:
+    path.write_text(
+        HEADER
+        + "".join(
+            f"{name},{value},0,0,{submitted}\n" for name, value, submitted in rows
+        )
+    )
+
+
+def test_compact_keeps_the_latest_row_of_every_company(tmp_path):
+    path = tmp_path / "history.csv"
+    write_history(
+        path,
+        [
+            ("Acme", 1, "2026-03-01T00:00:00+00:00"),
+            ("Beta", 2, "2026-03-02T00:00:00+00:00"),
+            ("acme ", 3, "2026-04-01T00:00:00+00:00"),
+            ("Acme", 4, "2026-05-01T00:00:00+00:00"),
+        ],
+    )
+    archive = HistoryArchive(archive_path(str(path)))
+
+    result = compact(str(path), archive, RetentionPolicy(keep_latest=1), now=NOW)
+
+    assert (result.kept, result.archived, result.segments) == (2, 2, 2)
+    assert read_csv(path)["Energy Usage"].tolist() == [2, 4]
+    assert archive.partitions() == ["2026-03", "2026-04"]
+    assert archive.rows("ACME")["Energy Usage"].tolist() == [1, 3]
+
+
+def test_lookup_reads_the_archived_rows_in_order(tmp_path):
+    path = tmp_path / "history.csv"
+    write_history(
+        path,
+        [
+            ("Acme", 1, "2026-03-01T00:00:00+00:00"),
+            ("Acme", 2, "2026-04-01T00:00:00+00:00"),
+            ("Acme", 3, "2026-05-01T00:00:00+00:00"),
+        ],
+    )
+    backend = CsvHistoryBackend(str(path), RetentionPolicy(keep_latest=1))
+
+    backend.compact()
+
+    assert backend.read()["Energy Usage"].tolist() == [3]
+    assert backend.lookup("acme")["Energy Usage"].tolist() == [1, 2, 3]
+
+
+def test_drop_repeats_only_drops_archived_rows(tmp_path):
+    path = tmp_path / "history.csv"
+    write_history(
+        path,
+        [
+            ("Acme", 1, "2026-03-01T00:00:00+00:00"),
+            ("Acme", 1, "2026-03-02T00:00:00+00:00"),
+            ("Acme", 1, "2026-03-03T00:00:00+00:00"),
+        ],
+    )
+    archive = HistoryArchive(archive_path(str(path)))
+    policy = RetentionPolicy(keep_latest=1, drop_repeats=True)
+
+    result = compact(str(path), archive, policy, now=NOW)
+
+    assert (result.kept, result.archived, result.dropped) == (1, 1, 1)
+
+
+def test_expire_keeps_the_last_calendar_months(tmp_path):
+    path = tmp_path / "history.csv"
+    write_history(
+        path,
+        [
+            ("Acme", 0, ""),
+            ("Acme", 1, "2026-03-31T00:00:00+00:00"),
+            ("Acme", 2, "2026-04-01T00:00:00+00:00"),
+            ("Acme", 3, "2026-05-01T00:00:00+00:00"),
+        ],
+    )
+    archive = HistoryArchive(archive_path(str(path)))
+    compact(str(path), archive, RetentionPolicy(keep_latest=1), now=NOW)
+    assert archive.partitions() == ["undated", "2026-03", "2026-04"]
+
+    # April and May, the month of NOW
+    assert archive.expire(months=2, now=NOW) == ["2026-03"]
+    assert archive.partitions() == ["undated", "2026-04"]
+
+    assert archive.expire(months=1, now=NOW) == ["2026-04"]
+    assert archive.partitions() == ["undated"]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from pandas import DataFrame
+
+from history.name_index import normalize_name
+from history.rollups import METRICS, HistoryRollup
+
+
+def history(waste: np.ndarray) -> DataFrame:
+    return DataFrame(
+        {
+            "Name": [f"Company {i}" for i in range(len(waste))],
+            "Energy Usage": np.full(len(waste), 100.0),
+            "Waste Generated": waste,
+            "Business Travel": np.full(len(waste), 50.0),
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "waste",
+    [
+        np.linspace(-1000, -10, 1001),
+        np.linspace(-500, 1500, 1001),
+        np.concatenate([np.full(600, -20.0), np.full(401, 0.0)]),
+    ],
+    ids=["negative", "around_zero", "zeros"],
+)
+def test_percentiles_of_negative_values(waste):
+    rollup = HistoryRollup()
+    # in chunks, as the rows are appended
+    for chunk in np.array_split(waste, 7):
+        rollup.update(history(chunk))
+
+    waste_percentiles = rollup.percentiles([10, 50, 90])[
+        METRICS.index("Waste Generated")
+    ]
+    expected = np.percentile(waste, [10, 50, 90])
+    assert waste_percentiles == pytest.approx(expected, rel=0.015, abs=1e-3)
+    assert rollup.summary()["Waste Generated"]["median"] == pytest.approx(
+        np.median(waste), rel=0.015, abs=1e-3
+    )
+
+
+def test_latest_is_keyed_by_normalized_name():
+    rollup = HistoryRollup()
+    df = history(np.array([1.0, 2.0, 3.0]))
+    df["Name"] = ["BMW", "Acme", "bmw "]
+    rollup.update(df)
+
+    assert rollup.summary()["companies"] == 2
+    assert rollup.latest[normalize_name("BMW")][1] == 3.0
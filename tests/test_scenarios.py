@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from benchmarks.suite import sample_inputs
+from emission_calculator import calculator as ec
+from emission_calculator import scenarios
+
+BASE = {column: sample_inputs()[column] for column in ec.INPUT_COLUMNS}
+
+
+def footprint(**changes: float) -> float:
+    df = ec.make_dataframe(company_name="Acme", **{**BASE, **changes})
+    return float(df["Value"].sum())
+
+
+@pytest.mark.parametrize(
+    "deltas",
+    [
+        scenarios.sample_deltas(
+            {column: (-0.2, 0.2) for column in ec.INPUT_COLUMNS}, 200_000, seed=1
+        ),
+        scenarios.grid_deltas(
+            {column: np.linspace(-0.2, 0.2, 5) for column in ec.INPUT_COLUMNS}
+        ),
+    ],
+    ids=["monte_carlo", "grid"],
+)
+def test_sensitivity_is_the_change_of_one_input_by_one_percent(deltas):
+    emissions = scenarios.evaluate_scenarios(BASE, deltas)
+    table = scenarios.sensitivity_table(BASE, deltas, emissions).set_index("Input")
+
+    baseline = footprint()
+    for column, label in scenarios.INPUT_LABELS.items():
+        expected = footprint(**{column: BASE[column] * 1.01}) - baseline
+        assert table.loc[label, "kgCO2 per +1%"] == pytest.approx(expected)
+    assert table["Variance Share (%)"].sum() == pytest.approx(100)
+    assert table.index[0] == "Transport Cost"
@@ -0,0 +1,63 @@
+import pytest
+
+from history.backends import CsvHistoryBackend
+from history.sqlite_backend import SqliteHistoryBackend
+from history.store import FOOTPRINT
+
+ROWS = [
+    ("BMW", 1.0, 2.0, 3.0),
+    ("Acme", 10.0, -5.0, 1.0),
+    ("bmw ", 4.0, 0.0, 1.0),
+    ("Beta", 7.0, 1.0, 0.0),
+]
+
+
+def rows() -> list[dict]:
+    return [
+        {
+            "Name": name,
+            "Energy Usage": energy,
+            "Waste Generated": waste,
+            "Business Travel": travel,
+        }
+        for name, energy, waste, travel in ROWS
+    ]
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path):
+    backend = SqliteHistoryBackend(str(tmp_path / "history.sqlite"))
+    backend.append(rows())
+    return backend
+
+
+def test_latest_keeps_the_last_row_of_every_normalized_name(sqlite_backend):
+    latest = sqlite_backend.latest(columns=["Name", "Energy Usage", FOOTPRINT])
+    assert latest["Name"].tolist() == ["Acme", "bmw ", "Beta"]
+    assert latest["Energy Usage"].tolist() == [10.0, 4.0, 7.0]
+    assert latest[FOOTPRINT].tolist() == [6.0, 5.0, 8.0]
+
+
+def test_totals_are_aggregated_in_sql(sqlite_backend):
+    totals = sqlite_backend.totals()
+    assert (totals["count"], totals["companies"]) == (4, 3)
+    assert totals["Waste Generated"] == {
+        "total": -2.0,
+        "mean": -0.5,
+        "min": -5.0,
+        "max": 2.0,
+    }
+    assert totals[FOOTPRINT]["total"] == 25.0
+
+
+def test_summary_matches_the_csv_backend(sqlite_backend, tmp_path):
+    csv_backend = CsvHistoryBackend(str(tmp_path / "history.csv"))
+    csv_backend.append(rows())
+
+    assert csv_backend.latest()["Name"].tolist() == ["Acme", "bmw ", "Beta"]
+    summary, expected = sqlite_backend.summary(), csv_backend.summary()
+    for key, value in expected.items():
+        if isinstance(value, dict):
+            assert summary[key] == pytest.approx(value)
+        else:
+            assert summary[key] == value
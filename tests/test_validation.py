@@ -0,0 +1,34 @@
+import gradio as gr
+import pytest
+
+from benchmarks.suite import sample_inputs
+from emission_calculator import calculator as ec
+
+
+def validate(**changes) -> None:
+    # the app imports Gradio, only these tests need it
+    import app
+
+    inputs = {**sample_inputs(), **changes}
+    app.validate_input(
+        inputs["company_name"], *[inputs[column] for column in ec.INPUT_COLUMNS]
+    )
+
+
+def test_valid_inputs_pass():
+    validate()
+
+
+@pytest.mark.parametrize(
+    "changes, message",
+    [
+        ({"company_name": "  "}, "Company name cannot be empty"),
+        ({"avg_gas_bill": 0}, "Gas Bill must be a positive number"),
+        ({"avg_electric_bill": "abc"}, "Electricity Bill must be a valid number"),
+        ({"fuel_efficiency": 20}, "Fuel efficiency is very high"),
+        ({"recycled_waste_percent": 120}, "must be between 1 and 100"),
+    ],
+)
+def test_invalid_inputs_raise_the_bulk_upload_errors(changes, message):
+    with pytest.raises(gr.Error, match=message):
+        validate(**changes)
@@ -0,0 +1,55 @@
+from history.writer import HistoryWriter
+
+
+def append(path, fieldnames, rows) -> None:
+    writer = HistoryWriter(str(path), fieldnames=fieldnames, fsync="never")
+    try:
+        writer.append_many(rows).result()
+    finally:
+        writer.close()
+
+
+def test_writes_the_header_of_a_new_file(tmp_path):
+    path = tmp_path / "history.csv"
+    append(path, ["Name", "Value"], [{"Name": "Acme", "Value": 1}])
+    assert path.read_bytes() == b"Name,Value\r\nAcme,1\r\n"
+
+
+def test_adds_new_columns_to_the_header(tmp_path):
+    path = tmp_path / "history.csv"
+    path.write_text("Name,Value\nOld,1\n")
+
+    append(
+        path, ["Name", "Value", "Inputs"], [{"Name": "New", "Value": 2, "Inputs": 3}]
+    )
+
+    assert path.read_text().splitlines() == ["Name,Value,Inputs", "Old,1", "New,2,3"]
+
+
+def test_migrates_a_header_without_its_newline(tmp_path):
+    path = tmp_path / "history.csv"
+    path.write_text("Name,Value")
+
+    append(
+        path, ["Name", "Value", "Inputs"], [{"Name": "New", "Value": 2, "Inputs": 3}]
+    )
+
+    assert path.read_text().splitlines() == ["Name,Value,Inputs", "New,2,3"]
+
+
+def test_closes_a_header_without_its_newline(tmp_path):
+    path = tmp_path / "history.csv"
+    path.write_text("Name,Value")
+
+    append(path, ["Name", "Value"], [{"Name": "New", "Value": 2}])
+
+    assert path.read_text().splitlines() == ["Name,Value", "New,2"]
+
+
+def test_closes_a_torn_row(tmp_path):
+    path = tmp_path / "history.csv"
+    path.write_text("Name,Value\nTorn,")
+
+    append(path, ["Name", "Value"], [{"Name": "Acme", "Value": 1}])
+
+    assert path.read_text().splitlines() == ["Name,Value", "Torn,", "Acme,1"]